@@ -340,7 +340,7 @@ _lazy_import('async', [
 _lazy_import('thread', [
     'MainThreadCallable', 'ThreadPoolCallable', 'ThreadCallable', 'threaded',
     'synchronized', 'MAINTHREAD', 'ThreadInProgress', 'ThreadPool',
-    'register_thread_pool', 'get_thread_pool'
+    'ThreadPoolMetrics', 'register_thread_pool', 'get_thread_pool'
 ])
 
 # Timer classes and decorators
@@ -353,6 +353,7 @@ _lazy_import('timer', [
 # IO/Socket handling
 _lazy_import('io', ['IOMonitor', 'WeakIOMonitor', 'IO_READ', 'IO_WRITE', 'IOChannel'])
 _lazy_import('sockets', ['Socket'])
+_lazy_import('framing', ['LengthPrefixCodec', 'NetstringCodec', 'DelimiterCodec'])
 
 # Event and event handler classes
 _lazy_import('event', ['Event', 'EventHandler', 'WeakEventHandler'])
@@ -369,6 +370,12 @@ _lazy_import('generator', ['Generator', 'generator'])
 # process management
 _lazy_import('process', ['Process'])
 
+# process pools and decorator
+_lazy_import('processpool', [
+    'ProcessPool', 'ProcessPoolCallable', 'ProcessInProgress', 'processed',
+    'register_process_pool', 'get_process_pool'
+])
+
 # special gobject thread support
 _lazy_import('gobject', ['GOBJECT', 'gobject_set_threaded'])
 
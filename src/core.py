@@ -431,7 +431,11 @@ class Signal(object):
         :type changed_cb: callable
         """
         super(Signal, self).__init__()
-        self._callbacks = []
+        # Connected callbacks.  This is a tuple that is replaced (rather than
+        # modified) on connect and disconnect, so emit() can iterate over it
+        # without copying, even if callbacks connect or disconnect while the
+        # signal is being emitted.
+        self._callbacks = ()
         self.changed_cb = changed_cb
         self._deferred_args = []
 
@@ -464,7 +468,7 @@ class Signal(object):
         Because this value is a tuple, it cannot be manipulated directly.  Use
         :meth:`~kaa.Signal.connect` and :meth:`~kaa.Signal.disconnect` instead.
         """
-        return tuple(self._callbacks)
+        return self._callbacks
 
 
     def __iter__(self):
@@ -516,11 +520,18 @@ class Signal(object):
             callback = Callable(callback, *args, **kwargs)
 
         callback._signal_once = once
+        # If the Callable has no bound arguments, emit() can invoke the
+        # underlying function directly and avoid the overhead of
+        # Callable.__call__ and argument merging.
+        if type(callback) is Callable and not callback._args and not callback._kwargs:
+            callback._signal_func = callback._func
+        else:
+            callback._signal_func = None
 
         if pos == -1:
             pos = len(self._callbacks)
 
-        self._callbacks.insert(pos, callback)
+        self._callbacks = self._callbacks[:pos] + (callback,) + self._callbacks[pos:]
         self._changed(Signal.CONNECTED)
 
         if self._deferred_args:
@@ -604,14 +615,14 @@ class Signal(object):
     def _disconnect(self, callback, args, kwargs):
         assert(callable(callback))
         new_callbacks = []
-        for cb in self._callbacks[:]:
+        for cb in self._callbacks:
             if cb == callback and (len(args) == len(kwargs) == 0 or (args, kwargs) == cb._get_init_args()):
                 # This matches what we want to disconnect.
                 continue
             new_callbacks.append(cb)
 
         if len(new_callbacks) != len(self._callbacks):
-            self._callbacks = new_callbacks
+            self._callbacks = tuple(new_callbacks)
             self._changed(Signal.DISCONNECTED)
             return True
 
@@ -652,7 +663,7 @@ class Signal(object):
         Disconnects all callbacks from the signal.
         """
         count = self.count()
-        self._callbacks = []
+        self._callbacks = ()
         if self._changed_cb and count > 0:
             self._changed_cb(self, Signal.DISCONNECTED)
 
@@ -663,16 +674,22 @@ class Signal(object):
 
         :return: False if any of the callbacks returned False, and True otherwise.
         """
-        if len(self._callbacks) == 0:
+        callbacks = self._callbacks
+        if not callbacks:
             return True
 
         retval = True
-        for cb in self._callbacks[:]:
+        for cb in callbacks:
             if cb._signal_once:
                 self.disconnect(cb)
 
             try:
-                if cb(*args, **kwargs) == False:
+                func = cb._signal_func
+                if func is None or cb._ignore_caller_args:
+                    # Bound arguments or other special handling needed, so go
+                    # through the Callable.
+                    func = cb
+                if func(*args, **kwargs) == False:
                     retval = False
             except CallableError:
                 if self._disconnect(cb, (), {}) != False:
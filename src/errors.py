@@ -34,7 +34,7 @@ import traceback
 
 __all__ = [
     'make_exception_class', 'CallableError', 'AsyncExceptionBase', 'AsyncException',
-    'TimeoutException', 'InProgressAborted', 'SocketError'
+    'TimeoutException', 'InProgressAborted', 'SocketError', 'QueueFullError'
 ]
 
 def make_exception_class(name, bases, dict):
@@ -135,3 +135,12 @@ class TimeoutException(InProgressAborted):
 
 class SocketError(Exception):
     pass
+
+
+class QueueFullError(Exception):
+    """
+    Raised (or thrown into the job) when a job is enqueued to a
+    :class:`~kaa.ThreadPool` whose queue has reached its
+    :attr:`~kaa.ThreadPool.max_queue` limit.
+    """
+    pass
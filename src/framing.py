@@ -0,0 +1,207 @@
+# -*- coding: iso-8859-1 -*-
+# -----------------------------------------------------------------------------
+# framing.py - Framing codecs for IOChannels
+# -----------------------------------------------------------------------------
+# kaa.base - The Kaa Application Framework
+# Copyright 2005-2012 Dirk Meyer, Jason Tackaberry, et al.
+#
+# Please see the file AUTHORS for a complete list of authors.
+#
+# This library is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License version
+# 2.1 as published by the Free Software Foundation.
+#
+# This library is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301 USA
+#
+# -----------------------------------------------------------------------------
+
+"""
+Framing codecs split the byte stream of an :class:`~kaa.IOChannel` into
+messages (frames).  A codec is assigned to the channel's
+:attr:`~kaa.IOChannel.framing` property, after which frames are received with
+:meth:`~kaa.IOChannel.read_frame` or the *frame* signal and sent with
+:meth:`~kaa.IOChannel.write_frame`.
+"""
+from __future__ import absolute_import
+
+__all__ = [ 'FrameCodec', 'LengthPrefixCodec', 'NetstringCodec', 'DelimiterCodec' ]
+
+# python imports
+import struct
+
+# kaa imports
+from .strutils import py3_b, bl
+
+
+class FrameCodec(object):
+    """
+    Base class for framing codecs.
+
+    Subclasses implement :meth:`decode` and :meth:`encode`.  Codecs must not
+    keep per-stream state, so a single codec object may be shared between
+    channels.
+    """
+    #: Number of bytes preceding the previously scanned part of the buffer
+    #: which need to be scanned again (see :meth:`decode`).
+    overlap = 0
+
+    def decode(self, buf, start, scanned):
+        """
+        Decodes the first frame from the buffer.
+
+        :param buf: the buffer holding received data
+        :type buf: bytearray
+        :param start: offset in *buf* at which the frame begins
+        :param scanned: offset up to which *buf* was already examined by a
+                        previous call which returned None; codecs searching
+                        for a terminator can resume their search from here
+                        (less :attr:`overlap` bytes).
+        :returns: None if *buf* does not yet hold a complete frame, or a
+                  tuple (frame, end), where *end* is the offset following
+                  the frame's data in *buf*.
+
+        ValueError is raised if the data is not valid for this framing.
+        """
+        raise NotImplementedError
+
+
+    def encode(self, payload, *args):
+        """
+        Returns the list of strings which make up the frame for the given
+        payload.
+
+        The payload itself is one of the strings, so that it needn't be
+        copied to be sent.
+        """
+        raise NotImplementedError
+
+
+
+class LengthPrefixCodec(FrameCodec):
+    """
+    Frames consisting of a fixed-size header, containing the length of the
+    payload, followed by the payload.
+    """
+    def __init__(self, header='!I', length_field=0, max_length=None):
+        """
+        :param header: :mod:`struct` format of the header
+        :type header: str
+        :param length_field: index of the field holding the payload length
+                             within *header*
+        :type length_field: int
+        :param max_length: the maximum payload length, or None for no limit.
+                           Longer frames are rejected with ValueError
+                           before they are buffered.
+        :type max_length: int
+
+        If *header* holds only the length, frames are the payload strings.
+        Otherwise frames are tuples (fields, payload), where *fields* is the
+        tuple of unpacked header fields, and :meth:`encode` takes the header
+        fields other than the length as additional arguments.  For example,
+        ``LengthPrefixCodec('I4sI', 2)`` would decode a header with two fields
+        followed by the payload length.
+        """
+        self._struct = struct.Struct(header)
+        self._length_field = length_field
+        self._nfields = len(self._struct.unpack(bl('\x00') * self._struct.size))
+        self.max_length = max_length
+
+
+    def decode(self, buf, start, scanned):
+        header_end = start + self._struct.size
+        if len(buf) < header_end:
+            return None
+        fields = self._struct.unpack_from(buf, start)
+        length = fields[self._length_field]
+        if self.max_length is not None and length > self.max_length:
+            raise ValueError('Frame length %d exceeds maximum of %d' % (length, self.max_length))
+        end = header_end + length
+        if len(buf) < end:
+            return None
+        payload = memoryview(buf)[header_end:end].tobytes()
+        return (payload if self._nfields == 1 else (fields, payload)), end
+
+
+    def encode(self, payload, *fields):
+        fields = list(fields)
+        fields.insert(self._length_field, len(payload))
+        return [self._struct.pack(*fields), payload]
+
+
+
+class NetstringCodec(FrameCodec):
+    """
+    Netstring frames (``<length>:<payload>,``) as described at
+    http://cr.yp.to/proto/netstrings.txt
+    """
+    def __init__(self, max_length=None):
+        """
+        :param max_length: the maximum payload length, or None for no limit.
+        :type max_length: int
+        """
+        self.max_length = max_length
+
+
+    def decode(self, buf, start, scanned):
+        colon = buf.find(bl(':'), start, start + 21)
+        if colon < 0:
+            if len(buf) - start > 20:
+                raise ValueError('Invalid netstring length')
+            return None
+        digits = bytes(buf[start:colon])
+        if not digits.isdigit():
+            raise ValueError('Invalid netstring length %r' % digits)
+        length = int(digits)
+        if self.max_length is not None and length > self.max_length:
+            raise ValueError('Frame length %d exceeds maximum of %d' % (length, self.max_length))
+        end = colon + 1 + length
+        if len(buf) <= end:
+            return None
+        if buf[end:end + 1] != bl(','):
+            raise ValueError('Netstring not terminated by comma')
+        return memoryview(buf)[colon + 1:end].tobytes(), end + 1
+
+
+    def encode(self, payload):
+        return [py3_b('%d:' % len(payload)), payload, bl(',')]
+
+
+
+class DelimiterCodec(FrameCodec):
+    """
+    Frames terminated by a delimiter, such as lines.
+
+    Unlike :meth:`~kaa.IOChannel.readline`, the delimiter is not included in
+    the frames.
+    """
+    def __init__(self, delimiter='\n', max_length=None):
+        """
+        :param delimiter: the string terminating each frame
+        :type delimiter: str
+        :param max_length: the maximum frame length, or None for no limit.
+        :type max_length: int
+        """
+        self.delimiter = py3_b(delimiter)
+        self.overlap = len(self.delimiter) - 1
+        self.max_length = max_length
+
+
+    def decode(self, buf, start, scanned):
+        idx = buf.find(self.delimiter, max(start, scanned - self.overlap))
+        if idx < 0:
+            if self.max_length is not None and len(buf) - start > self.max_length:
+                raise ValueError('Frame exceeds maximum length of %d' % self.max_length)
+            return None
+        return memoryview(buf)[start:idx].tobytes(), idx + len(self.delimiter)
+
+
+    def encode(self, payload):
+        return [payload, self.delimiter]
@@ -28,15 +28,17 @@ __all__ = [ 'IO_READ', 'IO_WRITE', 'IO_EXCEPT', 'IOMonitor', 'WeakIOMonitor', 'I
 
 import sys
 import os
+import errno
+import stat
+import select
 import socket
 import logging
 import time
 import fcntl
 import re
-try:
-    from io import BytesIO
-except ImportError:
-    from cStringIO import StringIO as BytesIO
+import ctypes, ctypes.util
+from collections import deque
+from itertools import islice
 
 from .utils import property
 from .strutils import BYTES_TYPE, UNICODE_TYPE, py3_b, bl
@@ -54,6 +56,475 @@ IO_READ   = 1
 IO_WRITE  = 2
 IO_EXCEPT = 3
 
+# Maximum number of buffers written with a single writev() call.  This is
+# IOV_MAX on Linux; the kernel rejects larger vectors.
+IOV_MAX = 1024
+
+# Lower bound of the adaptive read size (see IOChannel.read_batch).
+MIN_READ_SIZE = 4096
+
+# Flags for splice()
+SPLICE_F_MOVE = 1
+SPLICE_F_NONBLOCK = 2
+
+try:
+    _libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+except OSError:
+    _libc = None
+
+def _libc_func(name, restype, *argtypes):
+    """
+    Returns a function which calls the given libc function and raises OSError
+    if it fails, or None if the function is not available.
+    """
+    func = getattr(_libc, name, None)
+    if not func:
+        return None
+    func.argtypes = argtypes
+    func.restype = restype
+
+    def call(*args):
+        result = func(*args)
+        if result < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        return result
+    return call
+
+
+if hasattr(os, 'writev'):
+    def _sys_writev(fd, buffers):
+        return os.writev(fd, [memoryview(data)[offset:] if offset else data for data, offset in buffers])
+else:
+    # Python 2 doesn't provide writev(), so call it via ctypes.
+    class _iovec(ctypes.Structure):
+        _fields_ = [('iov_base', ctypes.c_void_p), ('iov_len', ctypes.c_size_t)]
+
+    _libc_writev = _libc_func('writev', ctypes.c_ssize_t, ctypes.c_int, ctypes.POINTER(_iovec), ctypes.c_int)
+
+    def _sys_writev(fd, buffers):
+        iov = (_iovec * len(buffers))()
+        for i, (data, offset) in enumerate(buffers):
+            # c_char_p refers to the string's internal buffer rather than
+            # a copy.  data is kept alive by the write queue.
+            iov[i].iov_base = ctypes.cast(ctypes.c_char_p(data), ctypes.c_void_p).value + offset
+            iov[i].iov_len = len(data) - offset
+        return _libc_writev(fd, iov, len(buffers))
+
+    if not _libc_writev:
+        _sys_writev = None
+
+
+if hasattr(os, 'readv'):
+    def _sys_readinto(fd, buf, offset, size):
+        return os.readv(fd, [memoryview(buf)[offset:offset + size]])
+else:
+    _libc_read = _libc_func('read', ctypes.c_ssize_t, ctypes.c_int, ctypes.c_void_p, ctypes.c_size_t)
+
+    def _sys_readinto(fd, buf, offset, size):
+        target = (ctypes.c_char * len(buf)).from_buffer(buf)
+        return _libc_read(fd, ctypes.addressof(target) + offset, size)
+
+    if not _libc_read:
+        _sys_readinto = None
+
+
+if hasattr(os, 'sendfile'):
+    _sys_sendfile = os.sendfile
+else:
+    _libc_sendfile = _libc_func('sendfile64', ctypes.c_ssize_t, ctypes.c_int, ctypes.c_int,
+                                ctypes.POINTER(ctypes.c_int64), ctypes.c_size_t)
+
+    def _sys_sendfile(out_fd, in_fd, offset, count):
+        return _libc_sendfile(out_fd, in_fd, ctypes.byref(ctypes.c_int64(offset)), count)
+
+    if not _libc_sendfile:
+        _sys_sendfile = None
+
+
+if hasattr(os, 'splice'):
+    def _sys_splice(src, dst, count):
+        return os.splice(src, dst, count, flags=SPLICE_F_MOVE | SPLICE_F_NONBLOCK)
+else:
+    _libc_splice = _libc_func('splice', ctypes.c_ssize_t, ctypes.c_int, ctypes.c_void_p, ctypes.c_int,
+                              ctypes.c_void_p, ctypes.c_size_t, ctypes.c_uint)
+
+    def _sys_splice(src, dst, count):
+        return _libc_splice(src, None, dst, None, count, SPLICE_F_MOVE | SPLICE_F_NONBLOCK)
+
+    if not _libc_splice:
+        _sys_splice = None
+
+
+class _WriteQueue(deque):
+    """
+    Queue of data waiting to be written to an IOChannel.
+
+    Entries are lists [data, inprogress, offset], where offset is the number
+    of bytes of data already written.  Partial writes advance the offset
+    rather than slicing the data, so the remainder is never copied.  The
+    number of bytes still to be written is kept in the used attribute.
+    """
+    def __init__(self):
+        super(_WriteQueue, self).__init__()
+        self.used = 0
+
+    def append(self, entry):
+        super(_WriteQueue, self).append(entry)
+        self.used += len(entry[0]) - entry[2]
+
+    def popleft(self):
+        entry = super(_WriteQueue, self).popleft()
+        self.used -= len(entry[0]) - entry[2]
+        return entry
+
+    def remove(self, entry):
+        super(_WriteQueue, self).remove(entry)
+        self.used -= len(entry[0]) - entry[2]
+
+    def clear(self):
+        super(_WriteQueue, self).clear()
+        self.used = 0
+
+    def advance(self, sent):
+        """
+        Accounts for sent bytes from the head of the queue, and returns a list
+        of (inprogress, nbytes) for entries that were completely written,
+        where nbytes is the number of bytes of the entry written last.
+        """
+        done = []
+        while sent > 0 and self:
+            entry = self[0]
+            left = len(entry[0]) - entry[2]
+            if sent < left:
+                entry[2] += sent
+                self.used -= sent
+                break
+            self.popleft()
+            done.append((entry[1], left))
+            sent -= left
+        return done
+
+
+
+class _FileTransfer(object):
+    """
+    Write queue entry which sends data from a file descriptor to the channel
+    (see IOChannel.sendfile()).
+
+    Regular files are sent with sendfile() and pipes with splice(), so the
+    data never needs to be copied into userspace.  If the kernel can't do
+    this for the given descriptors, the data is read in chunks and written
+    with IOChannel._write() instead.  Its length is 0, so that it does not
+    count toward the write queue's used bytes.
+    """
+    def __init__(self, fd, offset, count, source=None):
+        self.fd = fd
+        self.offset = offset
+        # Number of bytes left to send, or None to send until end of file.
+        self.remaining = count
+        # True if fd is a pipe, socket or some other non-seekable file.
+        self.stream = not stat.S_ISREG(os.fstat(fd).st_mode)
+        # The IOChannel fd belongs to, if any, which is closed once all data
+        # is sent.
+        self.source = source
+        # Number of bytes sent so far.
+        self.sent = 0
+        # False once the kernel has refused to copy the data for us.
+        self.zerocopy = True
+        # Data read from fd but not yet written, when not using the kernel.
+        self.pending = None
+        self.pending_offset = 0
+        # IOMonitor used to wait for fd to become readable.
+        self.monitor = None
+
+
+    def __len__(self):
+        return 0
+
+
+    def __repr__(self):
+        return '<_FileTransfer fd=%d sent=%d remaining=%s>' % (self.fd, self.sent, self.remaining)
+
+
+    def send(self, channel):
+        """
+        Sends as much data as possible to the channel.  Returns True when the
+        transfer is complete, False if the channel is not writable, or None if
+        fd is a stream with no data currently available.
+        """
+        try:
+            while True:
+                if self.pending:
+                    data, offset = self.pending, self.pending_offset
+                    sent = channel._write(memoryview(data)[offset:] if offset else data)
+                    self.sent += sent
+                    if offset + sent < len(data):
+                        self.pending_offset += sent
+                        return False
+                    self.pending = None
+                    self.pending_offset = 0
+
+                if self.remaining == 0:
+                    return True
+                size = channel._chunk_size
+                if self.remaining is not None:
+                    size = min(size, self.remaining)
+
+                if self.zerocopy and self.stream and channel._splice:
+                    sent = channel._splice(self.fd, size)
+                elif self.zerocopy and not self.stream and channel._sendfile:
+                    sent = channel._sendfile(self.fd, self.offset, size)
+                else:
+                    if self.stream:
+                        if not select.select([self.fd], [], [], 0)[0]:
+                            return None
+                    else:
+                        os.lseek(self.fd, self.offset, os.SEEK_SET)
+                    data = os.read(self.fd, size)
+                    sent = len(data)
+                    if data:
+                        self.pending = data
+                        self.offset += sent
+                        if self.remaining is not None:
+                            self.remaining -= sent
+                        continue
+
+                if sent == 0:
+                    # End of file.
+                    self.remaining = 0
+                    if self.source:
+                        self.source.close(immediate=True)
+                    return True
+                self.sent += sent
+                self.offset += sent
+                if self.remaining is not None:
+                    self.remaining -= sent
+                if not self.stream and sent < size:
+                    # The channel couldn't take all the data.
+                    return False
+
+        except (OSError, IOError, socket.error), e:
+            if e.args[0] == errno.EAGAIN:
+                if self.stream and not select.select([self.fd], [], [], 0)[0]:
+                    # splice() failed because the pipe is empty, rather than
+                    # because the channel is full.
+                    return None
+                return False
+            if self.zerocopy and e.args[0] in (errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP):
+                # The kernel can't transfer between these descriptors.
+                log.debug('Falling back to userspace copy for %r: %s', self, e)
+                self.zerocopy = False
+                return self.send(channel)
+            raise
+
+
+    def wait(self, callback, *args):
+        """
+        Invokes callback once fd is readable.
+        """
+        def readable():
+            self.cancel()
+            callback(*args)
+        self.monitor = IOMonitor(readable)
+        self.monitor.register(self.fd, IO_READ)
+
+
+    def cancel(self):
+        if self.monitor:
+            self.monitor.unregister()
+            self.monitor = None
+
+
+
+class _BufferPool(object):
+    """
+    Pool of bytearrays which IOChannels read into when reuse_buffers is
+    enabled.
+
+    A buffer is only reused if no memoryview of it is still alive, so a
+    consumer holding on to the data it was passed never sees it overwritten.
+    Reads only happen in the main thread, so the pool is shared by all
+    channels.
+    """
+    def __init__(self, maxbuffers=4):
+        # Maximum number of free buffers kept for each buffer size.
+        self.maxbuffers = maxbuffers
+        # Dict of buffer size -> list of free buffers.
+        self._free = {}
+
+
+    def get(self, size):
+        """
+        Returns a buffer of the given size.
+        """
+        free = self._free.get(size)
+        if free:
+            return free.pop()
+        # Leave room to grow by one byte without reallocating, for put().
+        buf = bytearray(size + 1)
+        del buf[-1]
+        return buf
+
+
+    def put(self, buf):
+        """
+        Returns a buffer obtained from get() to the pool.
+        """
+        try:
+            # A bytearray can't be resized while memoryviews of it exist.
+            buf.append(0)
+        except BufferError:
+            return
+        del buf[-1]
+        free = self._free.setdefault(len(buf), [])
+        if len(free) < self.maxbuffers:
+            free.append(buf)
+
+_buffer_pool = _BufferPool()
+
+
+
+class _ReadQueue(object):
+    """
+    Buffer of data read from an IOChannel but not yet consumed by read() or
+    readline().
+
+    Data is appended to a bytearray, and consumed lines advance a start
+    offset rather than rewriting the remainder of the buffer.  The consumed
+    head is discarded only once it makes up most of the buffer, so popping
+    many lines from a large buffer costs time linear in its size.  The buffer
+    also remembers how far it has been scanned for the delimiter, so each
+    appended chunk is only scanned once.
+    """
+    # Consumed bytes at the head of the buffer are only discarded once there
+    # are at least this many.
+    COMPACT_THRESHOLD = 64 * 1024
+
+    def __init__(self):
+        self.clear()
+
+
+    def __len__(self):
+        return len(self._buf) - self._start
+
+
+    def clear(self):
+        self._buf = bytearray()
+        # Offset of the first unconsumed byte.
+        self._start = 0
+        # Offset up to which the buffer was searched for a delimiter.
+        self._scanned = 0
+
+
+    def write(self, data):
+        """
+        Appends data to the queue.
+        """
+        self._buf += data
+
+
+    def read(self):
+        """
+        Removes and returns all data in the queue.
+        """
+        if self._start:
+            data = bytes(self._buf[self._start:])
+        else:
+            data = bytes(self._buf)
+        self.clear()
+        return data
+
+
+    def pop_line(self, find_delim, overlap=0):
+        """
+        Removes and returns data up to and including the first delimiter, or
+        returns None if there is no delimiter in the queue.
+
+        :param find_delim: callable taking (buffer, start) and returning the
+                           offset following the first delimiter found at or
+                           after start, or None.
+        :param overlap: number of bytes preceding the previously scanned
+                        data to scan again, so delimiters spanning chunks are
+                        found.  This should be the delimiter length minus one.
+        """
+        idx = find_delim(self._buf, max(self._start, self._scanned - overlap))
+        if idx is None:
+            self._scanned = len(self._buf)
+            return None
+
+        line = memoryview(self._buf)[self._start:idx].tobytes()
+        self._consume(idx)
+        return line
+
+
+    def pop_lines(self, find_delim, overlap=0):
+        """
+        Removes and returns a list of all delimited lines in the queue.  See
+        pop_line() for the arguments.
+        """
+        buf, start = self._buf, self._start
+        ends = []
+        idx = find_delim(buf, max(start, self._scanned - overlap))
+        while idx is not None:
+            ends.append(idx - start)
+            idx = find_delim(buf, idx)
+        if not ends:
+            self._scanned = len(buf)
+            return ends
+
+        # Copy all lines out of the buffer at once, and split them from there.
+        data = memoryview(buf)[start:start + ends[-1]].tobytes()
+        lines, last = [], 0
+        for end in ends:
+            lines.append(data[last:end])
+            last = end
+        self._consume(start + last)
+        return lines
+
+
+    def pop_frame(self, codec):
+        """
+        Removes and returns the first frame in the queue as decoded by the
+        given :class:`~kaa.framing.FrameCodec`, or returns None if the queue
+        does not hold a complete frame.
+        """
+        result = codec.decode(self._buf, self._start, self._scanned)
+        if result is None:
+            self._scanned = len(self._buf)
+            return None
+        self._consume(result[1])
+        return result[0]
+
+
+    def pop_frames(self, codec):
+        """
+        Removes and returns a list of all complete frames in the queue.
+        """
+        buf, decode = self._buf, codec.decode
+        frames = []
+        start = self._start
+        result = decode(buf, start, self._scanned)
+        while result is not None:
+            frames.append(result[0])
+            start = result[1]
+            result = decode(buf, start, start)
+        if frames:
+            self._consume(start)
+        else:
+            self._scanned = len(buf)
+        return frames
+
+
+    def _consume(self, idx):
+        # Marks data up to idx as consumed.
+        self._start = self._scanned = idx
+        if self._start >= self.COMPACT_THRESHOLD and self._start * 2 >= len(self._buf):
+            del self._buf[:self._start]
+            self._scanned -= self._start
+            self._start = 0
+
+
 class IOMonitor(notifier.NotifierCallback):
     def __init__(self, callback, *args, **kwargs):
         """
@@ -213,6 +684,19 @@ class IOChannel(Object):
             Refer to :meth:`~kaa.IOChannel.readline` for more details.
             ''',
 
+        'frame':
+            '''
+            Emitted for each frame read from the channel when a codec is set
+            in the :attr:`~kaa.IOChannel.framing` property.
+
+            .. describe:: def callback(frame, ...)
+
+               :param frame: frame decoded by the framing codec
+
+            It is not allowed to have a callback connected to the *frame* signal
+            and simultaneously use the :meth:`~kaa.IOChannel.read_frame` method.
+            ''',
+
         'closed':
             '''
             Emitted when the channel is closed.
@@ -228,12 +712,16 @@ class IOChannel(Object):
     def __init__(self, channel=None, mode=IO_READ|IO_WRITE, chunk_size=1024*1024, delimiter='\n'):
         super(IOChannel, self).__init__()
         self.delimiter = delimiter
-        self._write_queue = []
+        self._write_queue = _WriteQueue()
         # Read queue used for read() and readline(), and 'readline' signal.
-        self._read_queue = BytesIO()
+        self._read_queue = _ReadQueue()
         # Number of bytes each queue (read and write) are limited to.
         self._queue_size = 1024*1024
         self._chunk_size = chunk_size
+        self._reuse_buffers = False
+        self._read_batch = 1
+        # Number of bytes requested per read when read_batch > 1.
+        self._read_size = 64 * 1024
         self._queue_close = False
         self._closing = False
     
@@ -245,8 +733,12 @@ class IOChannel(Object):
         cb = WeakCallable(self._update_read_monitor)
         self._read_signal = Signal(cb)
         self._readline_signal = Signal(cb)
+        self._frame_signal = Signal(cb)
         self.signals['read'].changed_cb = cb
         self.signals['readline'].changed_cb = cb
+        self.signals['frame'].changed_cb = cb
+        # Framing codec used for read_frame() and write_frame().
+        self._framing = None
 
         # These variables hold the IOMonitors for monitoring; we only allocate
         # a monitor when the channel is connected to avoid a ref cycle so that
@@ -289,7 +781,7 @@ class IOChannel(Object):
            (however that :meth:`read` call may return None, in which case the
            readable property will subsequently be False).
         """
-        return self._mode & IO_READ and (self.alive or self._read_queue.tell() > 0)
+        return self._mode & IO_READ and (self.alive or len(self._read_queue) > 0)
 
 
     @property
@@ -337,6 +829,60 @@ class IOChannel(Object):
         self._chunk_size = size
 
 
+    @property
+    def read_batch(self):
+        """
+        Maximum number of reads done each time the channel becomes readable.
+
+        With the default of 1, a single read of up to :attr:`chunk_size` bytes
+        is done, and a *read* signal is emitted for it.  With a larger value,
+        the number of bytes requested per read adapts to the amount of data
+        actually being received: it doubles (up to the chunk size) whenever a
+        read fills it, and shrinks when reads return much less.  Reads are
+        then repeated, up to this many times, until a read returns less than
+        requested (meaning the channel has been drained) or the chunk size is
+        reached, and the data is emitted as one chunk.
+
+        This reduces the number of main loop iterations and signal emissions
+        for bulk transfers, without allocating chunk-sized strings for small
+        messages.
+        """
+        return self._read_batch
+
+
+    @read_batch.setter
+    def read_batch(self, value):
+        if value < 1:
+            raise ValueError('read_batch must be at least 1')
+        self._read_batch = value
+
+
+    @property
+    def reuse_buffers(self):
+        """
+        If True, data is read from the channel into reusable buffers.
+
+        The default is False, where a new string is allocated for each chunk
+        read.  When True, callbacks connected to the *read* signal are passed
+        a memoryview of a buffer that is reused for subsequent reads, which
+        avoids allocating (and later freeing) a chunk-sized string for every
+        read.  Callbacks must therefore copy the data (e.g. with
+        ``data.tobytes()``) if they need it after they return.  (Holding on to
+        the memoryview itself is safe; the buffer is then not reused.)
+        InProgress objects returned by :meth:`read` and :meth:`readline`, as
+        well as the *readline* signal, are still given strings.
+
+        Setting this has no effect for channels which don't support reading
+        into a buffer, such as TLS sockets.
+        """
+        return self._reuse_buffers
+
+
+    @reuse_buffers.setter
+    def reuse_buffers(self, value):
+        self._reuse_buffers = value
+
+
     @property
     def queue_size(self):
         """
@@ -358,9 +904,7 @@ class IOChannel(Object):
         """
         The number of bytes queued in memory to be written to the channel.
         """
-        # XXX: this is not terribly efficient when the write queue has
-        # many elements.  We may decide to keep a separate counter.
-        return sum(len(data) for data, inprogress in self._write_queue)
+        return self._write_queue.used
 
 
     @property
@@ -371,7 +915,7 @@ class IOChannel(Object):
         The read queue is only used if either readline() or the readline signal
         is.
         """
-        return self._read_queue.tell()
+        return len(self._read_queue)
 
     @property
     def delimiter(self):
@@ -390,13 +934,39 @@ class IOChannel(Object):
         self._delimiter = value
         if isinstance(value, (UNICODE_TYPE, BYTES_TYPE)):
             self._delimiter_encoded = py3_b(value)
+            # Bytes of already scanned data to scan again to find delimiters
+            # spanning two chunks.
+            self._delimiter_overlap = len(self._delimiter_encoded) - 1
         elif isinstance(value, (list, tuple)):
             regexp = bl('|').join(py3_b(x) for x in value)
             self._delimiter_encoded = re.compile(regexp)
+            self._delimiter_overlap = max(len(py3_b(x)) for x in value) - 1
         else:
             raise ValueError('delimiter must be a string, bytes, or sequence of strings or bytes')
 
 
+    @property
+    def framing(self):
+        """
+        :class:`~kaa.framing.FrameCodec` used by :meth:`read_frame`,
+        :meth:`write_frame` and the *frame* signal, or None.
+
+        Frames are decoded from the read queue, so framing can't be used
+        together with :meth:`readline` or the *readline* signal.  Data already
+        in the read queue when a codec is set (for example the remainder of
+        a line-based handshake) is decoded as the start of the first frame.
+        """
+        return self._framing
+
+
+    @framing.setter
+    def framing(self, codec):
+        if codec is not None and not hasattr(codec, 'decode'):
+            raise ValueError('framing must be a FrameCodec or None')
+        self._framing = codec
+        self._update_read_monitor()
+
+
     @property
     def mode(self):
         """
@@ -421,6 +991,14 @@ class IOChannel(Object):
         return not len(self._readline_signal) == len(self.signals['readline']) == 0
 
 
+    def _is_frame_connected(self):
+        """
+        Returns True if an outside caller is interested in frames.
+        """
+        return self._framing is not None and \
+               not len(self._frame_signal) == len(self.signals['frame']) == 0
+
+
     def _update_read_monitor(self, signal=None, change=None):
         """
         Update read IOMonitor to register or unregister based on if there are
@@ -434,7 +1012,8 @@ class IOChannel(Object):
         """
         if not (self._mode & IO_READ) or not self._rmon:
             return
-        elif not self._is_read_connected() and not self._is_readline_connected():
+        elif not self._is_read_connected() and not self._is_readline_connected() and \
+             not self._is_frame_connected():
             self._rmon.unregister()
         elif not self._rmon.active:
             self._rmon.register(self.fileno, IO_READ)
@@ -521,8 +1100,7 @@ class IOChannel(Object):
 
 
     def _clear_read_queue(self):
-        self._read_queue.seek(0)
-        self._read_queue.truncate()
+        self._read_queue.clear()
 
 
     def _find_delim(self, buf, start=0):
@@ -545,14 +1123,7 @@ class IOChannel(Object):
         Pops a line (plus delimiter) from the read queue.  If the delimiter
         is not found in the queue, returns None.
         """
-        s = self._read_queue.getvalue()
-        idx = self._find_delim(s)
-        if idx is None:
-            return
- 
-        self._clear_read_queue()
-        self._read_queue.write(s[idx:])
-        return s[:idx]
+        return self._read_queue.pop_line(self._find_delim, self._delimiter_overlap)
 
 
     def _abort_read_inprogress(self, exc, signal, ip):
@@ -598,10 +1169,8 @@ class IOChannel(Object):
                  data = yield process.read()
 
         """
-        if self._read_queue.tell() > 0:
-            s = self._read_queue.getvalue()
-            self._clear_read_queue()
-            return InProgress().finish(s)
+        if len(self._read_queue) > 0:
+            return InProgress().finish(self._read_queue.read())
 
         return self._async_read(self._read_signal)
 
@@ -640,6 +1209,77 @@ class IOChannel(Object):
         return self._async_read(self._readline_signal)
 
 
+    def read_frame(self):
+        """
+        Reads a frame from the channel, as decoded by the codec set in the
+        :attr:`framing` property.
+
+        :returns: An :class:`~kaa.InProgress` object. If the InProgress is
+                  finished with None, it means that the channel was closed
+                  before a complete frame was received (or the channel was
+                  already closed when read_frame() was called).
+
+        Data is buffered in the read queue until the codec finds a complete
+        frame in it.  If the codec finds the data to be invalid, the channel
+        is closed.
+
+        This method may not be called when a callback is connected to the
+        IOChannel's frame signal.
+        """
+        if not self._framing:
+            raise RuntimeError('No framing codec set')
+        if len(self.signals['frame']):
+            raise RuntimeError('Callback currently connected to frame signal')
+
+        frame = self._read_queue.pop_frame(self._framing)
+        if frame is not None:
+            return InProgress().finish(frame)
+        return self._async_read(self._frame_signal)
+
+
+    def write_frame(self, payload, *args):
+        """
+        Writes the given payload to the channel as a frame, as encoded by the
+        codec set in the :attr:`framing` property.
+
+        :param payload: the payload of the frame
+        :type payload: string
+        :param args: additional arguments for the codec, such as other header
+                     fields for :class:`~kaa.framing.LengthPrefixCodec`
+
+        :returns: An :class:`~kaa.InProgress` object which is finished when the
+                  frame is fully written to the channel.  See :meth:`write`.
+
+        The payload is queued separately from the frame header and trailer,
+        so it is not copied.
+        """
+        if not self._framing:
+            raise RuntimeError('No framing codec set')
+        for data in self._framing.encode(payload, *args):
+            ip = self.write(data)
+        return ip
+
+
+    def _dispatch_frames(self):
+        """
+        Emits the frames in the read queue, first to pending read_frame()
+        calls, then to the frame signal.
+        """
+        queue, codec = self._read_queue, self._framing
+        try:
+            while len(self._frame_signal):
+                frame = queue.pop_frame(codec)
+                if frame is None:
+                    return
+                self._frame_signal.emit(frame)
+            if len(self.signals['frame']):
+                for frame in queue.pop_frames(codec):
+                    self.signals['frame'].emit(frame)
+        except ValueError, e:
+            log.warning('Invalid frame received on %s, closing: %s', self, e)
+            self.close(immediate=True, expected=False)
+
+
     def _read(self, size):
         """
         Low-level call to read from channel.  Can be overridden by subclasses.
@@ -652,6 +1292,23 @@ class IOChannel(Object):
             return os.read(self.fileno, size)
 
 
+    def _readinto(self, buf, offset, size):
+        """
+        Low-level call to read at most size bytes from the channel into the
+        given bytearray at offset.  Can be overridden by subclasses;
+        subclasses which override _read() must also override this method (or
+        set it to None to disable reusable buffers).  Must return the number
+        of bytes read, which is 0 if the channel is closed.
+        """
+        try:
+            return self._channel.readinto(memoryview(buf)[offset:offset + size])
+        except AttributeError:
+            return _sys_readinto(self.fileno, buf, offset, size)
+
+    if not _sys_readinto:
+        _readinto = None
+
+
     def _handle_read(self):
         """
         IOMonitor callback when there is data to be read from the channel.
@@ -660,8 +1317,72 @@ class IOChannel(Object):
         reading data (by connecting to the read or readline signals, or calling
         read() or readline()).  This is necessary for flow control.
         """
+        if self._reuse_buffers and self._readinto:
+            buf = _buffer_pool.get(self._chunk_size)
+            try:
+                return self._handle_read_chunk(buf)
+            finally:
+                _buffer_pool.put(buf)
+        return self._handle_read_chunk()
+
+
+    def _read_chunk(self, buf=None):
+        """
+        Reads a chunk of at most chunk_size bytes from the channel, into buf
+        if given.  Returns the data read (a memoryview of buf if given), which
+        is empty if the channel is closed.
+
+        If read_batch is greater than 1, the chunk is read with up to that
+        many reads of the adaptive read size, stopping when a read returns
+        less than requested.
+        """
+        if self._read_batch == 1:
+            if buf is None:
+                return self._read(self._chunk_size)
+            return memoryview(buf)[:self._readinto(buf, 0, self._chunk_size)]
+
+        chunks = []
+        total = 0
+        for i in range(self._read_batch):
+            size = min(self._read_size, self._chunk_size - total)
+            try:
+                if buf is None:
+                    data = self._read(size)
+                    n = len(data) if data else 0
+                    if n:
+                        chunks.append(data)
+                else:
+                    n = self._readinto(buf, total, size)
+            except (IOError, socket.error):
+                if not total:
+                    raise
+                # Dispatch what we have; the error is hit again on the next
+                # read (unless it's EAGAIN, in which case we've drained the
+                # channel).
+                break
+
+            total += n
+            # Double the read size when a read fills it, and halve it when
+            # reads return much less.
+            if n == self._read_size:
+                self._read_size = min(self._read_size * 2, self._chunk_size)
+            elif n < self._read_size // 4:
+                self._read_size = max(self._read_size // 2, MIN_READ_SIZE)
+            if n < size or total >= self._chunk_size:
+                break
+
+        if buf is not None:
+            return memoryview(buf)[:total]
+        return chunks[0] if len(chunks) == 1 else bl('').join(chunks)
+
+
+    def _handle_read_chunk(self, buf=None):
+        """
+        Reads and dispatches a chunk of data for _handle_read(), into buf if
+        given.
+        """
         try:
-            data = self._read(self._chunk_size)
+            data = self._read_chunk(buf)
             log.debug2('IOChannel read data: channel=%s fd=%s len=%d', self._channel, self.fileno, len(data))
         except (IOError, socket.error), e:
             if len(e.args) != 2:
@@ -687,29 +1408,19 @@ class IOChannel(Object):
             return self.close(immediate=True, expected=False)
 
         # _read_signal is for InProgress objects waiting on the next read().
-        self._read_signal.emit(data)
+        if buf is not None and len(self._read_signal):
+            self._read_signal.emit(data.tobytes())
+        else:
+            self._read_signal.emit(data)
         self.signals['read'].emit(data)
  
         if self._is_readline_connected():
             if len(self._readline_signal) == 0:
                 # Callback is connected to the 'readline' signal, so loop
-                # through read queue and emit all lines individually.
-                queue = self._read_queue.getvalue() + data
-                self._clear_read_queue()
-
-                lines, last, idx = [], 0, self._find_delim(queue)
-                while True:
-                    # If idx is None, it will slice to the end.
-                    lines.append(queue[last:idx])
-                    if idx is None:
-                        break
-                    last = idx
-                    idx = self._find_delim(queue, last)
-
-                if self._find_delim(lines[-1]) is None:
-                    # Queue did not end with delimiter, so push the remainder back.
-                    self._read_queue.write(lines.pop())
-
+                # through read queue and emit all lines individually.  Any
+                # remainder without delimiter stays in the queue.
+                self._read_queue.write(data)
+                lines = self._read_queue.pop_lines(self._find_delim, self._delimiter_overlap)
                 for line in lines:
                     self.signals['readline'].emit(line)
 
@@ -722,8 +1433,7 @@ class IOChannel(Object):
                     # it over with this chunk.
                     # TODO: it's possible this chunk contains the delimiter we've
                     # been waiting for.  If so, we could salvage things.
-                    line = self._read_queue.getvalue()
-                    self._clear_read_queue()
+                    line = self._read_queue.read()
                     self._read_queue.write(data)
                 else:
                     self._read_queue.write(data)
@@ -732,6 +1442,10 @@ class IOChannel(Object):
                 if line is not None:
                     self._readline_signal.emit(line)
 
+        elif self._is_frame_connected():
+            self._read_queue.write(data)
+            self._dispatch_frames()
+
         # Update read monitor if necessary.  If there are no longer any
         # callbacks left on any of the read signals (most likely _read_signal
         # or _readline_signal), we want to prevent _handle_read() from being
@@ -748,12 +1462,67 @@ class IOChannel(Object):
         return os.write(self.fileno, data)
 
 
+    def _writev(self, buffers):
+        """
+        Low-level call to write multiple buffers to the channel with a single
+        system call.  Can be overridden by subclasses; subclasses which
+        override _write() to do anything but write the raw data to the file
+        descriptor must also override this method (or set it to None to
+        disable gathered writes).
+
+        buffers is a list of (data, offset) tuples, where the bytes of data
+        from offset onward are to be written.  Must return number of bytes
+        written to the channel.
+        """
+        return _sys_writev(self.fileno, buffers)
+
+    if not _sys_writev:
+        _writev = None
+
+
+    def _sendfile(self, fd, offset, count):
+        """
+        Low-level call to send up to count bytes from the regular file fd,
+        starting at offset, directly to the channel.  Can be overridden by
+        subclasses, or set to None to disable it (see _writev()).  Must
+        return number of bytes written to the channel.
+        """
+        return _sys_sendfile(self.fileno, fd, offset, count)
+
+    if not _sys_sendfile:
+        _sendfile = None
+
+
+    def _splice(self, fd, count):
+        """
+        Low-level call to move up to count bytes from the pipe fd directly
+        to the channel without blocking.  Can be overridden by subclasses, or
+        set to None to disable it (see _writev()).  Must return number of
+        bytes written to the channel.
+        """
+        return _sys_splice(fd, self.fileno, count)
+
+    if not _sys_splice:
+        _splice = None
+
+
     def _abort_write_inprogress(self, exc, data, ip):
-        try:
-            self._write_queue.remove((data, ip))
-        except ValueError:
-            # Too late to abort.
-            return False
+        for entry in self._write_queue:
+            if entry[1] is ip:
+                if entry[2] or getattr(entry[0], 'sent', 0):
+                    # Partially written already, too late to abort.
+                    return False
+                self._write_queue.remove(entry)
+                if isinstance(entry[0], _FileTransfer):
+                    entry[0].cancel()
+                    # We may have been waiting for the source to become
+                    # readable, in which case the write monitor is not
+                    # registered.
+                    if self._write_queue and self._wmon and not self._wmon.active:
+                        self._wmon.register(self.fileno, IO_WRITE)
+                return
+        # Too late to abort.
+        return False
 
 
     def write(self, data):
@@ -794,7 +1563,7 @@ class IOChannel(Object):
         ip = InProgress()
         if data:
             ip.signals['abort'].connect(self._abort_write_inprogress, data, ip)
-            self._write_queue.append((data, ip))
+            self._write_queue.append([data, ip, 0])
             if self._channel and self._wmon and not self._wmon.active:
                 self._wmon.register(self.fileno, IO_WRITE)
         else:
@@ -804,33 +1573,135 @@ class IOChannel(Object):
         return ip
 
 
+    def sendfile(self, fileobj, offset=0, count=None):
+        """
+        Sends the contents of a file to the channel.
+
+        :param fileobj: the file to send
+        :type fileobj: file descriptor, file-like object or
+                       :class:`~kaa.IOChannel`
+        :param offset: the position in the file to start sending from (must be
+                       0 for pipes and other non-seekable files)
+        :type offset: int
+        :param count: the number of bytes to send, or None to send until the
+                      end of the file is reached
+        :type count: int or None
+
+        :returns: An :class:`~kaa.InProgress` object which is finished with
+                  the number of bytes sent when the transfer is complete.
+
+        The transfer is queued along with any data passed to :meth:`write`,
+        so it begins once previously written data is flushed, and data
+        written afterward follows it.  Data from regular files is sent using
+        the sendfile() system call, and data from pipes (such as the
+        :attr:`~kaa.Process.stdout` of a :class:`~kaa.Process`) using
+        splice(), so that it never needs to be copied into the Python
+        process.  If this isn't possible, the data is read in chunks of
+        :attr:`chunk_size` bytes.
+
+        The file position of *fileobj* is not used or updated, except for
+        non-seekable files.  If *fileobj* is an IOChannel, data already read
+        into its read buffer is sent first, and the IOChannel is closed once
+        its end of file is reached.  Nothing else may read from *fileobj*
+        until the transfer is complete.
+        """
+        if not (self._mode & IO_WRITE):
+            raise IOError(9, 'Cannot write to a read-only channel')
+        if not self.writable:
+            raise IOError(9, 'Channel is not writable')
+
+        source = None
+        if isinstance(fileobj, IOChannel):
+            if fileobj._rmon and fileobj._rmon.active:
+                raise ValueError('Cannot send from a channel that is being read')
+            source = fileobj
+            fd = fileobj.fileno
+        else:
+            fd = fileobj if isinstance(fileobj, int) else fileobj.fileno()
+        transfer = _FileTransfer(fd, offset, count, source)
+        if transfer.stream and offset:
+            raise ValueError('Offset must be 0 for non-seekable files')
+
+        ip = InProgress()
+        ip.signals['abort'].connect(self._abort_write_inprogress, transfer, ip)
+        if source and len(source._read_queue):
+            buffered = source._read_queue.read()
+            if count is not None and len(buffered) > count:
+                source._read_queue.write(buffered[count:])
+                buffered = buffered[:count]
+            transfer.pending = buffered
+            if count is not None:
+                transfer.remaining -= len(buffered)
+        self._write_queue.append([transfer, ip, 0])
+        if self._channel and self._wmon and not self._wmon.active:
+            self._wmon.register(self.fileno, IO_WRITE)
+        return ip
+
+
+    def _resume_write(self):
+        """
+        Called when the source of a sendfile() transfer which had no data
+        available becomes readable.
+        """
+        if self._write_queue and self._wmon and not self._wmon.active:
+            self._wmon.register(self.fileno, IO_WRITE)
+
+
     def _handle_write(self):
         """
         IOMonitor callback when the channel is writable.  This callback is not
         registered then the write queue is empty, so we only get called when
         there is something to write.
         """
-        if not self._write_queue:
+        queue = self._write_queue
+        if not queue:
             # Can happen if a write was aborted.
             return
 
         try:
-            while self._write_queue:
-                data, inprogress = self._write_queue.pop(0)
-                sent = self._write(data)
-                log.debug2('IOChannel write data: channel=%s fd=%s len=%d (of %d)', 
-                           self._channel, self.fileno, sent, len(data))
-                if sent != len(data):
-                    # Not all data was able to be sent; push remaining data
-                    # back onto the write buffer.
-                    self._write_queue.insert(0, (data[(sent if sent >= 0 else 0):], inprogress))
-                    break
+            while queue:
+                transfer = queue[0][0]
+                if isinstance(transfer, _FileTransfer):
+                    done = transfer.send(self)
+                    if done is None:
+                        # The source has no data yet.  Stop polling the
+                        # channel for writability until it does.
+                        self._wmon.unregister()
+                        transfer.wait(self._resume_write)
+                        return
+                    elif not done:
+                        break
+                    queue.popleft()[1].finish(transfer.sent)
+                    continue
+
+                if self._writev and len(queue) > 1:
+                    # Gather as many queued buffers as possible into a single
+                    # system call, up to the next sendfile() transfer.
+                    buffers = []
+                    for entry in islice(queue, IOV_MAX):
+                        if isinstance(entry[0], _FileTransfer):
+                            break
+                        buffers.append((entry[0], entry[2]))
+                    size = sum(len(data) - offset for data, offset in buffers)
+                    sent = self._writev(buffers)
                 else:
-                    # All data is written, finish the InProgress associated
-                    # with this write.
-                    inprogress.finish(sent)
+                    data, inprogress, offset = queue[0]
+                    size = len(data) - offset
+                    sent = self._write(memoryview(data)[offset:] if offset else data)
+                log.debug2('IOChannel write data: channel=%s fd=%s len=%d (of %d)',
+                           self._channel, self.fileno, sent, size)
+
+                # Finish the InProgress for each write whose data is now
+                # fully written.
+                for inprogress, nbytes in queue.advance(sent):
+                    inprogress.finish(nbytes)
+                if sent < size:
+                    # Not all data was able to be sent; wait for the channel
+                    # to become writable again.
+                    break
 
-            if not self._write_queue:
+            if not queue and self._wmon:
+                # (_wmon is None if a write callback closed the channel.)
                 if self._queue_close:
                     return self.close(immediate=True)
                 self._wmon.unregister()
@@ -843,10 +1714,14 @@ class IOChannel(Object):
                 # (mainloop will keep calling us back) we sleep a tiny
                 # bit.  It's admittedly a bit kludgy, but it's a simple
                 # solution to a condition which should not occur often.
-                self._write_queue.insert(0, (data, inprogress))
                 time.sleep(0.001)
                 return
 
+            # Remove the write that failed from the queue, so that close()
+            # doesn't throw to it as well.
+            inprogress = queue.popleft()[1] if queue else InProgress()
+            if isinstance(transfer, _FileTransfer):
+                transfer.cancel()
             if tp in (IOError, socket.error, OSError):
                 # Any of these are treated as fatal.  We close, which
                 # also throws to any other pending InProgress writes.
@@ -915,18 +1790,21 @@ class IOChannel(Object):
 
         # Finish any InProgress waiting on read() or readline() with whatever
         # is left in the read queue.
-        s = self._read_queue.getvalue()
+        s = self._read_queue.read()
         self._read_signal.emit(s)
         self._readline_signal.emit(s)
-        self._clear_read_queue()
+        # An incomplete frame is discarded.
+        self._frame_signal.emit(None)
 
         # Throw IOError to any pending InProgress in the write queue
-        for data, inprogress in self._write_queue:
+        for data, inprogress, offset in self._write_queue:
+            if isinstance(data, _FileTransfer):
+                data.cancel()
             if len(inprogress):
                 # Somebody cares about this InProgress, so we need to finish
                 # it.
                 inprogress.throw(IOError, IOError(9, 'Channel closed prematurely'), None)
-        del self._write_queue[:]
+        self._write_queue.clear()
 
         try:
             self._close()
@@ -972,6 +1850,7 @@ class IOChannel(Object):
         Once stolen, the given ``channel`` is rendered basically inert.
         """
         self._delimiter = channel.delimiter
+        self._framing = channel._framing
         self._write_queue = channel._write_queue
         self._read_queue = channel._read_queue
         self._queue_size = channel._queue_size
@@ -981,8 +1860,8 @@ class IOChannel(Object):
         self.wrap(channel, channel.mode)
         # Generate new queues on the channel object whose fd we are stealing, since
         # we stole its queues too.
-        channel._write_queue = []
-        channel._read_queue = BytesIO()
+        channel._write_queue = _WriteQueue()
+        channel._read_queue = _ReadQueue()
         channel._channel = None
 
         def clone(src, dst):
@@ -994,5 +1873,7 @@ class IOChannel(Object):
         clone(channel._readline_signal, self._readline_signal)
         clone(channel.signals['read'], self.signals['read'])
         clone(channel.signals['readline'], self.signals['readline'])
+        clone(channel._frame_signal, self._frame_signal)
+        clone(channel.signals['frame'], self.signals['frame'])
 
         return self
@@ -32,7 +32,7 @@ from __future__ import absolute_import
 
 __all__ = [ 'run', 'stop', 'step', 'select_notifier', 'is_running', 'wakeup',
             'set_as_mainthread', 'is_shutting_down', 'loop', 'signals', 'init',
-            'is_initialized' ]
+            'is_initialized', 'profile', 'get_profiler' ]
 
 # python imports
 import sys
@@ -63,6 +63,8 @@ _shutdown_event = threading.Event()
 _loop_lock = threading.Lock()
 # True if init() has been called
 _initialized = False
+# MainLoopProfiler object if profiling is enabled.
+_profiler = None
 
 #: mainloop signals to connect to
 #:  - init: emitted when kaa.main.init() is invoked; will always be from the 
@@ -419,6 +421,51 @@ def is_stopped():
     return _running == False
 
 
+def profile(enable=True, threshold=0.05, interval=None):
+    """
+    Enables or disables profiling of the main loop.
+
+    :param enable: True to enable profiling, False to disable it
+    :type enable: bool
+    :param threshold: callbacks blocking the main loop for longer than this
+                      many seconds are logged and recorded as slow.
+    :type threshold: float
+    :param interval: if not None, a summary of the collected statistics is
+                     logged every *interval* seconds.
+    :type interval: float
+    :returns: the :class:`~kaa.profiler.MainLoopProfiler` object, or None if
+              profiling was disabled.
+
+    The profiler records, for each step of the main loop, the time spent
+    waiting for events, and the time spent in timer callbacks, IO callbacks,
+    callables queued from other threads and external dispatchers.  Only the
+    generic (default) main loop implementation supports profiling.
+
+    Calling this function again while profiling is enabled updates the
+    threshold and interval, but keeps the statistics collected so far.
+    """
+    global _profiler
+    from .pynotifier import nf_generic
+    if not enable:
+        _profiler = None
+    elif _profiler:
+        _profiler.threshold = threshold
+        _profiler.interval = interval
+    else:
+        from .profiler import MainLoopProfiler
+        _profiler = MainLoopProfiler(threshold, interval)
+    nf_generic.profiler_set(_profiler)
+    return _profiler
+
+
+def get_profiler():
+    """
+    Returns the :class:`~kaa.profiler.MainLoopProfiler` object if profiling is
+    enabled via :func:`~kaa.main.profile`, or None otherwise.
+    """
+    return _profiler
+
+
 # Expose some of the CoreThreading functions in the main namespace for public
 # consumption.
 wakeup = CoreThreading.wakeup
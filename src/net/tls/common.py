@@ -30,9 +30,11 @@
 # python imports
 import logging
 import os
+import stat
 
 # kaa imports
 import kaa
+from ...io import _WriteQueue
 
 # get logging object
 log = logging.getLogger('kaa.base.net.tls')
@@ -75,6 +77,11 @@ class TLSSocketBase(kaa.Socket):
     # Cached system-wide CA cert file (as detected), or None if none was found.
     _cafile = False
 
+    # Once TLS is started, reads and writes must go through the TLS layer
+    # (_read and _write), so gathered writes and reads into reusable buffers
+    # are disabled.
+    _writev = _readinto = None
+
     __kaasignals__ = {
         'tls':
             '''
@@ -85,7 +92,7 @@ class TLSSocketBase(kaa.Socket):
     def __init__(self, cafile=None):
         super(TLSSocketBase, self).__init__()
         self._handshake = False
-        self._pre_handshake_write_queue = []
+        self._pre_handshake_write_queue = _WriteQueue()
 
         if cafile:
             self._cafile = cafile
@@ -105,4 +112,77 @@ class TLSSocketBase(kaa.Socket):
             TLSSocketBase._cafile = self._cafile = cafile
 
 
+    def sendfile(self, fileobj, offset=0, count=None):
+        # The kernel would bypass the TLS layer.
+        return sendfile_chunked(self, fileobj, offset, count)
+
+
+def _wait_readable(fd):
+    """
+    Returns an InProgress finished once fd is readable.
+    """
+    ip = kaa.InProgress()
+    def readable():
+        monitor.unregister()
+        ip.finish(None)
+    monitor = kaa.IOMonitor(readable)
+    monitor.register(fd, kaa.IO_READ)
+    return ip
+
+
+@kaa.coroutine()
+def sendfile_chunked(channel, fileobj, offset=0, count=None):
+    """
+    Implements sendfile() for TLS sockets, taking the same arguments as
+    :meth:`kaa.IOChannel.sendfile`.
+
+    The data must be encrypted, so it can't be passed to the socket by the
+    kernel.  Instead the file is read in chunks of the channel's chunk_size,
+    which are sent with channel.write().  Unlike IOChannel.sendfile(), the
+    transfer isn't queued along with other writes, so data written before
+    the transfer is complete may be sent between the chunks.
+    """
+    if not channel.writable:
+        raise IOError(9, 'Channel is not writable')
+    source = None
+    if isinstance(fileobj, kaa.IOChannel):
+        if fileobj._rmon and fileobj._rmon.active:
+            raise ValueError('Cannot send from a channel that is being read')
+        source = fileobj
+        fd = fileobj.fileno
+    else:
+        fd = fileobj if isinstance(fileobj, int) else fileobj.fileno()
+    stream = not stat.S_ISREG(os.fstat(fd).st_mode)
+    if stream and offset:
+        raise ValueError('Offset must be 0 for non-seekable files')
+
+    sent = 0
+    if source and len(source._read_queue):
+        data = source._read_queue.read()
+        if count is not None and len(data) > count:
+            source._read_queue.write(data[count:])
+            data = data[:count]
+        sent += len(data)
+        yield channel.write(data)
+
+    while count is None or sent < count:
+        size = channel.chunk_size
+        if count is not None:
+            size = min(size, count - sent)
+        if stream:
+            yield _wait_readable(fd)
+        else:
+            os.lseek(fd, offset, os.SEEK_SET)
+        data = os.read(fd, size)
+        if not data:
+            # End of file.
+            if source:
+                source.close(immediate=True)
+            break
+        offset += len(data)
+        sent += len(data)
+        yield channel.write(data)
+    yield sent
+
+
 # FIXME: we need a TLSKey abstraction.
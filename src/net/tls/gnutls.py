@@ -43,6 +43,7 @@ import logging
 import kaa
 
 from .common import TLSSocketBase
+from ...io import _WriteQueue
 
 import gnutls.connection
 from gnutls.connection import X509Certificate, X509PrivateKey, X509Certificate, X509CRL, X509Credentials
@@ -137,7 +138,7 @@ class GNUTLSSocket(TLSSocketBase):
         self._handshake = True
         # Store current write queue and create a new one
         self._pre_handshake_write_queue = self._write_queue
-        self._write_queue = []
+        self._write_queue = _WriteQueue()
         if self._pre_handshake_write_queue:
             # flush pre handshake write data
             yield self._pre_handshake_write_queue[-1][1]
@@ -59,6 +59,7 @@ except ImportError:
 import kaa
 from kaa.strutils import bl, nativestr, py3_str, py3_b
 from kaa.dateutils import utc
+from .common import sendfile_chunked
 
 
 # get logging object
@@ -1409,6 +1410,9 @@ class TLSSocket(kaa.Socket):
             '''
     }
 
+    # Data read from the socket must be decrypted by _read().
+    _readinto = None
+
     def __init__(self, ctx=None, reuse_sessions=False):
         super(TLSSocket, self).__init__()
         self._ctx = None
@@ -1426,6 +1430,11 @@ class TLSSocket(kaa.Socket):
             self.ctx = ctx
 
 
+    def sendfile(self, fileobj, offset=0, count=None):
+        # The kernel would bypass the TLS layer.
+        return sendfile_chunked(self, fileobj, offset, count)
+
+
     def _reset(self):
         self._lock.acquire()
         # Certificate chain for connected peer
@@ -1560,14 +1569,10 @@ class TLSSocket(kaa.Socket):
             return total, super(TLSSocket, self).write(bl('').join(encrypted))
 
 
-    def _accept(self):
-        # Override Socket._accept so we can create a TLSSocket with the same
-        # context.
-        sock, addr = self._channel.accept()
-        # create new Socket from the same class this object is
-        client_socket = self.__class__(self.ctx)
-        client_socket.wrap(sock, kaa.IO_READ | kaa.IO_WRITE)
-        self.signals['new-client'].emit(client_socket)
+    def _make_client(self):
+        # Override Socket._make_client so we can create a TLSSocket with the
+        # same context.
+        return self.__class__(self.ctx)
 
 
     # Useful for debug.
@@ -0,0 +1,879 @@
+# -*- coding: iso-8859-1 -*-
+# -----------------------------------------------------------------------------
+# processpool.py - Process pool support for the Kaa Framework
+# -----------------------------------------------------------------------------
+# kaa.base - The Kaa Application Framework
+# Copyright 2005-2012 Dirk Meyer, Jason Tackaberry, et al.
+#
+# Please see the file AUTHORS for a complete list of authors.
+#
+# This library is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License version
+# 2.1 as published by the Free Software Foundation.
+#
+# This library is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301 USA
+#
+# -----------------------------------------------------------------------------
+
+from __future__ import absolute_import
+
+__all__ = [
+    'ProcessPool', 'ProcessPoolCallable', 'ProcessInProgress', 'processed',
+    'register_process_pool', 'get_process_pool'
+]
+
+# python imports
+import sys
+import os
+import fcntl
+import signal
+import errno
+import struct
+import cPickle
+import traceback
+import logging
+import weakref
+
+# kaa imports
+from .callable import Callable
+from .utils import wraps, property, get_num_cpus
+from .strutils import bl
+from .core import CoreThreading
+from .errors import make_exception_class, AsyncExceptionBase
+from .async import InProgress, InProgressAny
+from .thread import MainThreadCallable
+from .timer import OneShotTimer, delay
+from .coroutine import coroutine, POLICY_SINGLETON
+from .io import IOChannel, IO_READ, IO_WRITE
+from .process import supervisor
+from .rpc import PICKLE_PROTOCOL
+
+# get logging object
+log = logging.getLogger('kaa.base.processpool')
+
+# Packets exchanged with pool members use the same header as kaa.rpc:
+# (sequence, packet type, payload length)
+PACKET_HEADER_SIZE = struct.calcsize("I4sI")
+
+# Process pool name -> ProcessPool object
+_process_pools = {}
+
+# Callables which can't be pickled (like lambdas or the original function
+# behind a @kaa.processed decorator), by index.  Members are forked from the
+# parent, so they inherit the callables registered before they were forked,
+# and jobs reference these callables by their index rather than pickling
+# them.  An entry is dropped once no job or ProcessPoolCallable uses it.
+_callables = weakref.WeakValueDictionary()
+# Callable -> _RegisteredCallable
+_callable_index = weakref.WeakValueDictionary()
+# Index of the next registered callable
+_next_callable = [0]
+
+
+class _RemoteExceptionBase(AsyncExceptionBase):
+    # make_exception_class() ignores the class dict of RemoteException, so the
+    # header is defined in its base class instead.
+    def _kaa_get_header(self):
+        return "Exception in process pool job '%s'; remote traceback follows:" % self._kaa_exc_args[0]
+
+
+class RemoteException(_RemoteExceptionBase):
+    """
+    Raised when a job executed by a :class:`~kaa.ProcessPool` raises an
+    exception.  Like :class:`kaa.rpc.RemoteException`, instances of this class
+    inherit the actual exception class raised within the pool member, and
+    include the traceback of the remote stack when printed.
+    """
+    __metaclass__ = make_exception_class
+
+
+class _RegisteredCallable(object):
+    """
+    Entry of a callable in _callables, which users of the callable hold on
+    to.
+    """
+    def __init__(self, func):
+        self.func = func
+        self.idx = _next_callable[0]
+        _next_callable[0] += 1
+
+
+def _register_callable(func):
+    """
+    Returns the _RegisteredCallable of the given callable, adding it to
+    _callables if necessary.
+    """
+    try:
+        return _callable_index[func]
+    except (KeyError, TypeError):
+        pass
+    entry = _RegisteredCallable(func)
+    _callables[entry.idx] = entry
+    try:
+        _callable_index[func] = entry
+    except TypeError:
+        # Unhashable callable, so it will be registered again next time.
+        pass
+    return entry
+
+
+def _pickle_callable(func):
+    """
+    Returns what is sent to pool members to call func: func itself if it can
+    be pickled, the object and name of a method whose object can be pickled,
+    or None if func must be registered instead.
+    """
+    if getattr(func, 'im_self', None) is not None:
+        ref = func.im_self, func.__name__
+    else:
+        ref = func
+    try:
+        cPickle.dumps(ref, PICKLE_PROTOCOL)
+    except Exception:
+        return None
+    return ref
+
+
+def _resolve_callable(ref):
+    """
+    Returns the callable a job refers to, in a pool member.
+    """
+    if isinstance(ref, (int, long)):
+        return _callables[ref].func
+    if isinstance(ref, tuple):
+        return getattr(*ref)
+    return ref
+
+
+def register_process_pool(name, pool):
+    """
+    Registers a :class:`~kaa.ProcessPool` under the given name.
+
+    :param name: the name under which to register this process pool
+    :type name: str
+    :param pool: the process pool object
+    :type pool: :class:`~kaa.ProcessPool`
+    :returns: the supplied :class:`~kaa.ProcessPool` object
+
+    Once registered, the process pool may be referenced by name when using the
+    :func:`@kaa.processed() <kaa.processed>` decorator or
+    :class:`~kaa.ProcessPoolCallable` class.  Naming follows the same
+    convention as :func:`kaa.register_thread_pool`.
+    """
+    if name in _process_pools:
+        raise ValueError('A registered pool already exists with name "%s"' % name)
+    assert(isinstance(pool, ProcessPool))
+    _process_pools[name] = pool
+    pool._name = name
+    return pool
+
+
+def get_process_pool(name):
+    """
+    Returns the :class:`~kaa.ProcessPool` previously registered with the given
+    name, or None if no :class:`~kaa.ProcessPool` was registered with that name.
+    """
+    return _process_pools.get(name)
+
+
+def _set_cloexec(fd):
+    flags = fcntl.fcntl(fd, fcntl.F_GETFD)
+    fcntl.fcntl(fd, fcntl.F_SETFD, flags | fcntl.FD_CLOEXEC)
+
+
+def _read_exactly(fd, size):
+    """
+    Blocking read of size bytes from fd.  Returns fewer bytes only on EOF.
+    """
+    chunks = []
+    while size > 0:
+        try:
+            data = os.read(fd, size)
+        except OSError, e:
+            if e.errno == errno.EINTR:
+                continue
+            raise
+        if not data:
+            break
+        chunks.append(data)
+        size -= len(data)
+    return bl('').join(chunks)
+
+
+def _write_all(fd, data):
+    while data:
+        try:
+            data = data[os.write(fd, data):]
+        except OSError, e:
+            if e.errno != errno.EINTR:
+                raise
+
+
+def _member_main(rfd, wfd):
+    """
+    Main loop of a pool member, executed in the child after forking.  Reads
+    jobs from rfd and writes results to wfd until rfd is closed by the parent.
+
+    This function never returns.
+    """
+    exitcode = 1
+    try:
+        # The signal wakeup pipe and handlers belong to the parent's main loop.
+        if hasattr(signal, 'set_wakeup_fd'):
+            signal.set_wakeup_fd(-1)
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        # Ctrl-C in a terminal is sent to the whole process group; let the
+        # parent decide what to do with us.
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        # Close all inherited descriptors except stdio and our pipes.  In
+        # particular we must not hold the parent's end of any other member's
+        # pipes, or they won't see EOF when the parent closes them.
+        os.closerange(3, min(rfd, wfd))
+        os.closerange(min(rfd, wfd) + 1, max(rfd, wfd))
+        os.closerange(max(rfd, wfd) + 1, os.sysconf('SC_OPEN_MAX'))
+
+        while True:
+            header = _read_exactly(rfd, PACKET_HEADER_SIZE)
+            if len(header) < PACKET_HEADER_SIZE:
+                # Parent closed the pipe, we're done.
+                break
+            seq, packet_type, length = struct.unpack("I4sI", header)
+            payload = _read_exactly(rfd, length)
+            name = '<unknown>'
+            try:
+                ref, name, args, kwargs = cPickle.loads(payload)
+                result = _resolve_callable(ref)(*args, **kwargs)
+                packet_type, payload = 'RETN', cPickle.dumps(result, PICKLE_PROTOCOL)
+            except Exception, e:
+                stack = traceback.extract_tb(sys.exc_info()[2])
+                try:
+                    payload = cPickle.dumps((e, stack), PICKLE_PROTOCOL)
+                except Exception:
+                    payload = cPickle.dumps((Exception(str(e)), stack), PICKLE_PROTOCOL)
+                packet_type = 'EXCP'
+            _write_all(wfd, struct.pack("I4sI", seq, packet_type, len(payload)) + payload)
+        exitcode = 0
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(exitcode)
+
+
+
+class ProcessInProgress(InProgress):
+    """
+    An :class:`~kaa.InProgress` class that represents a job executed by a
+    :class:`~kaa.ProcessPool`.  ``ProcessInProgress`` objects are returned when
+    invoking :class:`~kaa.ProcessPoolCallable` objects, or functions decorated
+    with :func:`@kaa.processed() <kaa.processed>`.
+
+    Aborting a job that is still queued removes it from the queue.  Aborting
+    a job that is currently executing kills the pool member running it; a new
+    member will be started for subsequent jobs.
+    """
+    def __init__(self, func, *args, **kwargs):
+        super(ProcessInProgress, self).__init__()
+        self._ref = _pickle_callable(func)
+        # The callable's registry entry if it can't be pickled.
+        self._registered = None
+        if self._ref is None:
+            self._registered = _register_callable(func)
+            self._ref = self._registered.idx
+        self._funcname = getattr(func, '__name__', repr(func))
+        self._args = args
+        self._kwargs = kwargs
+        self.priority = 0
+        # The ProcessPool we are queued in, and the member executing us.
+        self._pool = None
+        self._member = None
+        self.signals['abort'].connect(self._abort)
+
+
+    @property
+    def active(self):
+        """
+        True if the job is still waiting to be processed or is executing.
+        """
+        return not self.finished and (self._member is not None or self._pool is not None)
+
+
+    def _abort(self, exc):
+        if self._member:
+            self._member.kill()
+        elif self._pool:
+            self._pool.dequeue(self)
+
+
+
+class ProcessPoolCallable(Callable):
+    """
+    A special :class:`~kaa.Callable` used to execute a function or method
+    inside a forked process as part of a process pool.  If all members of the
+    pool are busy, the job is queued and will be executed when a member
+    becomes available.
+
+    Arguments and return values are passed between processes by pickling, so
+    they must be picklable.  The callable is pickled as well if possible; for
+    a method, this means the object it is bound to is pickled with each job.
+    Callables which can't be pickled (such as lambdas, or functions decorated
+    with :func:`@kaa.processed() <kaa.processed>`) are instead inherited by
+    the forked pool members, which means the ProcessPoolCallable should be
+    created before the pool starts its members.  If it isn't, idle members
+    are replaced by freshly forked ones as needed.
+    """
+    def __init__(self, poolinfo, func, *args, **kwargs):
+        """
+        :param poolinfo: a :class:`~kaa.ProcessPool` object or name of a
+                         previously registered process pool, or a 2-tuple
+                         (``pool``, ``priority``), where ``pool`` is a
+                         :class:`~kaa.ProcessPool` object or registered name,
+                         and ``priority`` is the integer priority that controls
+                         where in the queue the job will be placed.  If
+                         ``pool`` is None, the default process pool is used.
+        :param func: the underlying callable that will be called from within
+                     a pool member.
+        """
+        super(ProcessPoolCallable, self).__init__(func, *args, **kwargs)
+        if isinstance(poolinfo, (list, tuple)):
+            self._pool, self.priority = poolinfo
+        else:
+            self._pool, self.priority = poolinfo, 0
+        # If func can't be pickled, register it now so that members forked
+        # from here on know about it.
+        self._registered = None
+        if _pickle_callable(func) is None:
+            self._registered = _register_callable(func)
+
+
+    def _get_pool(self):
+        if isinstance(self._pool, ProcessPool):
+            return self._pool
+        name = self._pool or 'kaa::default'
+        pool = _process_pools.get(name)
+        if not pool:
+            if self._pool:
+                log.warning('Implicitly registering process pool "%s"; use register_process_pool() instead', name)
+            pool = register_process_pool(name, ProcessPool())
+        return pool
+
+
+    def __call__(self, *args, **kwargs):
+        args, kwargs = self._merge_args(args, kwargs)
+        return self._get_pool().enqueue(ProcessInProgress(self._func, *args, **kwargs), self.priority)
+
+
+
+class _ProcessPoolMember(object):
+    """
+    Member process for process pools.  Like _ThreadPoolMember, this class dips
+    its fingers into ProcessPool private members.
+
+    Members are registered with the kaa.Process supervisor, which reaps them
+    on SIGCHLD (via _check_dead()) and stops them on shutdown (via stop()).
+    """
+    def __init__(self, pool, name):
+        self.pool = pool
+        self.name = name
+        # The ProcessInProgress currently being executed.
+        self.job = None
+        # Number of jobs completed by this member.
+        self.jobs_done = 0
+        # If True, member is stopped once its current job is done.
+        self.retiring = False
+        # Callables registered from here on are unknown to this member (see
+        # _callables).
+        self.ncallables = _next_callable[0]
+        self.pid = None
+        self.exitcode = None
+        self.idle_timer = OneShotTimer(pool._handle_idle_timeout, self)
+        self._seq = 0
+        self._read_buffer = []
+        self._in_progress = InProgress()
+
+        # Register before forking to avoid missing SIGCHLD from a member
+        # which dies right away.  (See _Supervisor.register)
+        supervisor.register(self)
+        jobs, results = os.pipe(), os.pipe()
+        try:
+            pid = os.fork()
+        except OSError:
+            supervisor.unregister(self)
+            [os.close(fd) for fd in jobs + results]
+            raise
+
+        if pid == 0:
+            os.close(jobs[1])
+            os.close(results[0])
+            _member_main(jobs[0], results[1])
+
+        os.close(jobs[0])
+        os.close(results[1])
+        _set_cloexec(jobs[1])
+        _set_cloexec(results[0])
+        self.pid = pid
+        self._jobs = IOChannel(jobs[1], IO_WRITE)
+        self._results = IOChannel(results[0], IO_READ)
+        self._results.signals['read'].connect(self._handle_read)
+        self._results.signals['closed'].connect(self._handle_closed)
+        log.debug('process pool member "%s" started, pid=%d', name, pid)
+
+
+    def __repr__(self):
+        return '<_ProcessPoolMember "%s" pid=%s>' % (self.name, self.pid)
+
+
+    def __inprogress__(self):
+        return self._in_progress
+
+
+    @property
+    def alive(self):
+        return self.exitcode is None and self._jobs.alive
+
+
+    def run(self, job):
+        """
+        Sends the given job to the member process.  Raises if the job arguments
+        cannot be pickled.
+        """
+        payload = cPickle.dumps((job._ref, job._funcname, job._args, job._kwargs), PICKLE_PROTOCOL)
+        self._seq += 1
+        packet = struct.pack("I4sI", self._seq, 'CALL', len(payload)) + payload
+        # The member runs one job at a time, so the write queue never holds
+        # more than this packet.
+        self._jobs.queue_size = max(self._jobs.queue_size, len(packet))
+        self.idle_timer.stop()
+        self._jobs.write(packet)
+        self.job = job
+        job._member = self
+
+
+    def _handle_read(self, data):
+        self._read_buffer.append(data)
+        buf = bl('').join(self._read_buffer)
+        if len(buf) < PACKET_HEADER_SIZE:
+            return
+        seq, packet_type, length = struct.unpack("I4sI", buf[:PACKET_HEADER_SIZE])
+        if len(buf) < PACKET_HEADER_SIZE + length:
+            self._read_buffer = [buf]
+            return
+
+        # A member only ever has one job at a time, so there can't be
+        # another packet following this one.
+        payload = buf[PACKET_HEADER_SIZE:PACKET_HEADER_SIZE + length]
+        self._read_buffer = []
+        job, self.job = self.job, None
+        self.jobs_done += 1
+        if job:
+            job._member = None
+            job._pool = None
+        self.pool._handle_member_idle(self)
+
+        if not job or job.finished:
+            # Job was aborted.
+            return
+        if packet_type == bl('RETN'):
+            try:
+                result = cPickle.loads(payload)
+            except Exception:
+                job.throw()
+            else:
+                job.finish(result)
+        else:
+            try:
+                exc_value, stack = cPickle.loads(payload)
+            except Exception, e:
+                exc_value, stack = e, ''
+            remote_exc = RemoteException(exc_value, stack, job._funcname)
+            job.throw(remote_exc.__class__, remote_exc, None)
+
+
+    def _handle_closed(self, expected):
+        # Member closed its end of the results pipe, so it's exiting.  If it
+        # hasn't been reaped yet, the supervisor will call us on SIGCHLD.
+        self._check_dead()
+
+
+    def _check_dead(self, *args):
+        """
+        Reaps the member process if it has terminated.  Invoked by the
+        supervisor on SIGCHLD.
+        """
+        if self.exitcode is not None:
+            return
+        try:
+            pid, status = os.waitpid(self.pid, os.WNOHANG)
+        except OSError:
+            # Already reaped by someone else.
+            pid, status = self.pid, None
+        if pid == 0:
+            # Still running.
+            return
+
+        if status is None:
+            self.exitcode = -1
+        elif os.WIFSIGNALED(status):
+            self.exitcode = -os.WTERMSIG(status)
+        else:
+            self.exitcode = os.WEXITSTATUS(status)
+        log.debug('process pool member "%s" exited, pid=%d exitcode=%d', self.name, self.pid, self.exitcode)
+
+        supervisor.unregister(self)
+        self.idle_timer.stop()
+        self._jobs.close(immediate=True)
+        self._results.close(immediate=True)
+        job, self.job = self.job, None
+        self.pool._handle_member_exited(self)
+        if job:
+            job._member = None
+            if not job.finished:
+                exc = SystemError('Process pool member died (exitcode=%d) while executing job' % self.exitcode)
+                job.throw(SystemError, exc, None)
+        self._in_progress.finish(self.exitcode)
+
+
+    def kill(self):
+        """
+        Terminates the member immediately, discarding any job in progress.
+        """
+        if self.exitcode is None:
+            try:
+                os.kill(self.pid, signal.SIGKILL)
+            except OSError:
+                pass
+
+
+    @coroutine(policy=POLICY_SINGLETON)
+    def stop(self, wait=3.0):
+        """
+        Stops the member process by closing its job pipe, and terminates it
+        forcefully if it does not exit within *wait* seconds.
+        """
+        if self.exitcode is not None:
+            yield
+
+        # Closing the job pipe causes the member to exit once it's done with
+        # any job it's executing.
+        self._jobs.close(immediate=True)
+        yield InProgressAny(self._in_progress, delay(wait))
+        for sig, pause in ((signal.SIGTERM, wait), (signal.SIGKILL, wait * 2)):
+            if self.exitcode is not None:
+                yield
+            try:
+                os.kill(self.pid, sig)
+            except OSError:
+                self._check_dead()
+            else:
+                yield InProgressAny(self._in_progress, delay(pause))
+
+        if self.exitcode is None:
+            exc = SystemError('Process pool member (pid=%d) refuses to die even after SIGKILL' % self.pid)
+            self._in_progress.throw(SystemError, exc, None)
+            raise exc
+
+
+
+class ProcessPool(object):
+    """
+    Manages a pool of one or more forked processes for use with the
+    :func:`@kaa.processed() <kaa.processed>` decorator, or
+    :class:`~kaa.ProcessPoolCallable` objects.
+
+    Process pools are the counterpart of :class:`~kaa.ThreadPool` for
+    CPU-bound jobs, which do not benefit from threads because of the global
+    interpreter lock.  Jobs are executed in pool member processes which are
+    forked on demand, and are queued by priority just as with
+    :meth:`ThreadPool.enqueue() <kaa.ThreadPool.enqueue>`.
+
+    ProcessPool objects may be assigned a name by calling
+    :func:`kaa.register_process_pool`.  When done, the name can be referenced
+    instead of passing the ProcessPool object.
+
+    A process pool is managed by the main loop, and members are stopped when
+    the main loop shuts down.
+    """
+    def __init__(self, size=None, max_jobs=None):
+        """
+        :param size: maximum number of processes this pool will grow to; if
+                     None, the number of CPUs is used.
+        :type size: int
+        :param max_jobs: number of jobs after which a member process is
+                         replaced by a new one, or None to keep members alive
+                         indefinitely (subject to :attr:`timeout`).
+        :type max_jobs: int
+        """
+        if size is None:
+            try:
+                size = get_num_cpus()
+            except RuntimeError:
+                size = 1
+        self._size = size
+        self._max_jobs = max_jobs
+        # List of _ProcessPoolMember objects for this pool.
+        self._members = []
+        # Work queue of ProcessInProgress objects, sorted by priority.
+        self._queue = []
+        # Seconds an idle member waits for a job before stopping.
+        self._timeout = 30
+        # Process pool name.  Set using register_process_pool()
+        self._name = None
+        # Counter used to name members.
+        self._nspawned = 0
+
+
+    def __repr__(self):
+        if not self._name:
+            return '<Anonymous ProcessPool object at 0x%x>' % id(self)
+        else:
+            return '<ProcessPool "%s" object at 0x%x>' % (self._name, id(self))
+
+
+    def _spawn(self):
+        self._nspawned += 1
+        member = _ProcessPoolMember(self, '%s#%d' % (self._name, self._nspawned))
+        self._members.append(member)
+        return member
+
+
+    def _retire(self, member):
+        """
+        Removes the given member from the pool and stops it.
+        """
+        if member in self._members:
+            self._members.remove(member)
+        member.idle_timer.stop()
+        member.stop()
+
+
+    def _dispatch(self):
+        """
+        Hands queued jobs to idle members, forking new members as needed
+        within the size limit.
+        """
+        while self._queue:
+            job = self._queue[0]
+            idle = [m for m in self._members if not m.job and not m.retiring and m.alive]
+            # Members forked before the job's callable was registered don't
+            # know about it.
+            if job._registered:
+                idle_known = [m for m in idle if m.ncallables > job._registered.idx]
+            else:
+                idle_known = idle
+            member = (idle_known or [None])[0]
+            if not member:
+                if idle:
+                    # Replace a stale idle member with a fresh one.
+                    self._retire(idle[0])
+                if len(self._members) >= self._size:
+                    break
+                try:
+                    member = self._spawn()
+                except OSError:
+                    self._queue.pop(0)
+                    job._pool = None
+                    job.throw()
+                    continue
+
+            self._queue.pop(0)
+            job._pool = None
+            try:
+                member.run(job)
+            except Exception:
+                # Most likely the arguments are not picklable.
+                member.idle_timer.start(self._timeout)
+                job.throw()
+
+
+    def _handle_member_idle(self, member):
+        if member.retiring:
+            self._retire(member)
+        elif self._max_jobs and member.jobs_done >= self._max_jobs:
+            log.debug('process pool member "%s" completed %d jobs, recycling', member.name, member.jobs_done)
+            self._retire(member)
+        elif member in self._members:
+            member.idle_timer.start(self._timeout)
+        self._dispatch()
+
+
+    def _handle_member_exited(self, member):
+        if member in self._members:
+            self._members.remove(member)
+        self._dispatch()
+
+
+    def _handle_idle_timeout(self, member):
+        if not member.job:
+            self._retire(member)
+
+
+    def enqueue(self, callback, priority=0):
+        """
+        Creates a job from the given callback and adds it to the process pool
+        work queue.
+
+        :param callback: a callable which will be invoked inside one of the
+                         pool processes.
+        :type callback: callable
+        :param priority: determines the relative priority of the job; higher
+                         values are higher priority.
+        :type priority: int
+        :returns: a :class:`~kaa.ProcessInProgress` object for this job.
+
+        It should generally not be necessary to call this method directly.
+        It is called implicitly when using the :func:`@kaa.processed() <kaa.processed>`
+        decorator, or :class:`~kaa.ProcessPoolCallable` objects.
+        """
+        if not isinstance(callback, ProcessInProgress):
+            callback = ProcessInProgress(callback)
+
+        callback.priority = priority
+        if not CoreThreading.is_mainthread():
+            # Members are managed by the main loop.
+            MainThreadCallable(self._enqueue)(callback)
+        else:
+            self._enqueue(callback)
+        return callback
+
+
+    def _enqueue(self, job):
+        if job.finished:
+            # Aborted before we got it.
+            return
+        job._pool = self
+        self._queue.append(job)
+        self._queue.sort(key=lambda job: job.priority, reverse=True)
+        self._dispatch()
+
+
+    def dequeue(self, job):
+        """
+        Removes the given job from the process pool queue.
+
+        :param job: the job as returned by :meth:`~kaa.ProcessPool.enqueue`
+        :type job: :class:`~kaa.ProcessInProgress` object
+        :returns: True if the job existed and was removed, and False if the
+                  job was not found.
+        """
+        try:
+            self._queue.remove(job)
+        except ValueError:
+            return False
+        job._pool = None
+        return True
+
+
+    @property
+    def size(self):
+        """
+        The maximum number of processes this pool may grow to.
+
+        If this value is decreased and there are too many pool members as a
+        result, idle members are stopped immediately, and busy members are
+        stopped once their current job completes.
+        """
+        return self._size
+
+    @size.setter
+    def size(self, value):
+        self._size = value
+        for member in sorted(self._members, key=lambda m: m.job is not None)[value:]:
+            if member.job:
+                # Retire once the job is done.
+                member.retiring = True
+            else:
+                self._retire(member)
+        self._dispatch()
+
+
+    @property
+    def max_jobs(self):
+        """
+        Number of jobs a member process executes before it is replaced by a
+        newly forked one, or None if members are never recycled.
+
+        Recycling members bounds the effect of memory leaks or fragmentation
+        in long-running jobs.
+        """
+        return self._max_jobs
+
+    @max_jobs.setter
+    def max_jobs(self, value):
+        self._max_jobs = value
+
+
+    @property
+    def timeout(self):
+        """
+        Number of seconds a pool member will wait for a job before stopping.
+
+        A new member will be forked if new jobs are enqueued.
+        """
+        return self._timeout
+
+    @timeout.setter
+    def timeout(self, value):
+        self._timeout = value
+
+
+    @property
+    def name(self):
+        """
+        The name under which this process pool was registered.
+
+        Process pools are registered via :func:`kaa.register_process_pool`.
+        """
+        return self._name
+
+
+
+def processed(pool=None, priority=0, async=True):
+    """
+    Decorator causing the decorated function to be executed within a forked
+    process of a :class:`~kaa.ProcessPool` when invoked.
+
+    :param pool: a :class:`~kaa.ProcessPool` object or name of a registered
+                 process pool; if None, a default pool sized to the number
+                 of CPUs is used.
+    :type pool: :class:`~kaa.ProcessPool`, str, or None
+    :param priority: priority for the job in the process pool
+    :type priority: int
+    :param async: if False, blocks until the decorated function completes
+    :type async: bool
+    :returns: :class:`~kaa.ProcessInProgress` if ``async=True``, or the return
+              value of the decorated function if ``async=False``
+
+    This decorator is the counterpart of :func:`@kaa.threaded() <kaa.threaded>`
+    for CPU-bound functions.  Arguments and the return value are pickled,
+    while the decorated function itself is inherited by the forked pool
+    members.  Exceptions raised by the function are raised to the caller
+    as :class:`~kaa.processpool.RemoteException`, which includes the
+    traceback from the pool member.
+    """
+    def decorator(func):
+        callback = ProcessPoolCallable((pool, priority), func)
+
+        @wraps(func)
+        def newfunc(*args, **kwargs):
+            in_progress = callback(*args, **kwargs)
+            if not async:
+                return in_progress.wait()
+            return in_progress
+
+        # Boilerplate for @kaa.generator
+        newfunc.decorator = processed
+        newfunc.origfunc = func
+        newfunc.redecorate = lambda: processed(pool, priority, async)
+        return newfunc
+
+    return decorator
@@ -0,0 +1,198 @@
+# -*- coding: iso-8859-1 -*-
+# -----------------------------------------------------------------------------
+# profiler.py - Main loop profiler
+# -----------------------------------------------------------------------------
+# kaa.base - The Kaa Application Framework
+# Copyright 2005-2012 Dirk Meyer, Jason Tackaberry, et al.
+#
+# Please see the file AUTHORS for a complete list of authors.
+#
+# This library is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License version
+# 2.1 as published by the Free Software Foundation.
+#
+# This library is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301 USA
+#
+# -----------------------------------------------------------------------------
+
+"""
+Main loop profiler
+
+The profiler records where the time of each main loop step goes (waiting in
+select, timer callbacks, IO callbacks, callables queued from other threads
+and external dispatchers), and which callbacks block the main loop for longer
+than a given threshold.  It is enabled with :func:`kaa.main.profile`.
+"""
+from __future__ import absolute_import
+
+__all__ = [ 'MainLoopProfiler' ]
+
+# python imports
+import time
+import logging
+
+# kaa imports
+from .utils import Histogram
+from .callable import Callable
+from .core import CoreThreading
+
+# get logging object
+log = logging.getLogger('kaa.base.core.main')
+
+# Categories of work done in a main loop step.
+CATEGORIES = ('wait', 'timers', 'io', 'run_queue', 'dispatch')
+
+
+def _qualname(callback):
+    """
+    Returns a descriptive name for the given notifier callback, like
+    ``kaa.base.io.IOChannel._handle_read``.
+    """
+    # Unwrap Callables (timers, IOMonitors) to get to the user callback.
+    while isinstance(callback, Callable):
+        func = callback._get_func()
+        if func is None:
+            return '<dead weak callable>'
+        callback = func
+
+    name = getattr(callback, '__name__', None)
+    if name is None:
+        return repr(callback)
+    if getattr(callback, 'im_class', None):
+        return '%s.%s.%s' % (callback.im_class.__module__, callback.im_class.__name__, name)
+    return '%s.%s' % (getattr(callback, '__module__', '?'), name)
+
+
+
+class MainLoopProfiler(object):
+    """
+    Collects timing statistics about main loop steps.
+
+    Only the generic (default) main loop implementation supports profiling.
+    Time spent in nested main loop steps (e.g. when a callback calls
+    :meth:`kaa.InProgress.wait`) is accounted to the outer callback as well.
+    """
+    def __init__(self, threshold=0.05, interval=None):
+        """
+        :param threshold: callbacks taking longer than this many seconds are
+                          logged and recorded as slow callbacks.
+        :type threshold: float
+        :param interval: if not None, a summary is logged every *interval*
+                         seconds.
+        :type interval: float
+        """
+        self.threshold = threshold
+        self.interval = interval
+        self.reset()
+
+
+    def reset(self):
+        """
+        Discards all collected statistics.
+        """
+        #: Number of main loop steps profiled.
+        self.steps = 0
+        #: :class:`~kaa.utils.Histogram` of the total duration of each step,
+        #: excluding the time waiting for events.
+        self.step_time = Histogram()
+        #: Dict mapping category name (``wait``, ``timers``, ``io``,
+        #: ``run_queue`` and ``dispatch``) to a :class:`~kaa.utils.Histogram`
+        #: of the per-step time spent in that category.
+        self.histograms = dict((category, Histogram()) for category in CATEGORIES)
+        #: Dict mapping callback name to a list [count, total, max] for
+        #: callbacks which exceeded the threshold.
+        self.slow = {}
+        self._last_summary = self._started = time.time()
+        # Per-step time spent in each category.
+        self._step = dict.fromkeys(CATEGORIES, 0.0)
+
+
+    def _invoke(self, category, callback, *args):
+        """
+        Invokes a notifier callback, accounting its run time to the given
+        category.  Called by the notifier.
+        """
+        if category == 'io' and callback == CoreThreading.run_queue:
+            category = 'run_queue'
+        t0 = time.time()
+        try:
+            return callback(*args)
+        finally:
+            duration = time.time() - t0
+            self._step[category] += duration
+            if duration >= self.threshold:
+                name = _qualname(callback)
+                log.warning('%s callback %s blocked the main loop for %.3f seconds', category, name, duration)
+                stats = self.slow.setdefault(name, [0, 0.0, 0.0])
+                stats[0] += 1
+                stats[1] += duration
+                stats[2] = max(stats[2], duration)
+
+
+    def _waited(self, duration):
+        # Called by the notifier after waiting for events.
+        self._step['wait'] += duration
+
+
+    def _step_done(self):
+        # Called by the notifier at the end of each step.
+        step = self._step
+        self.steps += 1
+        busy = 0.0
+        for category, duration in step.items():
+            self.histograms[category].add(duration)
+            if category != 'wait':
+                busy += duration
+            step[category] = 0.0
+        self.step_time.add(busy)
+
+        if self.interval is not None:
+            now = time.time()
+            if now - self._last_summary >= self.interval:
+                self._last_summary = now
+                log.info('Main loop profile:\n%s', self.summary())
+
+
+    def stats(self):
+        """
+        Returns the collected statistics as a dict.
+
+        The dict contains the keys ``steps`` (number of steps), ``elapsed``
+        (seconds since profiling started or was last reset), ``time``
+        (dict mapping category name to total seconds) and ``slow`` (list
+        of (name, count, total, max) tuples for slow callbacks, slowest
+        first).
+        """
+        slow = sorted([(name,) + tuple(stats) for name, stats in self.slow.items()],
+                      key=lambda item: item[3], reverse=True)
+        return {
+            'steps': self.steps,
+            'elapsed': time.time() - self._started,
+            'time': dict((category, hist.total) for category, hist in self.histograms.items()),
+            'slow': slow
+        }
+
+
+    def summary(self):
+        """
+        Returns a human readable summary of the collected statistics.
+        """
+        stats = self.stats()
+        lines = ['%d steps in %.1f seconds' % (stats['steps'], stats['elapsed'])]
+        for category in CATEGORIES:
+            hist = self.histograms[category]
+            if not hist.count:
+                continue
+            lines.append('  %-10s total=%.3fs mean=%.6fs p99=%.6fs max=%.6fs' % \
+                         (category, hist.total, hist.mean, hist.percentile(99), hist.max))
+        for name, count, total, maximum in stats['slow'][:10]:
+            lines.append('  slow: %s called %d times, total=%.3fs max=%.3fs' % (name, count, total, maximum))
+        return '\n'.join(lines)
@@ -91,6 +91,8 @@ __min_timer = None
 __in_step = False
 __step_depth = 0
 __step_depth_max = 0
+# MainLoopProfiler object when profiling (see kaa.main.profile)
+__profiler = None
 
 _options = {
 	'recursive_depth' : 2,
@@ -142,6 +144,12 @@ def dispatcher_add( method ):
 
 dispatcher_remove = dispatch.dispatcher_remove
 
+def profiler_set( profiler ):
+	"""Sets the profiler object which is informed about the time spent in
+	each step, or None to disable profiling."""
+	global __profiler
+	__profiler = profiler
+
 
 def step( sleep = True, external = True, simulate = False ):
 	"""Do one step forward in the main loop. First all timers are checked for
@@ -157,6 +165,7 @@ def step( sleep = True, external = True, simulate = False ):
 
 	__in_step = True
 	__step_depth += 1
+	prof = __profiler
 
 	try:
 		if __step_depth > __step_depth_max:
@@ -191,6 +200,8 @@ def step( sleep = True, external = True, simulate = False ):
 
 		# wait for event
 		sockets_ready = None
+		if prof:
+			t0 = time()
 		if __sockets[ IO_READ ] or __sockets[ IO_WRITE ] or __sockets[ IO_EXCEPT ]:
 			try:
 				sockets_ready = select( __sockets[ IO_READ ].keys(), __sockets[ IO_WRITE ].keys(),
@@ -200,6 +211,8 @@ def step( sleep = True, external = True, simulate = False ):
 					raise e
 		elif timeout:
 			time_sleep(timeout / 1000.0)
+		if prof:
+			prof._waited( time() - t0 )
 
 		if simulate:
 			# we only simulate
@@ -218,7 +231,11 @@ def step( sleep = True, external = True, simulate = False ):
 				# prevent infinite recursion in case the callback calls
 				# step().
 				timer[ TIMESTAMP ] = 0
-				if not timer[ CALLBACK ]():
+				if prof:
+					ret = prof._invoke( 'timers', timer[ CALLBACK ] )
+				else:
+					ret = timer[ CALLBACK ]()
+				if not ret:
 					if i in __timers:
 						del __timers[ i ]
 				else:
@@ -252,15 +269,26 @@ def step( sleep = True, external = True, simulate = False ):
 					# list and therefore sock is not in __sockets[ condition ]
 					# anymore.
 					callback = __sockets[ condition ].get(sock)
-					if callback is not None and not callback( sock ):
+					if callback is None:
+						continue
+					if prof:
+						ret = prof._invoke( 'io', callback, sock )
+					else:
+						ret = callback( sock )
+					if not ret:
 						socket_remove( sock, condition )
 		
 		# handle external dispatchers
 		if external:
-			dispatch.dispatcher_run()
+			if prof:
+				prof._invoke( 'dispatch', dispatch.dispatcher_run )
+			else:
+				dispatch.dispatcher_run()
 	finally:
 		__step_depth -= 1
 		__in_step = False
+		if prof and not __step_depth:
+			prof._step_done()
 
 def loop():
 	"""Executes the 'main loop' forever by calling step in an endless loop"""
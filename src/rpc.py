@@ -92,7 +92,8 @@
 # -----------------------------------------------------------------------------
 from __future__ import absolute_import
 
-__all__ = [ 'Server', 'Client', 'expose' ]
+__all__ = [ 'Server', 'Client', 'ClientPool', 'expose', 'register_serializer', 'get_dispatcher',
+            'Metrics' ]
 
 # python imports
 import types
@@ -100,29 +101,141 @@ import socket
 import logging
 import cPickle
 import pickle
+import marshal
 import struct
 import sys
 import hashlib
 import time
 import traceback
 import os
+import collections
+import mmap
+import stat
+import tempfile
+import zlib
 
 # kaa imports
 import kaa
-from .utils import property
-from .strutils import py3_b, bl
+from .utils import property, Histogram
+from .strutils import py3_b, py3_str, bl
 from .core import Object, CoreThreading
+from .generator import Generator
+from .thread import ThreadPool, ThreadPoolCallable, register_thread_pool, get_thread_pool
 from .errors import make_exception_class, AsyncExceptionBase
 from .main import is_shutting_down
+from .io import _ReadQueue
+from .framing import LengthPrefixCodec
 
 # get logging object
 log = logging.getLogger('kaa.base.rpc')
 
 # Global constants
 RPC_PACKET_HEADER_SIZE = struct.calcsize("I4sI")
+# Packets consist of a header holding the sequence number, packet type and
+# payload length, followed by the payload.  Before authentication, only small
+# auth packets are expected.
+_packet_codec = LengthPrefixCodec('I4sI', 2)
+_auth_packet_codec = LengthPrefixCodec('I4sI', 2, max_length=1024)
 # Protocol compatible between Python 2 and 3.  (Well, quasi-compatible, there
 # are some issues due to the str/unicode changes in 3.)
 PICKLE_PROTOCOL = 2
+# Packets at least this large are written on their own rather than being
+# copied to coalesce them with other packets.
+RPC_COALESCE_SIZE = 64 * 1024
+# Payloads larger than this are sent in fragments of this size, so that
+# packets of higher priority can be sent in between.
+RPC_FRAGMENT_SIZE = 64 * 1024
+# Maximum amount of data handed to the socket at once while packets are
+# waiting to be sent.  Once written, the next packets are chosen by priority.
+RPC_SEND_ROUND_SIZE = 256 * 1024
+# Bit set in the sequence number of packets whose payload is compressed with
+# zlib.  Sequence numbers of calls stay below it.
+RPC_COMPRESSED = 0x80000000
+# Payloads at least this large are compressed in a thread rather than in the
+# main loop.
+RPC_COMPRESS_THREAD_SIZE = 1024 * 1024
+# Thread pool compressing large payloads, and its number of threads.
+RPC_COMPRESS_POOL = 'kaa.rpc::compress'
+RPC_COMPRESS_THREADS = 2
+# zlib compression level, favouring speed.
+RPC_COMPRESS_LEVEL = 1
+# Priority of control packets (SRLZ, SHMR, SHMA, CNCL and CRDT), which are
+# sent ahead of calls and results of any priority.
+RPC_CONTROL_PRIORITY = float('inf')
+# Header of SHMP packets: the type of the packet whose payload is in the
+# shared memory ring, and the payload's position and length in the ring.
+_shm_packet = struct.Struct('4sQI')
+
+# Number of items of a streamed result which may be sent before the receiver
+# grants more credits.
+RPC_STREAM_WINDOW = 16
+
+
+def _pickle_serializer(protocol):
+    dumps = lambda obj: cPickle.dumps(obj, protocol)
+    return 'pickle%d' % protocol, dumps, cPickle.loads
+
+
+def _fallback_serializer(name, dumps, loads):
+    """
+    Wraps the given codec so that objects it fails to serialize are pickled
+    instead.  Payloads are prefixed with a byte telling which was used.
+    """
+    def fallback_dumps(obj):
+        try:
+            return bl('S') + dumps(obj)
+        except Exception:
+            return bl('P') + cPickle.dumps(obj, PICKLE_PROTOCOL)
+
+    def fallback_loads(data):
+        if data[:1] == bl('S'):
+            return loads(data[1:])
+        return cPickle.loads(data[1:])
+
+    return name, fallback_dumps, fallback_loads
+
+
+# Serializers for RPC payloads in order of preference.  Each channel encodes
+# its payloads with the first serializer the peer supports (see
+# Channel._handle_serializers).  The marshal format depends on the Python
+# version, so both are part of the name.
+_serializers = [
+    _fallback_serializer('marshal-py%d-v%d' % (sys.version_info[0], marshal.version),
+                         marshal.dumps, marshal.loads)
+] + [
+    _pickle_serializer(protocol) for protocol in range(cPickle.HIGHEST_PROTOCOL, PICKLE_PROTOCOL - 1, -1)
+]
+
+# Serializer used until the peer has announced which ones it supports.  Peers
+# predating serializer negotiation only understand this one.
+_default_serializer = _serializers[-1]
+
+
+def register_serializer(name, dumps, loads):
+    """
+    Registers a codec for RPC payloads.
+
+    :param name: unique name of the codec, which must not contain ``,`` or
+                 ``;``.  Both ends of a channel must register the codec
+                 under the same name for it to be used.
+    :type name: str
+    :param dumps: callable taking an object and returning a string; it may
+                  raise for objects it cannot serialize, which are then
+                  pickled instead.
+    :param loads: callable taking a string returned by *dumps* and returning
+                  the object.
+
+    When both ends of a channel support it, a registered codec is preferred
+    over the built-in ones (marshal, which handles plain data such as
+    strings, numbers, lists and dicts, and pickle).  Only channels opened
+    after registration will use the codec.
+    """
+    if ',' in name or ';' in name:
+        raise ValueError('Invalid serializer name %r' % name)
+    for serializer in _serializers[:]:
+        if serializer[0] == name:
+            _serializers.remove(serializer)
+    _serializers.insert(0, _fallback_serializer(name, dumps, loads))
 
 
 class RemoteException(AsyncExceptionBase):
@@ -157,7 +270,20 @@ class Server(Object):
     address specifies what address to bind the socket to, and this argument
     must correspond to the ``bind_info`` argument of :meth:`kaa.Socket.listen`.
 
-    See kaa.Socket.buffer_size docstring for information on buffer_size.
+    See kaa.Socket.buffer_size docstring for information on buffer_size, and
+    :meth:`kaa.Socket.listen` for backlog and reuseport.
+
+    If shm_size is given and address is a unix socket, payloads larger than
+    RPC_FRAGMENT_SIZE are passed to clients through a shared memory ring of
+    that many bytes (see :ref:`rpc-shm`).
+
+    If compress_threshold is given, payloads of at least that many bytes
+    sent to clients are compressed (see :ref:`rpc-compression`).
+
+    If metrics is True (or a :class:`~kaa.rpc.Metrics` object to share),
+    statistics about the calls made and handled by the server's channels
+    are collected in the :attr:`metrics` attribute, and the peers may get
+    them with the ``__stats__`` command.
     """
     __kaasignals__ = {
         'client-connected':
@@ -171,14 +297,20 @@ class Server(Object):
 
             '''
     }
-    def __init__(self, address, auth_secret = '', buffer_size=None):
+    def __init__(self, address, auth_secret = '', buffer_size=None, backlog=None, reuseport=False,
+                 metrics=False, shm_size=0, compress_threshold=None):
         super(Server, self).__init__()
         self._auth_secret = py3_b(auth_secret)
         self._socket = kaa.Socket(buffer_size=buffer_size)
-        self._socket.listen(address)
+        self._socket.listen(address, backlog=backlog, reuseport=reuseport)
         self._socket.signals['new-client'].connect_weak(self._new_connection)
 
         self.objects = []
+        self._shm_size = shm_size
+        self._compress_threshold = compress_threshold
+        self.metrics = _get_metrics(metrics)
+        if self.metrics:
+            self.register(self.metrics)
 
     def _new_connection(self, client_sock):
         """
@@ -187,6 +319,9 @@ class Server(Object):
         log.debug("New connection %s", client_sock)
         client_sock.buffer_size = self._socket.buffer_size
         client = Channel(sock = client_sock, auth_secret = self._auth_secret)
+        client._metrics = self.metrics
+        client._shm_size = self._shm_size
+        client._compress_threshold = self._compress_threshold
         for obj in self.objects:
             client.register(obj)
         client._send_auth_challenge()
@@ -257,12 +392,56 @@ class Channel(Object):
         self._socket.chunk_size = 1024
         # Buffer containing packets deferred until after authentication.
         self._write_buffer_deferred = []
-        self._read_buffer = []
+        # Received data not yet decoded into packets.
+        self._read_buffer = _ReadQueue()
+        # Packets waiting to be written, by priority.  Each is a list [data,
+        # offset, seq, packet_type], where packet_type is None if data is a
+        # complete packet, or otherwise data is a payload to be sent in
+        # fragments, of which the first offset bytes have been sent.
+        self._send_queues = {}
+        # Total size of queued packets, and of those not sent in fragments.
+        self._send_queued = 0
+        self._write_pending_size = 0
+        # True while waiting for a write to finish before sending more.
+        self._sending = False
+        self._flush_timer = kaa.OneShotTimer(self._flush_writes)
+        # Stack of active batches (see batch()).
+        self._batches = []
         self._callbacks = {}
         self._next_seq = 1
         self._rpc_in_progress = {}
+        # Streamed results being received (_RemoteStream) and sent
+        # (_StreamCredits), by sequence number.
+        self._streams_in = {}
+        self._streams_out = {}
+        # Calls received whose result is not yet known, by sequence number:
+        # tuples (InProgress, deadline timer or None).
+        self._calls_in = {}
+        # Metrics object if statistics are collected, and the statistics and
+        # start time of received calls not yet answered, by sequence number.
+        self._metrics = None
+        self._calls_timed = {}
+        # Size of the shared memory ring to offer to peers on the same host,
+        # the ring offered to the peer until it acknowledges, and the rings
+        # used for payloads sent and received.
+        self._shm_size = 0
+        self._shm_offered = self._shm_out = self._shm_in = None
+        # Minimum size of payloads to compress, or None, and whether the peer
+        # can decompress them.
+        self._compress_threshold = None
+        self._peer_decompresses = False
+        # Packets waiting for a packet of the same call being compressed in
+        # a thread, by sequence number.
+        self._compressing = {}
+        # Fragments of packets being received, by (packet type, seq).
+        self._fragments = {}
+        # Whether the peer supports SRLZ packets and streamed results.
+        self._peer_negotiates = False
+        # InProgress of the last write to the socket.
+        self._last_write = None
         self._auth_secret = py3_b(auth_secret)
         self._pending_challenge = None
+        self._reset_serializers()
 
         # Creates a circular reference so that RPC channels survive even when
         # there is no reference to them.  (Servers may not hold references to
@@ -277,6 +456,18 @@ class Channel(Object):
         return self._socket.connected and self._connect_inprogress.finished
 
 
+    @property
+    def serializer(self):
+        """
+        Name of the serializer used for payloads sent to the peer.
+
+        Channels start out with protocol 2 pickles, and switch to the first
+        serializer in order of preference (see :func:`register_serializer`)
+        also supported by the peer once it has authenticated.
+        """
+        return self._serializer_out[0]
+
+
     def register(self, obj):
         """
         Registers one or more previously exposed callables to the peer
@@ -301,6 +492,16 @@ class Channel(Object):
     def rpc(self, cmd, *args, **kwargs):
         """
         Call the remote command and return InProgress.
+
+        The keyword argument ``_priority`` is not passed to the remote
+        command, but sets the priority with which the call is sent (see
+        :func:`expose`).
+
+        Aborting the returned InProgress cancels the call on the remote side.
+        The keyword argument ``_timeout`` gives the number of seconds after
+        which the call is aborted with :class:`~kaa.TimeoutException`; the
+        remote side stops working on the call once the timeout expires as
+        well.
         """
         if not CoreThreading.is_mainthread():
             # create InProgress object and return
@@ -313,20 +514,76 @@ class Channel(Object):
             raise NotConnectedError()
 
         seq = self._next_seq
-        self._next_seq += 1
+        # Wrap around below RPC_COMPRESSED, skipping 0.
+        self._next_seq = seq % (RPC_COMPRESSED - 1) + 1
         # create InProgress object
         callback = kwargs.pop('_kaa_rpc_callback', kaa.InProgress())
-        payload = cPickle.dumps((cmd, args, kwargs), PICKLE_PROTOCOL)
-        self._send_packet(seq, 'CALL', payload)
-        # callback with error handler
+        priority = kwargs.pop('_priority', 0)
+        timeout = kwargs.pop('_timeout', None)
+        call = (cmd, args, kwargs)
+        if timeout is not None and self._peer_negotiates:
+            # The remote side aborts the call after the timeout.
+            call += (timeout,)
+        if self._metrics:
+            started = time.time()
+            payload = self._serializer_out[1](call)
+            stats = self._metrics.outgoing[cmd]
+            stats.serialize_time.add(time.time() - started)
+            stats._begin(len(payload))
+            callback.connect(stats._end, started, False).ignore_caller_args = True
+            callback.exception.connect(stats._end, started, True).ignore_caller_args = True
+        else:
+            payload = self._serializer_out[1](call)
+        # callback with error handler, registered first in case the write
+        # fails and closes the channel
         self._rpc_in_progress[seq] = (callback, cmd)
+        try:
+            self._send_packet(seq, 'CALL', payload, priority)
+        except:
+            self._rpc_in_progress.pop(seq, None)
+            raise
+        callback.signals['abort'].connect(self._cancel_call, seq)
+        if timeout is not None:
+            timer = kaa.OneShotTimer(self._expire_call, callback, cmd, timeout)
+            timer.start(timeout)
+            callback.connect(timer.stop).ignore_caller_args = True
+            callback.exception.connect(timer.stop).ignore_caller_args = True
+        if self._batches:
+            self._batches[-1]._calls.append(callback)
         return callback
 
 
+    def batch(self):
+        """
+        Returns a context manager which sends all RPC calls made within it
+        together.
+
+        :returns: a :class:`~kaa.rpc.Batch` object; ``kaa.inprogress(batch)``
+                  returns an :class:`~kaa.InProgressAll` for the results of
+                  the calls made within the batch.
+
+        Calls made within the batch, either through the batch's or the
+        channel's :meth:`rpc` method, are sent when the batch exits::
+
+            with client.batch() as batch:
+                for name in names:
+                    batch.rpc('lookup', name)
+            for ip in (yield kaa.inprogress(batch)):
+                print(ip.result)
+
+        Calls made in the same main loop step are coalesced anyway, so
+        batches are only needed to collect the results, or if the main loop
+        is reentered while issuing the calls.  Batches must be used from the
+        main thread.
+        """
+        return Batch(self)
+
+
     def close(self):
         """
         Forcefully close the RPC channel.
         """
+        self._flush_writes(everything=True)
         self._socket.close()
 
 
@@ -334,12 +591,150 @@ class Channel(Object):
         return self._connect_inprogress
 
 
-    def _write(self, data):
+    def _write(self, data, priority=0, seq=None, packet_type=None):
+        """
+        Queues data to be written to the channel.
+
+        If packet_type is given, data is the payload of a packet of that type
+        to be sent in fragments, otherwise data is written as is.  seq is the
+        packet's sequence number, or None if data is not a single packet.
+
+        If the socket has no writes pending, data is handed to it right
+        away.  Otherwise packets written during a main loop step are
+        coalesced and written to the socket once the step is done, or when
+        the outermost batch exits.  As with :meth:`kaa.IOChannel.write`,
+        ValueError is raised if data not sent in fragments would exceed the
+        socket's write queue limit.
+        """
+        if packet_type is None:
+            if self._socket.write_queue_used + self._write_pending_size + len(data) > self._socket.queue_size:
+                raise ValueError('Data would exceed write queue limit')
+            self._write_pending_size += len(data)
+        idle = not self._send_queues and not self._socket.write_queue_used
+        self._send_queues.setdefault(priority, collections.deque()).append([data, 0, seq, packet_type])
+        self._send_queued += len(data)
+        if self._batches or self._sending:
+            # Written when the batch exits or the current write is done.
+            return
+        if idle:
+            # Nothing to coalesce with.  Packets written after this one
+            # during the step find it in the socket's write queue.
+            self._flush_writes()
+        elif not self._flush_timer.active:
+            # A zero timeout also keeps the notifier from blocking before
+            # the packets are written.
+            self._flush_timer.start(0)
+
+
+    def _flush_writes(self, everything=False):
+        """
+        Writes pending packets to the socket, highest priority first.
+
+        Unless everything is True, about RPC_SEND_ROUND_SIZE bytes are
+        written, and the remaining packets once that write is done, so that
+        packets queued in the meantime may overtake them.
+        """
+        if self._flush_timer.active:
+            self._flush_timer.stop()
+        if self._batches or (self._sending and not everything):
+            return
+        queues = self._send_queues
+        pieces = []
+        size = 0
+        while queues and (everything or size < RPC_SEND_ROUND_SIZE):
+            priority = max(queues)
+            queue = queues[priority]
+            entry = queue[0]
+            data, offset, seq, packet_type = entry
+            if packet_type is None:
+                if pieces and len(data) >= RPC_COALESCE_SIZE:
+                    # Don't copy large packets to coalesce them; write them
+                    # in the next round.
+                    break
+                pieces.append(data)
+                self._write_pending_size -= len(data)
+            elif not offset and self._shm_out and self._write_shared(data, seq, packet_type, pieces):
+                pass
+            elif len(data) - offset > RPC_FRAGMENT_SIZE:
+                # The fragment's payload is prefixed with the packet type
+                # of the final fragment.
+                fragment = data[offset:offset + RPC_FRAGMENT_SIZE]
+                pieces.append(struct.pack('I4sI', seq, 'FRAG', len(fragment) + 4) + packet_type)
+                pieces.append(fragment)
+                entry[1] += len(fragment)
+                size += len(fragment)
+                self._send_queued -= len(fragment)
+                continue
+            else:
+                # Final fragment
+                data = data[offset:]
+                pieces.append(struct.pack('I4sI', seq, packet_type, len(data)))
+                pieces.append(data)
+            size += len(data)
+            self._send_queued -= len(data)
+            queue.popleft()
+            if not queue:
+                del queues[priority]
+
+        if not pieces:
+            return
+        ip = self._write_socket(pieces[0] if len(pieces) == 1 else bl('').join(pieces))
+        if queues and ip:
+            self._sending = True
+            ip.connect(self._write_done).ignore_caller_args = True
+
+
+    def _write_barrier(self):
+        """
+        Moves all queued packets to the queue of control packets, so that
+        they are sent, in order of priority, before any packet queued next.
+        """
+        queues = self._send_queues
+        for priority in sorted(queues, reverse=True):
+            if priority != RPC_CONTROL_PRIORITY:
+                queues.setdefault(RPC_CONTROL_PRIORITY, collections.deque()).extend(queues.pop(priority))
+
+
+    def _write_shared(self, data, seq, packet_type, pieces):
+        """
+        Writes the payload of a packet to the shared memory ring, and appends
+        the SHMP packet referring to it to pieces.  Returns False if the
+        ring is full.
+
+        The ring is written when packets are handed to the socket, so that
+        the peer reads payloads in the order they were written.
+        """
+        start = self._shm_out.put(data)
+        if start is None:
+            return False
+        pieces.append(struct.pack('I4sI', seq, 'SHMP', _shm_packet.size) +
+                      _shm_packet.pack(packet_type, start, len(data)))
+        return True
+
+
+    def _write_done(self):
+        """
+        Writes the next packets once the previous write is done.
+        """
+        self._sending = False
+        self._flush_writes()
+
+
+    def _write_socket(self, data):
         """
-        Writes data to the channel.
+        Writes data to the socket, closing the channel if the write fails.
         """
-        cb = self._socket.write(data).exception.connect_weak(self._handle_close, False, write_failed=True)
+        if not self._socket:
+            return
+        try:
+            ip = self._socket.write(data)
+        except (IOError, ValueError), e:
+            log.error('Write to rpc socket failed, closing channel: %s', e)
+            return self._socket.close(immediate=True, expected=False)
+        cb = ip.exception.connect_weak(self._handle_close, False, write_failed=True)
         cb.ignore_caller_args = True
+        self._last_write = ip
+        return ip
 
 
     def _handle_close(self, expected, reset_signals=True, write_failed=False):
@@ -358,6 +753,12 @@ class Channel(Object):
             log.error('rpc peer closed before authentication completed; probably incorrect shared secret.')
 
         log.debug('close socket for %s', self)
+        self._fragments = {}
+        self._compressing = {}
+        self._close_shared_memory()
+        self._send_queues = {}
+        self._send_queued = self._write_pending_size = 0
+        self._sending = False
         self.signals['closed'].emit()
         if reset_signals:
             self.signals = {}
@@ -370,6 +771,16 @@ class Channel(Object):
                 # Raise an error if this happens during runtime or if
                 # someone wants to get the result or exception.
                 callback.throw(IOError, IOError('kaa.rpc channel closed'), None)
+        while self._streams_in:
+            self._streams_in.popitem()[1].throw(IOError, IOError('kaa.rpc channel closed'), None)
+        while self._streams_out:
+            self._streams_out.popitem()[1].cancel()
+        while self._calls_in:
+            # Nobody is waiting for the results anymore.
+            self._abort_call(self._calls_in.keys()[0])
+        while self._calls_timed:
+            stats, received = self._calls_timed.popitem()[1]
+            stats._end(received, True)
 
         # Return False for reason explained above.
         return False
@@ -380,16 +791,9 @@ class Channel(Object):
         Invoked when a new chunk is read from the socket.  When not authenticated,
         chunk size is 1k; when authenticated it is 1M.
         """
-        self._read_buffer.append(data)
-        # Before we start into the loop, make sure we have enough data for
-        # a full packet.  For very large packets (if we just received a huge
-        # pickled object), this saves the string.join() which can be very
-        # expensive.  (This is the reason we use a list for our read buffer.)
-        buflen = sum(len(x) for x in self._read_buffer)
-        if buflen < RPC_PACKET_HEADER_SIZE:
-            return
-
-        if not self._authenticated and buflen > 1024:
+        queue = self._read_buffer
+        queue.write(data)
+        if not self._authenticated and len(queue) > 1024:
             # Because we are not authenticated, we shouldn't have more than 1k
             # in the buffer.  If we do it's because the remote has sent a
             # large amount of data before completing authentication.
@@ -397,81 +801,378 @@ class Channel(Object):
             self.close()
             return
 
-        # Ensure the first block in the read buffer is big enough for a full
-        # packet header.  If it isn't, then we must have more than 1 block in
-        # the buffer, so keep merging blocks until we have a block big enough
-        # to be a header.  If we're here, it means that buflen >=
-        # RPC_PACKET_HEADER_SIZE, so we can safely loop.
-        while len(self._read_buffer[0]) < RPC_PACKET_HEADER_SIZE:
-            self._read_buffer[0] += self._read_buffer.pop(1)
-
-        # Make sure the the buffer holds enough data as indicated by the
-        # payload size in the header.
-        header = self._read_buffer[0][:RPC_PACKET_HEADER_SIZE]
-        payload_len = struct.unpack("I4sI", header)[2]
-        if buflen < payload_len + RPC_PACKET_HEADER_SIZE:
-            return
+        # Packets are decoded one at a time until authenticated, as the codec
+        # used before authentication limits their size.
+        authenticated = self._authenticated
+        while not self._authenticated:
+            try:
+                packet = queue.pop_frame(_auth_packet_codec)
+            except ValueError, e:
+                log.warning('Invalid packet received from remote end before authentication; disconnecting: %s', e)
+                self.close()
+                return
+            if packet is None:
+                return
+            (seq, packet_type, payload_len), payload = packet
+            self._handle_packet_before_auth(seq, packet_type, payload)
 
-        # At this point we know we have enough data in the buffer for the
-        # packet, so we merge the array into a single buffer.
-        strbuf = bl('').join(self._read_buffer)
-        self._read_buffer = []
-        while True:
-            if len(strbuf) <= RPC_PACKET_HEADER_SIZE:
-                if len(strbuf) > 0:
-                    self._read_buffer.append(py3_b(strbuf))
-                break
-            header = strbuf[:RPC_PACKET_HEADER_SIZE]
-            seq, packet_type, payload_len = struct.unpack("I4sI", header)
-            if len(strbuf) < payload_len + RPC_PACKET_HEADER_SIZE:
-                # We've also received portion of another packet that we
-                # haven't fully received yet.  Put back to the buffer what
-                # we have so far, and we can exit the loop.
-                self._read_buffer.append(strbuf)
-                break
+        for (seq, packet_type, payload_len), payload in queue.pop_frames(_packet_codec):
+            self._handle_packet_after_auth(seq, packet_type, payload)
 
-            # Grab the payload for this packet, and shuffle strbuf to the
-            # next packet.
-            payload = strbuf[RPC_PACKET_HEADER_SIZE:RPC_PACKET_HEADER_SIZE + payload_len]
-            strbuf = strbuf[RPC_PACKET_HEADER_SIZE + payload_len:]
-            if not self._authenticated:
-                self._handle_packet_before_auth(seq, packet_type, payload)
-            else:
-                self._handle_packet_after_auth(seq, packet_type, payload)
+        if not authenticated:
+            # The handshake just completed.  If the peer sent the last
+            # handshake packet, its SRLZ packet was sent along with it, so
+            # the serializer is usually negotiated before the channel opens.
+            self._handle_connected()
 
 
-    def _send_packet(self, seq, packet_type, payload):
+    def _send_packet(self, seq, packet_type, payload, priority=0):
         """
         Send a packet (header + payload) to the other side.
+
+        Large payloads are sent in fragments if the peer supports them, and
+        compressed if enabled and the peer supports it.
         """
         if not self._socket:
             return
+        if seq in self._compressing:
+            # Keep the order of the call's packets.
+            self._compressing[seq].append((packet_type, payload, priority))
+            return
+        if self._compress_threshold is not None and len(payload) >= self._compress_threshold and \
+           self._peer_decompresses:
+            if len(payload) >= RPC_COMPRESS_THREAD_SIZE:
+                self._compressing[seq] = []
+                if not get_thread_pool(RPC_COMPRESS_POOL):
+                    register_thread_pool(RPC_COMPRESS_POOL, ThreadPool(size=RPC_COMPRESS_THREADS))
+                ip = ThreadPoolCallable(RPC_COMPRESS_POOL, zlib.compress, payload, RPC_COMPRESS_LEVEL)()
+                ip.connect(self._send_compressed, seq, packet_type, payload, priority)
+                # If compression fails, send the payload as is.
+                cb = ip.exception.connect(self._send_compressed, payload, seq, packet_type, payload, priority)
+                cb.ignore_caller_args = True
+                return
+            return self._send_compressed(zlib.compress(payload, RPC_COMPRESS_LEVEL), seq, packet_type,
+                                         payload, priority)
+        self._send_payload(seq, packet_type, payload, priority)
+
+
+    def _send_compressed(self, compressed, seq, packet_type, payload, priority):
+        """
+        Sends the compressed payload, unless compression didn't pay off, and
+        then the packets of the same call queued meanwhile.
+        """
+        if not self._socket.alive or (packet_type == 'CALL' and seq not in self._rpc_in_progress):
+            # Channel closed or call aborted while compressing
+            self._compressing.pop(seq, None)
+            return
+        if len(compressed) < len(payload):
+            self._send_payload(seq | RPC_COMPRESSED, packet_type, compressed, priority)
+        else:
+            self._send_payload(seq, packet_type, payload, priority)
+        for args in self._compressing.pop(seq, ()):
+            self._send_packet(seq, *args)
+
+
+    def _send_payload(self, seq, packet_type, payload, priority):
+        if len(payload) > RPC_FRAGMENT_SIZE and self._peer_negotiates:
+            return self._write(payload, priority, seq, packet_type)
         header = struct.pack("I4sI", seq, packet_type, len(payload))
         if not self._authenticated and bl(packet_type) not in (bl('RESP'), bl('AUTH')):
             log.debug('delay packet %s', packet_type)
             self._write_buffer_deferred.append(header + payload)
         else:
-            self._write(header + payload)
+            self._write(header + payload, priority, seq)
 
 
-    def _send_answer(self, answer, seq):
+    def _send_answer(self, answer, seq, stream=False, priority=0):
         """
         Send delayed answer when callback returns InProgress.
+
+        Generators, or any iterable if stream is True, are sent as a stream.
         """
-        payload = cPickle.dumps(answer, PICKLE_PROTOCOL)
-        self._send_packet(seq, 'RETN', payload)
+        self._end_call(seq)
+        timed = self._calls_timed.pop(seq, None)
+        if stream or isinstance(answer, types.GeneratorType):
+            if self._peer_negotiates:
+                if timed:
+                    # Only the time until the stream starts is measured.
+                    timed[0]._end(timed[1], False)
+                return self._send_stream(iter(answer), seq, priority)
+            # Peer predates streamed results.
+            answer = list(answer)
+        if timed:
+            started = time.time()
+            payload = self._serializer_out[1](answer)
+            self._answered(timed, payload, started, False)
+        else:
+            payload = self._serializer_out[1](answer)
+        self._send_packet(seq, 'RETN', payload, priority)
+
 
+    @kaa.coroutine()
+    def _send_stream(self, iterator, seq, priority):
+        """
+        Sends the items of the iterator as a streamed result.
 
-    def _send_exception(self, type, value, tb, seq):
+        The stream starts with an empty STRM packet, followed by a STRM packet
+        for each item, and ends with a RETN packet, or EXCP if the iterator
+        raises.  Only RPC_STREAM_WINDOW items may be sent before the receiver
+        grants more credits with CRDT packets, and the receiver may cancel
+        the stream with a CNCL packet.
+        """
+        credits = self._streams_out[seq] = _StreamCredits(RPC_STREAM_WINDOW)
+        self._send_packet(seq, 'STRM', bl(''), priority)
+        try:
+            while True:
+                if not credits.available:
+                    yield credits.wait()
+                if credits.cancelled:
+                    break
+                try:
+                    item = iterator.next()
+                except StopIteration:
+                    self._send_packet(seq, 'RETN', self._serializer_out[1](None), priority)
+                    break
+                self._send_packet(seq, 'STRM', self._serializer_out[1](item), priority)
+                credits.available -= 1
+                # Let other packets through between items, and the socket
+                # catch up before producing more items.
+                yield kaa.NotFinished
+                while self._send_queued + self._socket.write_queue_used >= RPC_SEND_ROUND_SIZE:
+                    if self._socket.write_queue_used:
+                        yield self._last_write
+                    else:
+                        yield kaa.NotFinished
+        except Exception:
+            if not credits.cancelled and self._socket.alive:
+                self._send_exception(*sys.exc_info() + (seq, priority))
+        finally:
+            if self._streams_out.get(seq) is credits:
+                del self._streams_out[seq]
+            if hasattr(iterator, 'close'):
+                iterator.close()
+
+
+    def _send_exception(self, type, value, tb, seq, priority=0):
         """
         Send delayed exception when callback returns InProgress.
         """
+        self._end_call(seq)
+        timed = self._calls_timed.pop(seq, None)
+        if not self._socket.alive:
+            # Call aborted because the channel closed.
+            if timed:
+                timed[0]._end(timed[1], True)
+            return False
+        if isinstance(value, kaa.InProgressAborted):
+            # Don't send the InProgress objects the exception refers to.
+            value = value.__class__(*value.args)
+        started = time.time()
         stack = traceback.extract_tb(tb)
+        dumps = self._serializer_out[1]
+        try:
+            payload = dumps((value, stack))
+        except (cPickle.UnpickleableError, cPickle.PicklingError, TypeError):
+            payload = dumps((Exception(py3_b(value)), stack))
+        if timed:
+            self._answered(timed, payload, started, True)
+        self._send_packet(seq, 'EXCP', payload, priority)
+        # The exception is handled by passing it to the peer.
+        return False
+
+
+    def _answered(self, timed, payload, started, failed):
+        """
+        Updates the statistics of a received call once its answer is
+        serialized.
+        """
+        stats, received = timed
+        stats.serialize_time.add(time.time() - started)
+        stats.response_size.add(len(payload))
+        stats._end(received, failed)
+
+
+    def _end_call(self, seq):
+        """
+        Forgets a received call whose result is known.
+        """
+        if seq in self._calls_in:
+            timer = self._calls_in.pop(seq)[1]
+            if timer:
+                timer.stop()
+
+
+    def _abort_call(self, seq, expired=False):
+        """
+        Aborts a received call because the caller cancelled it, its deadline
+        expired, or the channel closed.
+        """
+        if seq not in self._calls_in:
+            return
+        ip = self._calls_in[seq][0]
+        self._end_call(seq)
+        if expired:
+            exc = kaa.TimeoutException('rpc call timed out', inprogress=ip)
+        else:
+            exc = kaa.InProgressAborted('rpc call cancelled', inprogress=ip)
         try:
-            payload = cPickle.dumps((value, stack), PICKLE_PROTOCOL)
-        except cPickle.UnpickleableError:
-            payload = cPickle.dumps((Exception(py3_b(value)), stack), PICKLE_PROTOCOL)
-        self._send_packet(seq, 'EXCP', payload)
+            ip.abort(exc)
+        except kaa.InProgressAborted:
+            # Reraised by a coroutine not handling the exception.
+            pass
+        except RuntimeError:
+            # The call can't be aborted; its result will be discarded.
+            log.debug('rpc call %d cannot be aborted', seq)
+
+
+    def _cancel_call(self, exc, seq):
+        """
+        Invoked when the InProgress of a call made through this channel is
+        aborted.
+        """
+        if self._rpc_in_progress.pop(seq, None) and self._peer_negotiates and self._socket.alive:
+            priority = self._unqueue_call(seq)
+            if priority is not None:
+                self._send_packet(seq, 'CNCL', bl(''), priority)
+
+
+    def _unqueue_call(self, seq):
+        """
+        Removes the CALL packet with the given sequence number from the send
+        queues, unless part of it has been sent.  Returns the priority with
+        which to send the call's CNCL packet, or None if none is needed.
+
+        A CNCL packet overtaking its call would be ignored by the peer, so
+        for a partly sent call it is sent behind the call's last fragment.
+        """
+        if seq in self._compressing:
+            # The call is dropped once compressed (see _send_compressed()).
+            return None
+        for priority, queue in self._send_queues.items():
+            for entry in queue:
+                data, offset, entry_seq, packet_type = entry
+                if entry_seq is None or entry_seq & ~RPC_COMPRESSED != seq or \
+                   (packet_type or data[4:8]) != bl('CALL'):
+                    continue
+                if offset:
+                    return priority
+                queue.remove(entry)
+                if not queue:
+                    del self._send_queues[priority]
+                self._send_queued -= len(data)
+                if packet_type is None:
+                    self._write_pending_size -= len(data)
+                return None
+        return RPC_CONTROL_PRIORITY
+
+
+    def _expire_call(self, callback, cmd, timeout):
+        if not callback.finished:
+            callback.abort(kaa.TimeoutException('rpc %s timed out after %s seconds' % (cmd, timeout), inprogress=callback))
+
+
+    def _reset_serializers(self):
+        """
+        Reverts to the default serializer in both directions, for a new
+        connection.
+        """
+        self._serializer_out = self._serializer_in = _default_serializer
+        self._peer_negotiates = self._peer_decompresses = False
+
+
+    def _send_serializers(self):
+        """
+        Tells the peer which serializer our subsequent packets use, and which
+        serializers we support.
+
+        Peers from before serializer negotiation don't know SRLZ packets.
+        They log an "unknown packet type" error and drop the packet, and keep
+        using the default serializer.
+        """
+        names = [serializer[0] for serializer in _serializers]
+        # Compression is announced in the list as well.  Peers which
+        # negotiate serializers but don't support compression skip names
+        # they don't know.
+        names.append('zlib')
+        # Packets already queued are encoded with the previous serializer.
+        self._write_barrier()
+        self._send_packet(0, 'SRLZ', py3_b('%s;%s' % (self._serializer_out[0], ','.join(names))),
+                          RPC_CONTROL_PRIORITY)
+
+
+    def _send_credits(self, seq, count):
+        """
+        Grants the sender of a streamed result credits for count more items.
+        """
+        if seq in self._streams_in:
+            self._send_packet(seq, 'CRDT', struct.pack('I', count), RPC_CONTROL_PRIORITY)
+
+
+    def _cancel_stream(self, seq):
+        """
+        Cancels a streamed result which is being received.
+        """
+        if self._streams_in.pop(seq, None) and self._socket.alive:
+            self._send_packet(seq, 'CNCL', bl(''), RPC_CONTROL_PRIORITY)
+
+
+    def _handle_serializers(self, payload):
+        """
+        Handles a SRLZ packet from the peer.
+
+        Each side sends a SRLZ packet once authenticated, naming the
+        serializer its packets are encoded with and listing the serializers it
+        can decode.  On receiving one, we switch to our most preferred
+        serializer the peer supports, and if that changes our serializer we
+        send another SRLZ packet before any packet using it.  Peers that don't
+        know about SRLZ packets log an error and drop them, and never send
+        one, so both sides keep using the default.
+        """
+        if not self._peer_negotiates and self._shm_size and isinstance(self._socket.local, basestring):
+            # Peer on the same host
+            self._offer_shared_memory()
+        self._peer_negotiates = True
+        current, names = py3_str(payload).split(';', 1)
+        available = dict((serializer[0], serializer) for serializer in _serializers)
+        if current not in available:
+            log.error('Peer uses unsupported serializer %s; closing channel', current)
+            return self.close()
+        self._serializer_in = available[current]
+        names = names.split(',')
+        self._peer_decompresses = 'zlib' in names
+        for serializer in _serializers:
+            if serializer[0] in names:
+                break
+        else:
+            serializer = _default_serializer
+        if serializer is not self._serializer_out:
+            log.debug('Switching to serializer %s', serializer[0])
+            self._serializer_out = serializer
+            self._send_serializers()
+
+
+    def _offer_shared_memory(self):
+        """
+        Offers a shared memory ring to the peer with a SHMR packet.
+
+        Once the peer acknowledges the ring with a SHMA packet, large
+        payloads are written to the ring, and SHMP packets referring to them
+        are sent in their place.
+        """
+        try:
+            self._shm_offered = _SharedRing(None, self._shm_size)
+        except (IOError, OSError, mmap.error), e:
+            log.warning('Cannot create shared memory ring for rpc channel: %s', e)
+            return
+        self._send_packet(0, 'SHMR', py3_b('%d;%s' % (self._shm_size, self._shm_offered.path)),
+                          RPC_CONTROL_PRIORITY)
+
+
+    def _close_shared_memory(self):
+        for ring in self._shm_offered, self._shm_out, self._shm_in:
+            if ring:
+                ring.close()
+        self._shm_offered = self._shm_out = self._shm_in = None
 
 
     def _handle_packet_after_auth(self, seq, packet_type, payload):
@@ -479,52 +1180,172 @@ class Channel(Object):
         Handle incoming packet (called from _handle_write) after
         authentication has been completed.
         """
+        if packet_type == bl('FRAG'):
+            # Fragment of a large packet, prefixed with the packet type.
+            self._fragments.setdefault((payload[:4], seq), []).append(payload[4:])
+            return True
+
+        if self._fragments and (packet_type, seq) in self._fragments:
+            # Final fragment
+            fragments = self._fragments.pop((packet_type, seq))
+            fragments.append(payload)
+            payload = bl('').join(fragments)
+
+        if packet_type == bl('SHMP'):
+            # Packet whose payload is in the shared memory ring
+            packet_type, start, length = _shm_packet.unpack(payload)
+            if not self._shm_in or length > self._shm_in.size:
+                log.error('Invalid SHMP packet from rpc peer; closing channel')
+                return self.close()
+            payload = self._shm_in.get(start, length)
+
+        if seq & RPC_COMPRESSED:
+            seq &= ~RPC_COMPRESSED
+            payload = zlib.decompress(payload)
+
         if packet_type == bl('CALL'):
             # Remote function call, send answer
-            function, args, kwargs = cPickle.loads(payload)
+            if self._metrics:
+                received = time.time()
+            call = self._serializer_in[2](payload)
+            function, args, kwargs = call[:3]
+            if self._metrics:
+                stats = self._metrics.incoming[function]
+                stats.deserialize_time.add(time.time() - received)
+                stats._begin(len(payload))
+                self._calls_timed[seq] = stats, received
+            # Peers supporting deadlines may add the timeout.
+            timeout = call[3] if len(call) > 3 else None
+            priority = 0
             try:
-                if self._callbacks[function]._kaa_rpc_param[0]:
+                callback = self._callbacks[function]
+                add_client, stream, priority, dispatcher = callback._kaa_rpc_param
+                if add_client:
                     args = [ self ] + list(args)
-                result = self._callbacks[function](*args, **kwargs)
+                if dispatcher:
+                    result = dispatcher(callback, args, kwargs)
+                else:
+                    result = callback(*args, **kwargs)
             except Exception, e:
                 #log.exception('Exception in rpc function "%s"', function)
                 if not function in self._callbacks:
                     log.error('%s - %s', function, self._callbacks.keys())
-                self._send_exception(*sys.exc_info() + (seq,))
+                self._send_exception(*sys.exc_info() + (seq, priority))
                 return True
 
             if isinstance(result, kaa.InProgress):
-                result.connect(self._send_answer, seq)
-                result.exception.connect(self._send_exception, seq)
+                if not result.finished:
+                    timer = None
+                    if timeout is not None:
+                        timer = kaa.OneShotTimer(self._abort_call, seq, True)
+                        timer.start(timeout)
+                    self._calls_in[seq] = result, timer
+                result.connect(self._send_answer, seq, stream, priority)
+                result.exception.connect(self._send_exception, seq, priority)
             else:
-                self._send_answer(result, seq)
+                self._send_answer(result, seq, stream, priority)
+
+            return True
 
+        if packet_type == bl('STRM'):
+            # Start of, or item in a streamed result
+            if seq in self._streams_in:
+                self._streams_in[seq].send(self._serializer_in[2](payload))
+                return True
+            callback, cmd = self._rpc_in_progress.pop(seq, (None, None))
+            if callback is None:
+                return True
+            stream = self._streams_in[seq] = _RemoteStream(self, seq, cmd)
+            kaa.inprogress(stream).connect(callback.finish)
             return True
 
         if packet_type == bl('RETN'):
             # RPC return
-            payload = cPickle.loads(payload)
-            callback, cmd = self._rpc_in_progress.get(seq)
+            if self._metrics:
+                started = time.time()
+            result = self._serializer_in[2](payload)
+            if seq in self._streams_in:
+                # End of streamed result
+                self._streams_in.pop(seq).finish(result)
+                return True
+            callback, cmd = self._rpc_in_progress.get(seq, (None, None))
             if callback is None:
                 return True
             del self._rpc_in_progress[seq]
-            callback.finish(payload)
+            if self._metrics:
+                stats = self._metrics.outgoing[cmd]
+                stats.deserialize_time.add(time.time() - started)
+                stats.response_size.add(len(payload))
+            callback.finish(result)
             return True
 
         if packet_type == bl('EXCP'):
             # Exception for remote call
             try:
-                exc_value, stack = cPickle.loads(payload)
+                exc_value, stack = self._serializer_in[2](payload)
             except Exception, e:
                 exc_value, stack = e, ''
-            callback, cmd = self._rpc_in_progress.get(seq)
+            if seq in self._streams_in:
+                # Streamed result raised.
+                stream = self._streams_in.pop(seq)
+                remote_exc = RemoteException(exc_value, stack, stream._cmd)
+                stream.throw(remote_exc.__class__, remote_exc, None)
+                return True
+            callback, cmd = self._rpc_in_progress.get(seq, (None, None))
             if callback is None:
                 return True
             del self._rpc_in_progress[seq]
+            if self._metrics:
+                self._metrics.outgoing[cmd].response_size.add(len(payload))
             remote_exc = RemoteException(exc_value, stack, cmd)
             callback.throw(remote_exc.__class__, remote_exc, None)
             return True
 
+        if packet_type == bl('CRDT'):
+            # Receiver of a streamed result grants credits
+            if seq in self._streams_out:
+                self._streams_out[seq].grant(struct.unpack('I', payload)[0])
+            return True
+
+        if packet_type == bl('CNCL'):
+            # Caller is no longer interested in the result of a call, or
+            # receiver of a streamed result in the remaining items.
+            if seq in self._streams_out:
+                self._streams_out.pop(seq).cancel()
+            else:
+                self._abort_call(seq)
+            return True
+
+        if packet_type == bl('SRLZ'):
+            # Peer announces its serializers
+            self._handle_serializers(payload)
+            return True
+
+        if packet_type == bl('SHMR'):
+            # Peer offers a shared memory ring for the payloads it sends
+            if not self._shm_size or not isinstance(self._socket.local, basestring):
+                # Shared memory is disabled, or the peer is not on this host.
+                log.debug('Ignoring shared memory ring offered by rpc peer')
+                return True
+            size, path = py3_str(payload).split(';', 1)
+            try:
+                ring = _SharedRing(path, int(size))
+            except (IOError, OSError, ValueError, mmap.error), e:
+                log.warning('Cannot use shared memory ring %s of rpc peer: %s', path, e)
+                return True
+            if self._shm_in:
+                self._shm_in.close()
+            self._shm_in = ring
+            self._send_packet(0, 'SHMA', bl(''), RPC_CONTROL_PRIORITY)
+            return True
+
+        if packet_type == bl('SHMA'):
+            # Peer uses the ring we offered
+            if self._shm_offered:
+                self._shm_out, self._shm_offered = self._shm_offered, None
+                self._shm_out.unlink()
+            return True
+
         log.error('unknown packet type %s', packet_type)
         return True
 
@@ -691,10 +1512,15 @@ class Channel(Object):
                 self._send_packet(seq, 'RESP', payload)
                 log.debug('Sent response to challenge from client.')
 
+            # Negotiate the serializer ahead of any deferred packets.
+            self._send_serializers()
+
             # Empty deferred write buffer now that we're authenticated.
-            self._write(bl('').join(self._write_buffer_deferred))
-            self._write_buffer_deferred = []
-            self._handle_connected()
+            # _handle_read() invokes _handle_connected() once the packets
+            # following the handshake are handled.
+            if self._write_buffer_deferred:
+                self._write(bl('').join(self._write_buffer_deferred))
+                self._write_buffer_deferred = []
 
 
     def _handle_connected(self):
@@ -771,6 +1597,201 @@ class Channel(Object):
         return '<kaa.rpc.Channel (%s) %s>' % (tp, self._socket.fileno)
 
 
+class _StreamCredits(object):
+    """
+    Flow control state of a streamed result being sent.
+    """
+    def __init__(self, available):
+        self.available = available
+        self.cancelled = False
+        self._waiting = None
+
+
+    def wait(self):
+        """
+        Returns an InProgress finished when credits are granted or the stream
+        is cancelled.
+        """
+        self._waiting = kaa.InProgress()
+        return self._waiting
+
+
+    def grant(self, count):
+        self.available += count
+        if self._waiting:
+            self._waiting, ip = None, self._waiting
+            ip.finish(None)
+
+
+    def cancel(self):
+        self.cancelled = True
+        self.grant(0)
+
+
+
+class _RemoteStream(Generator):
+    """
+    Streamed result of a remote call, which is iterated as a
+    :class:`~kaa.Generator`.
+
+    As items are consumed, the sender is granted credits for more.  If the
+    iteration is abandoned before the stream ends, the stream is cancelled.
+    """
+    def __init__(self, channel, seq, cmd):
+        super(_RemoteStream, self).__init__()
+        self._channel = channel
+        self._seq = seq
+        self._cmd = cmd
+
+
+    def __iter__(self):
+        consumed = 0
+        try:
+            for ip in super(_RemoteStream, self).__iter__():
+                yield ip
+                consumed += 1
+                if consumed >= RPC_STREAM_WINDOW / 2:
+                    self._channel._send_credits(self._seq, consumed)
+                    consumed = 0
+        finally:
+            self._channel._cancel_stream(self._seq)
+
+
+
+class _SharedRing(object):
+    """
+    Ring buffer in a shared memory file, written by one side of a channel
+    and read by the other.
+
+    Positions in the ring count the bytes written since it was created.  The
+    first 8 bytes of the file hold the position up to which the reader has
+    consumed data, so the writer knows which space it may reuse without
+    waiting for packets from the reader.  Payloads are never split at the
+    end of the ring; the writer skips to the beginning instead.
+    """
+    _header = struct.Struct('Q')
+    _prefix = 'kaa-rpc-'
+
+    def __init__(self, path, size):
+        """
+        Creates a new ring of the given size if path is None, or otherwise
+        maps the ring created by the peer.
+        """
+        created = path is None
+        if created:
+            directory = '/dev/shm' if os.path.isdir('/dev/shm') else None
+            fd, path = tempfile.mkstemp(prefix=self._prefix, dir=directory)
+            try:
+                os.ftruncate(fd, self._header.size + size)
+            except OSError:
+                os.close(fd)
+                os.unlink(path)
+                raise
+        else:
+            # The peer names the file, so only files which can have been
+            # created above are mapped, lest a peer make us write to others.
+            directory, name = os.path.split(path)
+            directories = [os.path.realpath(d) for d in ('/dev/shm', tempfile.gettempdir())]
+            if not name.startswith(self._prefix) or os.path.realpath(directory) not in directories:
+                raise ValueError('not a shared memory ring')
+            fd = os.open(path, os.O_RDWR | os.O_NOFOLLOW)
+            st = os.fstat(fd)
+            if not stat.S_ISREG(st.st_mode) or st.st_size != self._header.size + size:
+                os.close(fd)
+                raise ValueError('ring has the wrong size')
+        try:
+            self._mmap = mmap.mmap(fd, self._header.size + size)
+        finally:
+            os.close(fd)
+        # Path of the file while the ring's creator has not yet removed it.
+        self.path = path if created else None
+        self.size = size
+        self._write_pos = 0
+
+
+    def put(self, data):
+        """
+        Writes data to the ring and returns its position, or None if the
+        reader has not consumed enough data to make room for it.
+        """
+        start = self._write_pos
+        offset = start % self.size
+        if offset + len(data) > self.size:
+            start += self.size - offset
+            offset = 0
+        if start + len(data) - self._header.unpack_from(self._mmap, 0)[0] > self.size:
+            return None
+        offset += self._header.size
+        self._mmap[offset:offset + len(data)] = data
+        self._write_pos = start + len(data)
+        return start
+
+
+    def get(self, start, length):
+        """
+        Returns the data at the given position and releases its space.
+        """
+        offset = self._header.size + start % self.size
+        data = self._mmap[offset:offset + length]
+        self._header.pack_into(self._mmap, 0, start + length)
+        return data
+
+
+    def unlink(self):
+        """
+        Removes the file, once the peer has mapped it.
+        """
+        if self.path:
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+            self.path = None
+
+
+    def close(self):
+        self.unlink()
+        self._mmap.close()
+
+
+
+class Batch(object):
+    """
+    Context manager collecting RPC calls to be sent together, returned by
+    :meth:`Channel.batch`.
+    """
+    def __init__(self, channel):
+        self._channel = channel
+        self._calls = []
+        self._inprogress = None
+
+
+    def __enter__(self):
+        if not CoreThreading.is_mainthread():
+            raise RuntimeError('RPC batches must be used from the main thread')
+        self._channel._batches.append(self)
+        return self
+
+
+    def __exit__(self, type, value, tb):
+        self._channel._batches.remove(self)
+        self._channel._flush_writes()
+
+
+    def rpc(self, cmd, *args, **kwargs):
+        """
+        Call the remote command as part of the batch and return InProgress.
+        """
+        return self._channel.rpc(cmd, *args, **kwargs)
+
+
+    def __inprogress__(self):
+        if self._inprogress is None:
+            self._inprogress = kaa.InProgressAll(*self._calls)
+        return self._inprogress
+
+
+
 DISCONNECTED = 'DISCONNECTED'
 CONNECTING = 'CONNECTING'
 CONNECTED = 'CONNECTED'
@@ -779,12 +1800,24 @@ CONNECTED = 'CONNECTED'
 class Client(Channel):
     """
     RPC client to be connected to a server.
+
+    If retry is given, the client reconnects that many seconds after the
+    connection is lost.  See :class:`~kaa.rpc.Server` for metrics, shm_size
+    and compress_threshold.
     """
 
     channel_type = 'client'
 
-    def __init__(self, address, auth_secret = '', buffer_size = None, retry = None):
+    def __init__(self, address, auth_secret = '', buffer_size = None, retry = None, metrics = False,
+                 shm_size = 0, compress_threshold = None):
         super(Client, self).__init__(kaa.Socket(buffer_size), auth_secret)
+        self._shm_size = shm_size
+        self._compress_threshold = compress_threshold
+        #: :class:`~kaa.rpc.Metrics` if enabled by the *metrics* argument
+        #: (see :class:`~kaa.rpc.Server`), or None.
+        self.metrics = self._metrics = _get_metrics(metrics)
+        if self.metrics:
+            self.register(self.metrics)
         self._socket.connect(address).exception.connect(self._handle_refused)
         self.monitoring = False
         if retry is not None:
@@ -804,6 +1837,15 @@ class Client(Channel):
         self._connect_inprogress.throw(type, value, tb)
         return False
 
+    def close(self):
+        """
+        Forcefully close the RPC channel.
+
+        A client created with *retry* stops reconnecting.
+        """
+        self.monitoring = False
+        super(Client, self).close()
+
     def _handle_close(self, expected, reset_signals=True):
         """
         kaa.Socket callback invoked when socket is closed.
@@ -827,12 +1869,18 @@ class Client(Channel):
                 pass
             self._connect_inprogress = kaa.InProgress()
             self.status = DISCONNECTED
+            if not self.monitoring:
+                # client was closed
+                break
             # wait some time until we retry
             yield kaa.delay(retry)
+            if not self.monitoring:
+                break
             # reset variables
             self._authenticated = False
             self._pending_challenge = None
-            self._read_buffer = []
+            self._read_buffer = _ReadQueue()
+            self._reset_serializers()
             self.status = CONNECTING
             self._socket = kaa.Socket(buffer_size)
             self._socket.chunk_size = 1024
@@ -845,15 +1893,507 @@ class Client(Channel):
 connect = Client
 
 
-def expose(command=None, add_client=False, coroutine=False):
+class ClientPool(Object):
+    """
+    Pool of RPC clients connected to one or more servers.
+
+    :param addresses: the address of the server, or a list of addresses
+    :param auth_secret: the secret shared with the servers
+    :param size: the number of channels, which are spread evenly over the
+                 addresses; the default is one channel per address
+    :type size: int
+    :param buffer_size: see :attr:`kaa.Socket.buffer_size`
+    :param retry: seconds to wait before reconnecting a closed channel
+    :param idempotent: names of commands which are safe to call again
+    :type idempotent: list of str
+    :param metrics: True to collect statistics about the calls of all
+                    channels in the :attr:`metrics` attribute (see
+                    :class:`~kaa.rpc.Server`)
+
+    Calls made with :meth:`rpc` are sent over the connected channel with the
+    fewest outstanding calls.  If a channel closes before a call to an
+    idempotent command has returned, the call is made again on another
+    channel.  ``kaa.inprogress(pool)`` finishes once a channel is open::
+
+        pool = kaa.rpc.ClientPool(['backend1:5000', 'backend2:5000'], secret,
+                                  size=4, idempotent=['lookup'])
+        yield kaa.inprogress(pool)
+        result = yield pool.rpc('lookup', name)
+    """
+    __kaasignals__ = {
+        'closed':
+            '''
+            Emitted when the last open channel of the pool closes.
+
+            .. describe:: def callback(...)
+            ''',
+
+        'open':
+            '''
+            Emitted when a channel opens while none was open.
+
+            .. describe:: def callback(...)
+            '''
+    }
+
+    def __init__(self, addresses, auth_secret='', size=None, buffer_size=None,
+                 retry=1, idempotent=(), metrics=False):
+        super(ClientPool, self).__init__()
+        if isinstance(addresses, basestring) or isinstance(addresses, tuple):
+            addresses = [addresses]
+        self.idempotent = set(idempotent)
+        self.metrics = _get_metrics(metrics)
+        self.clients = []
+        self._connect_inprogress = kaa.InProgress()
+        # Index of the channel tried first when several have the same number
+        # of outstanding calls, so that idle channels are used in turn.
+        self._next = 0
+        for n in range(size or len(addresses)):
+            client = Client(addresses[n % len(addresses)], auth_secret, buffer_size, retry, self.metrics)
+            client.signals['open'].connect(self._handle_open)
+            client.signals['closed'].connect(self._handle_closed)
+            self.clients.append(client)
+
+
+    @property
+    def connected(self):
+        """
+        True if any channel of the pool is connected.
+        """
+        for client in self.clients:
+            if client.connected:
+                return True
+        return False
+
+
+    def rpc(self, cmd, *args, **kwargs):
+        """
+        Call the remote command on the least busy channel and return
+        InProgress.
+
+        The keyword argument ``_idempotent`` overrides whether the command
+        is called again if the channel closes (see *idempotent* above), and
+        ``_priority`` is passed to :meth:`Channel.rpc`.
+
+        NotConnectedError is raised if no channel is connected.
+        """
+        if not CoreThreading.is_mainthread():
+            callback = kaa.InProgress()
+            kwargs['_kaa_rpc_callback'] = callback
+            kaa.MainThreadCallable(self.rpc)(cmd, *args, **kwargs)
+            return callback
+
+        idempotent = kwargs.pop('_idempotent', cmd in self.idempotent)
+        client = self._choose()
+        if client is None:
+            raise NotConnectedError()
+        if not idempotent:
+            return client.rpc(cmd, *args, **kwargs)
+        callback = kwargs.pop('_kaa_rpc_callback', kaa.InProgress())
+        # Aborting the call aborts the current attempt.
+        callback.signals['abort'].connect(self._abort_call, callback)
+        self._call(client, [], callback, cmd, args, kwargs)
+        return callback
+
+
+    def close(self):
+        """
+        Close all channels of the pool.
+        """
+        for client in self.clients:
+            client.close()
+
+
+    def __inprogress__(self):
+        return self._connect_inprogress
+
+
+    def _choose(self, exclude=()):
+        """
+        Returns the connected channel with the fewest outstanding calls,
+        or None.
+        """
+        best = None
+        n = len(self.clients)
+        for i in range(self._next, self._next + n):
+            client = self.clients[i % n]
+            if not client.connected or client in exclude:
+                continue
+            if best is None or len(client._rpc_in_progress) < len(best._rpc_in_progress):
+                best = client
+        self._next = (self._next + 1) % n
+        return best
+
+
+    def _call(self, client, tried, callback, cmd, args, kwargs):
+        tried.append(client)
+        ip = callback._kaa_rpc_attempt = client.rpc(cmd, *args, **kwargs)
+        ip.connect(callback.finish)
+        ip.exception.connect(self._retry, client, tried, callback, cmd, args, kwargs)
+
+
+    def _abort_call(self, exc, callback):
+        attempt, callback._kaa_rpc_attempt = callback._kaa_rpc_attempt, None
+        if not attempt.finished:
+            attempt.abort(exc)
+
+
+    def _retry(self, tp, exc, tb, client, tried, callback, cmd, args, kwargs):
+        """
+        Calls an idempotent command again if it failed because its channel
+        closed.
+        """
+        if callback._kaa_rpc_attempt is None:
+            # The call was aborted.
+            return False
+        if not client.connected and len(tried) <= len(self.clients):
+            # Prefer channels not yet tried, but the channel may have
+            # reconnected in the meantime.
+            retry = self._choose(tried) or self._choose()
+            if retry is not None:
+                log.debug('retrying %s on %s after %s closed', cmd, retry, client)
+                self._call(retry, tried, callback, cmd, args, kwargs)
+                return False
+        callback.throw(tp, exc, tb)
+        return False
+
+
+    def _handle_open(self):
+        if not self._connect_inprogress.finished:
+            self._connect_inprogress.finish(self)
+            self.signals['open'].emit()
+
+
+    def _handle_closed(self):
+        if self._connect_inprogress.finished and not self.connected:
+            self._connect_inprogress = kaa.InProgress()
+            self.signals['closed'].emit()
+
+
+class Dispatcher(object):
+    """
+    Dispatches the calls of a function exposed with a *pool* (see
+    :func:`expose`) to a :class:`~kaa.ThreadPool` or
+    :class:`~kaa.ProcessPool`, and keeps statistics about them.
+
+    Use :func:`get_dispatcher` to get the Dispatcher of an exposed function.
+    """
+    def __init__(self, pool, concurrency=None):
+        #: The pool object, or name of a registered thread or process pool.
+        self.pool = pool
+        #: Maximum number of calls running in the pool at once, or None for
+        #: no limit.  Further calls are queued.
+        self.concurrency = concurrency
+        # Calls waiting for one of the running calls to finish.
+        self._queue = collections.deque()
+        self._running = 0
+        self.reset()
+
+
+    def __repr__(self):
+        return '<kaa.rpc.Dispatcher pool=%s calls=%d running=%d queued=%d>' % \
+               (self.pool, self.calls, self.running, self.queued)
+
+
+    def reset(self):
+        """
+        Discards all collected statistics.
+        """
+        #: Number of calls received.
+        self.calls = 0
+        #: Number of calls which have finished, successfully or not.
+        self.completed = 0
+        #: Number of calls which raised an exception.
+        self.failed = 0
+        #: Largest number of calls seen waiting in the queue.
+        self.queue_peak = len(self._queue)
+        #: :class:`~kaa.utils.Histogram` of seconds calls waited in the queue
+        #: because of the concurrency limit.
+        self.queue_wait = Histogram()
+        #: :class:`~kaa.utils.Histogram` of seconds between dispatching calls
+        #: to the pool and them finishing, which includes time spent in the
+        #: pool's own queue.
+        self.run_time = Histogram()
+
+
+    @property
+    def running(self):
+        """
+        Number of calls currently dispatched to the pool.
+        """
+        return self._running
+
+
+    @property
+    def queued(self):
+        """
+        Number of calls currently waiting because of the concurrency limit.
+        """
+        return len(self._queue)
+
+
+    def __call__(self, func, args, kwargs):
+        """
+        Calls func with the given arguments in the pool, or queues the call
+        if the concurrency limit is reached, and returns InProgress.
+        """
+        self.calls += 1
+        ip = kaa.InProgress()
+        # Calls aborted while queued are not run.  Aborting running calls
+        # discards their result.
+        ip.abortable = True
+        if self.concurrency and self._running >= self.concurrency:
+            self._queue.append((ip, func, args, kwargs, time.time()))
+            self.queue_peak = max(self.queue_peak, len(self._queue))
+        else:
+            self._dispatch(ip, func, args, kwargs)
+        return ip
+
+
+    def _is_process_pool(self):
+        # Imported here, as processpool imports this module.
+        from .processpool import ProcessPool, get_process_pool
+        pool = self.pool
+        return isinstance(pool, ProcessPool) or \
+               (isinstance(pool, basestring) and not get_thread_pool(pool) and get_process_pool(pool) is not None)
+
+
+    def _get_callable(self, func):
+        from .processpool import ProcessPoolCallable
+        if not self._is_process_pool():
+            return ThreadPoolCallable(self.pool, func)
+        if func._kaa_rpc_param[0]:
+            # Pools registered by name may only be known when called.
+            raise ValueError('add_client can\'t be used with a process pool')
+        return ProcessPoolCallable(self.pool, func)
+
+
+    def _dispatch(self, ip, func, args, kwargs):
+        self._running += 1
+        started = time.time()
+        try:
+            job = self._get_callable(func)(*args, **kwargs)
+        except Exception:
+            # For example, the pool's queue is full.
+            self._finished(started, True)
+            return ip.throw(*sys.exc_info())
+        job.connect(self._job_finished, ip, started)
+        job.exception.connect(self._job_failed, ip, started)
+
+
+    def _job_finished(self, result, ip, started):
+        self._finished(started, False)
+        if not ip.finished:
+            ip.finish(result)
+
+
+    def _job_failed(self, tp, exc, tb, ip, started):
+        self._finished(started, True)
+        if not ip.finished:
+            ip.throw(tp, exc, tb)
+        # The exception is passed on to the call's InProgress.
+        return False
+
+
+    def _finished(self, started, failed):
+        self._running -= 1
+        self.completed += 1
+        self.failed += failed
+        self.run_time.add(time.time() - started)
+        while self._queue and (not self.concurrency or self._running < self.concurrency):
+            ip, func, args, kwargs, enqueued = self._queue.popleft()
+            if ip.finished:
+                # Aborted while queued
+                continue
+            self.queue_wait.add(time.time() - enqueued)
+            self._dispatch(ip, func, args, kwargs)
+
+
+
+def get_dispatcher(func):
+    """
+    Returns the :class:`~kaa.rpc.Dispatcher` of a function exposed with a
+    *pool*, or None if the function is not dispatched to a pool.
+
+    :param func: the exposed function, or a method bound to it
+    """
+    try:
+        return func._kaa_rpc_param[3]
+    except (AttributeError, IndexError):
+        return None
+
+
+def expose(command=None, add_client=False, coroutine=False, stream=False, priority=0,
+           pool=None, concurrency=None):
     """
     Decorator to expose a function. If add_client is True, the client
     object will be added to the command list as first argument.
+
+    If pool is given, the function is called in a :class:`~kaa.ThreadPool`
+    or :class:`~kaa.ProcessPool` (either the pool object or the name it was
+    registered with), so that functions doing lots of work don't block the
+    main loop.  At most *concurrency* calls of the function are run in the
+    pool at a time; further calls are queued.  See :func:`get_dispatcher`
+    for statistics about the calls.  With a process pool, the arguments
+    and the result are pickled.  The object the function is a method of is
+    pickled along with each call if it can be, so the call runs against a
+    copy of its state at that time; otherwise the pool's processes use the
+    object as it was when they were forked, and changes made to it later by
+    either side are not seen by the other.  Process pools can't be used with
+    add_client, as the client object can't be passed to another process.
+
+    Packets queued on a channel are sent in order of priority, and large
+    packets are sent in fragments between which packets of higher priority
+    may be sent.  The results of the function are sent with the given
+    priority, and the priority of calls is given with the ``_priority``
+    keyword argument of :meth:`~kaa.rpc.Client.rpc`.  For example, replies
+    of a command returning large results can be given a lower priority, so
+    that they don't delay replies of other commands::
+
+        @kaa.rpc.expose(priority=-1)
+        def get_thumbnail(self, path):
+            ...
+
+    If the function returns a generator (or any iterable, if stream is
+    True), its items are streamed to the caller, whose call finishes with a
+    :class:`~kaa.Generator` for the items.  The items are sent as they are
+    consumed, so the function may produce results too large to be returned
+    at once::
+
+        @kaa.rpc.expose()
+        def query(self, sql):
+            for row in self._db.execute(sql):
+                yield row
+
+        rows = yield client.rpc('query', sql)
+        for ip in rows:
+            row = yield ip
+
+    Each item must fit in the socket's write queue.  Peers which don't
+    support streamed results receive a list of all items instead.
     """
     def decorator(func):
         if coroutine:
             func = kaa.coroutine()(func)
         func._kaa_rpc = command or func.func_name
-        func._kaa_rpc_param = ( add_client, )
+        dispatcher = Dispatcher(pool, concurrency) if pool else None
+        if add_client and dispatcher and dispatcher._is_process_pool():
+            raise ValueError('add_client can\'t be used with a process pool')
+        func._kaa_rpc_param = ( add_client, stream, priority, dispatcher )
         return func
     return decorator
+
+
+
+class CommandStats(object):
+    """
+    Statistics about the calls of one command, kept by
+    :class:`~kaa.rpc.Metrics`.
+
+    Sizes are in bytes and times in seconds.  For calls made, the request
+    is serialized and the response deserialized; for calls handled, it is
+    the other way round.
+    """
+    def __init__(self):
+        #: Number of calls.
+        self.calls = 0
+        #: Number of calls which raised an exception, were aborted or lost
+        #: because the channel closed.
+        self.failed = 0
+        #: Number of calls waiting for their result.
+        self.in_flight = 0
+        #: :class:`~kaa.utils.Histogram` of serialized request sizes.
+        self.request_size = Histogram(base=16, nbuckets=28)
+        #: :class:`~kaa.utils.Histogram` of serialized response sizes.
+        self.response_size = Histogram(base=16, nbuckets=28)
+        #: :class:`~kaa.utils.Histogram` of the time spent serializing.
+        self.serialize_time = Histogram()
+        #: :class:`~kaa.utils.Histogram` of the time spent deserializing.
+        self.deserialize_time = Histogram()
+        #: :class:`~kaa.utils.Histogram` of the time from making (or
+        #: receiving) the call until the response is received (or sent).
+        self.latency = Histogram()
+
+
+    def __repr__(self):
+        return '<kaa.rpc.CommandStats calls=%d in_flight=%d p50=%s p99=%s>' % \
+               (self.calls, self.in_flight, self.latency.percentile(50), self.latency.percentile(99))
+
+
+    def summary(self):
+        """
+        Returns the statistics as a dict of plain values.
+        """
+        summary = dict(calls=self.calls, failed=self.failed, in_flight=self.in_flight)
+        for name in ('request_size', 'response_size', 'serialize_time', 'deserialize_time', 'latency'):
+            hist = getattr(self, name)
+            summary[name] = dict(count=hist.count, mean=hist.mean, max=hist.max,
+                                 p50=hist.percentile(50), p90=hist.percentile(90),
+                                 p99=hist.percentile(99))
+        return summary
+
+
+    def _begin(self, size):
+        self.calls += 1
+        self.in_flight += 1
+        self.request_size.add(size)
+
+
+    def _end(self, started, failed):
+        self.in_flight -= 1
+        self.failed += failed
+        self.latency.add(time.time() - started)
+
+
+
+class Metrics(object):
+    """
+    Per-command statistics about the calls made and handled by RPC channels.
+
+    Servers, clients and client pools collect metrics if created with
+    ``metrics=True``.  Peers may get the :meth:`summary` remotely::
+
+        stats = yield client.rpc('__stats__')
+        print stats['incoming']['query']['latency']['p99']
+    """
+    def __init__(self):
+        self.reset()
+
+
+    def reset(self):
+        """
+        Discards all collected statistics.
+
+        Calls in flight are still counted when they finish.
+        """
+        #: Time statistics collection started.
+        self.started = time.time()
+        #: :class:`~kaa.rpc.CommandStats` of calls made through the
+        #: channels, by command.
+        self.outgoing = collections.defaultdict(CommandStats)
+        #: :class:`~kaa.rpc.CommandStats` of calls handled, by command.
+        self.incoming = collections.defaultdict(CommandStats)
+
+
+    @expose('__stats__')
+    def summary(self):
+        """
+        Returns the statistics as nested dicts of plain values, which are
+        also returned by the ``__stats__`` command.
+        """
+        return {
+            'uptime': time.time() - self.started,
+            'outgoing': dict((cmd, stats.summary()) for cmd, stats in self.outgoing.items()),
+            'incoming': dict((cmd, stats.summary()) for cmd, stats in self.incoming.items())
+        }
+
+
+
+def _get_metrics(metrics):
+    """
+    Returns the Metrics object for the metrics argument of servers and
+    clients.
+    """
+    if isinstance(metrics, Metrics):
+        return metrics
+    return Metrics() if metrics else None
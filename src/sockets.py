@@ -24,12 +24,13 @@
 # -----------------------------------------------------------------------------
 from __future__ import absolute_import
 
-__all__ = [ 'Socket', 'SocketError' ]
+__all__ = [ 'Socket', 'SocketError', 'Resolver', 'resolve' ]
 
 import sys
 import errno
 import os
 import re
+import time
 import socket
 import logging
 import ctypes.util
@@ -37,12 +38,18 @@ import collections
 
 from .errors import SocketError
 from .utils import property, tempfile
-from .thread import threaded
-from .io import IO_READ, IO_WRITE, IOChannel
+from .thread import ThreadPool, ThreadPoolCallable, register_thread_pool, get_thread_pool
+from .async import InProgress
+from .coroutine import coroutine
+from .timer import OneShotTimer, delay
+from .io import IO_READ, IO_WRITE, IOChannel, IOMonitor
 
 # get logging object
 log = logging.getLogger('kaa.base.sockets')
 
+# Python 2 doesn't define SO_REUSEPORT.  Linux has had it since 3.9.
+SO_REUSEPORT = getattr(socket, 'SO_REUSEPORT', 15 if sys.platform.startswith('linux') else None)
+
 
 
 # Implement functions for converting between interface names and indexes.
@@ -114,6 +121,197 @@ def if_indextoname(idx):
 
 
 
+class Resolver(object):
+    """
+    Resolves hostnames without blocking the main loop.
+
+    Lookups are done with getaddrinfo() in a thread pool, and the results are
+    cached for *ttl* seconds.  (getaddrinfo() doesn't tell the TTL of the DNS
+    records, so a fixed lifetime is used.)  Concurrent lookups of the same
+    name share a single getaddrinfo() call, and numeric addresses are
+    resolved immediately.
+    """
+    # Expired entries are purged from the cache once it holds this many.
+    CACHE_PURGE_SIZE = 256
+
+    def __init__(self, ttl=60, pool='kaa::resolver'):
+        """
+        :param ttl: number of seconds for which results are cached.
+        :type ttl: float
+        :param pool: the thread pool used for lookups, or the name of a
+                     registered thread pool.  If no pool is registered with
+                     the given name, a pool of 4 threads is registered.
+        :type pool: :class:`~kaa.ThreadPool` or str
+        """
+        self.ttl = ttl
+        self._pool = pool
+        # Dict mapping (host, service, ipv6) to (expiry time, addresses)
+        self._cache = {}
+        # Dict mapping (host, service, ipv6) to InProgress of pending lookups
+        self._pending = {}
+
+
+    def _getaddrinfo(self, host, service, ipv6, flags=0):
+        addrs = socket.getaddrinfo(host, service, socket.AF_INET6 if ipv6 else socket.AF_INET,
+                                   socket.SOCK_STREAM, 0, flags | socket.AI_V4MAPPED | socket.AI_ALL)
+        return [a[4] for a in addrs]
+
+
+    def resolve(self, host, service, ipv6=True):
+        """
+        Resolves a hostname and service to a list of addresses.
+
+        :param host: hostname or IP address
+        :type host: str
+        :param service: service name or port number
+        :type service: str or int
+        :param ipv6: if True, IPv6 addresses are returned along with IPv4
+                     addresses, which are mapped to IPv6 addresses.
+        :type ipv6: bool
+        :returns: An :class:`~kaa.InProgress` finished with a list of address
+                  tuples as taken by :meth:`socket.socket.connect`, in the
+                  order preferred by the system.  If resolving fails,
+                  socket.gaierror is thrown to the InProgress.
+        """
+        key = host, service, ipv6
+        entry = self._cache.get(key)
+        if entry and entry[0] > time.time():
+            return InProgress().finish(entry[1])
+
+        try:
+            # Numeric addresses don't need a lookup.
+            return InProgress().finish(self._getaddrinfo(host, service, ipv6, socket.AI_NUMERICHOST))
+        except socket.gaierror:
+            pass
+
+        ip = self._pending.get(key)
+        if not ip:
+            if isinstance(self._pool, basestring) and not get_thread_pool(self._pool):
+                register_thread_pool(self._pool, ThreadPool(size=4))
+            ip = self._pending[key] = ThreadPoolCallable(self._pool, self._getaddrinfo, host, service, ipv6)()
+            ip.connect_both(lambda addrs: self._done(key, addrs), lambda *exc: self._pending.pop(key, None))
+        # Give each caller its own InProgress, so that one aborting doesn't
+        # affect the others.
+        return InProgress().finish(ip)
+
+
+    def _done(self, key, addrs):
+        del self._pending[key]
+        now = time.time()
+        if len(self._cache) >= self.CACHE_PURGE_SIZE:
+            for k, (expiry, _) in self._cache.items():
+                if expiry <= now:
+                    del self._cache[k]
+        self._cache[key] = now + self.ttl, addrs
+
+
+    def clear(self):
+        """
+        Empties the cache.
+        """
+        self._cache.clear()
+
+
+# Resolver used by Socket.connect()
+_resolver = Resolver()
+
+def resolve(host, service, ipv6=True):
+    """
+    Resolves a hostname with the default :class:`~kaa.sockets.Resolver` used
+    by :meth:`kaa.Socket.connect`.  See :meth:`Resolver.resolve`.
+    """
+    return _resolver.resolve(host, service, ipv6)
+
+
+
+class _ConnectRace(object):
+    """
+    Connects to the first reachable of a list of addresses, as described in
+    RFC 6555 ("Happy Eyeballs").
+
+    Connection attempts are started in turn, each either *delay* seconds after
+    the previous one or as soon as the previous one fails, and proceed in
+    parallel.  The first to succeed wins and the others are abandoned.  IPv6
+    and IPv4 addresses are tried alternately, so that a broken path for one
+    family doesn't hold up the other.
+    """
+    def __init__(self, addrs, delay):
+        self._addrs = self._interleave(addrs)
+        self._delay = delay
+        # Dict mapping sockets being connected to their IOMonitor.
+        self._attempts = {}
+        # First exception encountered, which is raised if all attempts fail.
+        self._error = None
+        self._timer = OneShotTimer(self._next)
+        self.inprogress = InProgress()
+        self.inprogress.signals['abort'].connect(lambda exc: self._cancel())
+        self._next()
+
+
+    def _interleave(self, addrs):
+        v6 = [a for a in addrs if not a[0].startswith('::ffff:')]
+        v4 = [a for a in addrs if a[0].startswith('::ffff:')]
+        if addrs and addrs[0] not in v6:
+            v6, v4 = v4, v6
+        result = []
+        while v6 or v4:
+            result.extend(l.pop(0) for l in (v6, v4) if l)
+        return result
+
+
+    def _next(self):
+        """
+        Starts the next connection attempt.
+        """
+        self._timer.stop()
+        while self._addrs:
+            addr = self._addrs.pop(0)
+            sock = Socket._make_inet_socket()
+            sock.setblocking(False)
+            err = sock.connect_ex(addr)
+            if err in (0, errno.EINPROGRESS):
+                monitor = IOMonitor(self._connected, sock)
+                monitor.register(sock.fileno(), IO_WRITE)
+                self._attempts[sock] = monitor
+                if self._addrs:
+                    self._timer.start(self._delay)
+                return
+            sock.close()
+            self._error = self._error or socket.error(err, os.strerror(err))
+
+        if not self._attempts:
+            self.inprogress.throw(socket.error, self._error, None)
+
+
+    def _connected(self, sock):
+        """
+        IOMonitor callback when a connection attempt completes.
+        """
+        self._attempts.pop(sock).unregister()
+        err = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if err:
+            sock.close()
+            self._error = self._error or socket.error(err, os.strerror(err))
+            self._next()
+        else:
+            self._cancel()
+            self.inprogress.finish(sock)
+        # The monitor is already unregistered.  Returning False would
+        # unregister the fd again, even if a socket started above or by a
+        # callback of inprogress has reused its number.
+        return True
+
+
+    def _cancel(self):
+        self._timer.stop()
+        self._addrs = []
+        for sock, monitor in self._attempts.items():
+            monitor.unregister()
+            sock.close()
+        self._attempts.clear()
+
+
+
 class Socket(IOChannel):
     """
     Communicate over TCP or Unix sockets, implementing fully asynchronous reads
@@ -135,6 +333,14 @@ class Socket(IOChannel):
             '''
     }
 
+    #: Number of seconds to wait for a connection attempt to an address before
+    #: also trying the next one (see :meth:`connect`).
+    CONNECT_DELAY = 0.25
+
+    #: Maximum number of pending connections a listening socket accepts each
+    #: time it becomes readable.
+    ACCEPT_BATCH = 64
+
     def __init__(self, buffer_size=None, chunk_size=1024*1024):
         self._connecting = False
         self._listening = False
@@ -277,7 +483,7 @@ class Socket(IOChannel):
         # Note: this property is used in superclass's _update_read_monitor()
         # Unroll these properties: alive or super(readable)
         return (self._channel != None and not self._closing) or self._connecting or \
-               self._read_queue.tell() > 0
+               len(self._read_queue) > 0
 
 
     @property
@@ -430,21 +636,31 @@ class Socket(IOChannel):
 
             sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
         else:
-            sock = socket.socket(socket.AF_INET6, socket.SOCK_STREAM)
-            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            try:
-                # If /proc/sys/net/ipv6/bindv6only is 1, then we will not be
-                # able to accept IPv4 connections with mapped addresses on the
-                # socket.  Explicitly set this option in case.
-                # 
-                # See http://bugs.debian.org/cgi-bin/bugreport.cgi?bug=560238
-                sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_V6ONLY, 0)
-            except socket.error:
-                log.error("Disabling IPV6_V6ONLY failed; the socket probably won't work right")
+            sock = self._make_inet_socket()
 
         return sock, addr
 
 
+    @staticmethod
+    def _make_inet_socket():
+        """
+        Constructs a TCP socket which can use both IPv6 and (mapped) IPv4
+        addresses.
+        """
+        sock = socket.socket(socket.AF_INET6, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            # If /proc/sys/net/ipv6/bindv6only is 1, then we will not be
+            # able to accept IPv4 connections with mapped addresses on the
+            # socket.  Explicitly set this option in case.
+            # 
+            # See http://bugs.debian.org/cgi-bin/bugreport.cgi?bug=560238
+            sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_V6ONLY, 0)
+        except socket.error:
+            log.error("Disabling IPV6_V6ONLY failed; the socket probably won't work right")
+        return sock
+
+
     def _resolve_hostname_with_action(self, addr, func, ipv6):
         """
         Resolve a host and perform some action on it (e.g. bind or connect).
@@ -472,7 +688,7 @@ class Socket(IOChannel):
             raise err[0], err[1], err[2]
 
 
-    def listen(self, addr, backlog=5, ipv6=True):
+    def listen(self, addr, backlog=None, ipv6=True, reuseport=False):
         """
         Set the socket to accept incoming connections.
 
@@ -483,12 +699,18 @@ class Socket(IOChannel):
                      See below for further details.
         :type addr: int, str, or 2- or 4-tuple
         :param backlog: the maximum length to which the queue of pending
-                        connections for the socket may grow.
+                        connections for the socket may grow; if None, the
+                        system maximum (``socket.SOMAXCONN``) is used.
         :type backlog: int
         :param ipv6: if True, will prefer binding to IPv6 addresses if addr is
                      a hostname that contains both AAAA and A records.  If addr
                      is specified as an IP address, this argument does nothing.
         :type ipv6: bool
+        :param reuseport: if True, the socket is bound with SO_REUSEPORT, which
+                          allows several sockets (usually each in its own
+                          process) to listen on the same TCP port, with the
+                          kernel distributing incoming connections among them.
+        :type reuseport: bool
         :raises: ValueError if *addr* is invalid, or socket.error if the bind fails.
 
         If *addr* is given as a 4-tuple, it is in the form ``(host, service,
@@ -522,14 +744,36 @@ class Socket(IOChannel):
         Once listening, new connections are automatically accepted, and the
         :attr:`~kaa.Socket.signals.new-client` signal is emitted for each new
         connection.  Callbacks connecting to the signal will receive a new
-        Socket object representing the client connection.
+        Socket object representing the client connection.  Up to
+        :attr:`ACCEPT_BATCH` pending connections are accepted each time the
+        socket becomes readable.
+
+        To spread connections over several worker processes, each of which
+        runs its own main loop, every worker can listen on the same port with
+        *reuseport*::
+
+            for i in range(kaa.utils.get_num_cpus() - 1):
+                if os.fork() == 0:
+                    break
+            server = kaa.Socket()
+            server.listen(8080, reuseport=True)
+            server.signals['new-client'].connect(handle_client)
+            kaa.main.run()
         """
         if isinstance(addr, int):
             # Only port number specified; translate to tuple that can be
             # used with socket.bind()
             addr = ('', addr, 0, 0)
 
+        if reuseport:
+            if SO_REUSEPORT is None:
+                raise NotImplementedError('Platform does not support SO_REUSEPORT')
+            if type(self._normalize_address(addr)) == str:
+                raise ValueError('reuseport is not supported for Unix sockets')
+
         sock, addr = self._make_socket(addr, overwrite=True)
+        if reuseport:
+            sock.setsockopt(socket.SOL_SOCKET, SO_REUSEPORT, 1)
         # If link-local address is specified, make sure the scopeid is given.
         if addr[0].lower().startswith('fe80::'):
             if not addr[3]:
@@ -540,27 +784,63 @@ class Socket(IOChannel):
             sock.bind(addr)
         else:
             self._resolve_hostname_with_action(addr, sock.bind, ipv6)
-        sock.listen(backlog)
+        sock.listen(socket.SOMAXCONN if backlog is None else backlog)
         self._listening = True
         self.wrap(sock, IO_READ | IO_WRITE)
 
 
-    @threaded()
+    @coroutine()
     def _connect(self, addr, ipv6=True):
-        sock, addr = self._make_socket(addr)
         try:
+            addr = self._normalize_address(addr)
             if type(addr) == str:
-                # Unix socket, just connect.
-                sock.connect(addr)
+                sock, addr = self._make_socket(addr)
+                try:
+                    yield self._connect_unix(sock, addr)
+                except:
+                    sock.close()
+                    raise
                 self._reqhost = addr
             else:
                 self._reqhost = addr[0]
-                self._resolve_hostname_with_action(addr, sock.connect, ipv6)
+                addrs = yield resolve(addr[0], addr[1], ipv6)
+                # Resolved addresses lack the flowinfo and scope given in addr.
+                addrs = [(self._to_ipv6(a[0]), a[1]) + tuple(addr[2:]) for a in addrs]
+                sock = yield _ConnectRace(addrs, self.CONNECT_DELAY).inprogress
             self.wrap(sock, IO_READ | IO_WRITE)
         finally:
             self._connecting = False
 
 
+    @coroutine()
+    def _connect_unix(self, sock, addr):
+        """
+        Connects sock to the unix socket at addr without blocking the main loop.
+        """
+        sock.setblocking(False)
+        retry = 0.001
+        while True:
+            err = sock.connect_ex(addr)
+            if err != errno.EAGAIN:
+                break
+            # The listening socket's backlog is full (Linux returns EAGAIN
+            # rather than EINPROGRESS); try again shortly.
+            yield delay(retry)
+            retry = min(retry * 2, self.CONNECT_DELAY)
+
+        if err == errno.EINPROGRESS:
+            writable = InProgress()
+            monitor = IOMonitor(lambda: writable.finished or writable.finish(None))
+            monitor.register(sock.fileno(), IO_WRITE)
+            try:
+                yield writable
+            finally:
+                monitor.unregister()
+            err = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if err not in (0, errno.EISCONN):
+            raise socket.error(err, os.strerror(err))
+
+
     def connect(self, addr, ipv6=True):
         """
         Connects to the host specified in address.
@@ -602,10 +882,16 @@ class Socket(IOChannel):
         specified.  Relative Unix socket names (those not prefixed with ``/``)
         are created via kaa.tempfile.
 
-        This function is executed in a thread to avoid blocking.  It therefore
-        returns an InProgress object.  If the socket is connected, the InProgress
-        is finished with no arguments.  If the connection cannot be established,
-        an exception is thrown to the InProgress.
+        The hostname is resolved by the (caching) :func:`kaa.sockets.resolve`
+        in a thread, so that the main loop is not blocked.  If it resolves to
+        several addresses, they are tried in parallel: a new attempt is
+        started every :attr:`CONNECT_DELAY` seconds, or as soon as the previous
+        one fails, alternating between IPv6 and IPv4 addresses.  The first
+        connection established is used.
+
+        If the socket is connected, the InProgress is finished with no
+        arguments.  If the connection cannot be established, an exception is
+        thrown to the InProgress.
         """
         if self._connecting:
             raise SocketError('connection already in progress')
@@ -638,19 +924,50 @@ class Socket(IOChannel):
         return self._channel.recv(size)
 
 
+    def _readinto(self, buf, offset, size):
+        return self._channel.recv_into(memoryview(buf)[offset:] if offset else buf, size)
+
+
     def _write(self, data):
         return self._channel.send(data)
 
 
-    def _accept(self):
+    def _make_client(self):
         """
-        Accept a new connection and return a new Socket object.
+        Returns a new, unconnected socket object for an accepted connection.
+        Subclasses needing constructor arguments override this.
         """
-        sock, addr = self._channel.accept()
         # create new Socket from the same class this object is
-        client_socket = self.__class__()
-        client_socket.wrap(sock, IO_READ | IO_WRITE)
-        self.signals['new-client'].emit(client_socket)
+        return self.__class__()
+
+
+    def _accept(self):
+        """
+        Accept pending connections, emitting new-client with a new socket
+        object from :meth:`_make_client` for each.
+        """
+        for i in range(self.ACCEPT_BATCH):
+            try:
+                sock, addr = self._channel.accept()
+            except socket.error, (err, msg):
+                if err in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    # No more pending connections (or another process
+                    # listening on this socket accepted the connection).
+                    return
+                elif err == errno.ECONNABORTED:
+                    # Client reset the connection before we accepted it.
+                    continue
+                elif i == 0:
+                    raise
+                # Error accepting subsequent connection; leave it to the next
+                # call.
+                return
+            client_socket = self._make_client()
+            client_socket.wrap(sock, IO_READ | IO_WRITE)
+            self.signals['new-client'].emit(client_socket)
+            if self._channel is None or self._closing:
+                # A callback closed the listening socket.
+                return
 
 
     def _handle_read(self):
@@ -27,8 +27,8 @@ from __future__ import absolute_import
 
 __all__ = [
     'MainThreadCallable', 'ThreadCallable', 'threaded', 'MAINTHREAD',
-    'synchronized', 'ThreadInProgress', 'ThreadPool', 'register_thread_pool',
-    'get_thread_pool'
+    'synchronized', 'ThreadInProgress', 'ThreadPool', 'ThreadPoolMetrics',
+    'register_thread_pool', 'get_thread_pool'
 ]
 
 # python imports
@@ -45,9 +45,10 @@ from thread import LockType
 # kaa imports
 from .callable import Callable
 from . import nf_wrapper as notifier
-from .utils import wraps, DecoratorDataStore, property
+from .utils import wraps, DecoratorDataStore, property, Histogram
 from .core import CoreThreading, Object
 from .async import InProgress, InProgressAborted, InProgressStatus
+from .errors import QueueFullError
 
 # get logging object
 log = logging.getLogger('kaa.base.core.thread')
@@ -64,7 +65,7 @@ def killall():
     loop when it shuts down.
     """
     for pool in _thread_pools.values():
-        for thread in pool._members:
+        for thread in pool._members[:]:
             thread.stop()
             thread.join()
 
@@ -492,13 +493,161 @@ class _ThreadPoolMember(threading.Thread):
 
             job = self.pool._queue.pop(0)
             self.pool._busy += 1
+            metrics = self.pool._metrics
+            if metrics:
+                metrics._job_started(job)
+            admitted = self.pool._admit()
             self.pool._condition.release()
+            self.pool._notify_admitted(admitted)
             job()
+            self.pool._condition.acquire()
             self.pool._busy -= 1
+            if metrics:
+                metrics._job_finished(job)
+            self.pool._condition.release()
 
         self._exit()
 
 
+class ThreadPoolMetrics(Object):
+    """
+    Statistics about the jobs processed by a :class:`~kaa.ThreadPool`.
+
+    Metrics are collected only when enabled via the
+    :attr:`~kaa.ThreadPool.metrics` property or the *metrics* argument of
+    the ThreadPool constructor.
+
+    The time a job spends in the queue before a pool member picks it up is
+    tracked separately from the time it takes to execute, which allows
+    telling an undersized (or starved) pool apart from slow jobs.
+    """
+    __kaasignals__ = {
+        'job':
+            '''
+            Emitted from the main thread after a job has been executed.
+
+            .. describe:: def callback(job, wait, run)
+
+               :param job: the job that was executed
+               :type job: :class:`~kaa.ThreadInProgress`
+               :param wait: seconds the job waited in the queue
+               :type wait: float
+               :param run: seconds the job took to execute
+               :type run: float
+            '''
+    }
+
+    def __init__(self, pool):
+        super(ThreadPoolMetrics, self).__init__()
+        self._pool = pool
+        self.reset()
+
+
+    def __repr__(self):
+        return '<ThreadPoolMetrics for %s: completed=%d busy=%d idle=%d utilization=%.2f>' % \
+               (self._pool, self.completed, self.busy, self.idle, self.utilization)
+
+
+    def reset(self):
+        """
+        Discards all collected statistics.
+        """
+        self._pool._condition.acquire()
+        #: :class:`~kaa.utils.Histogram` of seconds between enqueuing a job
+        #: and a pool member starting it.
+        self.queue_wait = Histogram()
+        #: :class:`~kaa.utils.Histogram` of seconds it took jobs to execute.
+        self.run_time = Histogram()
+        #: Number of jobs executed.
+        self.completed = 0
+        #: Number of jobs removed from the queue via
+        #: :meth:`~kaa.ThreadPool.dequeue`.
+        self.dequeued = 0
+        #: Number of jobs refused because the queue was full (see
+        #: :attr:`~kaa.ThreadPool.max_queue`).
+        self.rejected = 0
+        #: Largest number of busy members seen.
+        self.busy_peak = self._pool._busy
+        #: Largest number of jobs seen waiting in the queue.
+        self.queue_peak = len(self._pool._queue)
+        self._reset_time = self._busy_time = time.time()
+        # Integral of busy members over time, in member-seconds.
+        self._busy_seconds = 0.0
+        self._pool._condition.release()
+
+
+    def _job_enqueued(self, job):
+        job._enqueued_at = time.time()
+        self.queue_peak = max(self.queue_peak, len(self._pool._queue))
+
+
+    def _job_started(self, job):
+        # Called with the pool condition held, after _busy was incremented.
+        now = job._started_at = time.time()
+        self._busy_seconds += (self._pool._busy - 1) * (now - self._busy_time)
+        self._busy_time = now
+        self.busy_peak = max(self.busy_peak, self._pool._busy)
+        # Jobs enqueued before metrics were enabled have no timestamp.
+        enqueued = getattr(job, '_enqueued_at', None)
+        if enqueued is not None:
+            self.queue_wait.add(now - enqueued)
+
+
+    def _job_finished(self, job):
+        # Called with the pool condition held, after _busy was decremented.
+        now = time.time()
+        self._busy_seconds += (self._pool._busy + 1) * (now - self._busy_time)
+        self._busy_time = now
+        run = now - job._started_at
+        self.run_time.add(run)
+        self.completed += 1
+        if self.signals['job'].count():
+            wait = job._started_at - getattr(job, '_enqueued_at', job._started_at)
+            MainThreadCallable(self.signals['job'].emit)(job, wait, run)
+
+
+    @property
+    def busy(self):
+        """
+        Number of pool members currently executing a job.
+        """
+        return self._pool._busy
+
+
+    @property
+    def idle(self):
+        """
+        Number of pool members currently waiting for a job.
+        """
+        return len(self._pool._members) - self._pool._busy
+
+
+    @property
+    def queued(self):
+        """
+        Number of jobs currently waiting in the queue.
+        """
+        return len(self._pool._queue)
+
+
+    @property
+    def utilization(self):
+        """
+        Average fraction of the pool's capacity (its :attr:`~kaa.ThreadPool.size`)
+        that was busy since the metrics were enabled or last reset.
+
+        A utilization close to 1.0 combined with growing queue wait times
+        indicates the pool is too small for its workload.
+        """
+        self._pool._condition.acquire()
+        now = time.time()
+        busy_seconds = self._busy_seconds + self._pool._busy * (now - self._busy_time)
+        self._pool._condition.release()
+        capacity = (now - self._reset_time) * self._pool._size
+        return busy_seconds / capacity if capacity > 0 else 0.0
+
+
+
 class ThreadPool(object):
     """
     Manages a pool of one or more threads for use with the
@@ -508,12 +657,25 @@ class ThreadPool(object):
     ThreadPool objects may be assigned a name by calling
     :func:`kaa.register_thread_pool`.  When done, the name can be referenced
     instead of passing the ThreadPool object.
+
+    The number of queued jobs may be limited by :attr:`max_queue`.  Producers
+    generating large numbers of jobs should then use :meth:`submit`, which
+    lets them wait for space in the queue.
     """
-    def __init__(self, size=1):
+    def __init__(self, size=1, metrics=False, max_queue=None, overflow='wait'):
         """
         :param size: maximum number of threads this thread pool will grow to.
         :type size: int
+        :param metrics: if True, collect job statistics (see :attr:`metrics`)
+        :type metrics: bool
+        :param max_queue: maximum number of jobs waiting in the queue, or None
+                          for no limit (see :attr:`max_queue`)
+        :type max_queue: int
+        :param overflow: what :meth:`enqueue` does when the queue is full
+                         (see :attr:`overflow`)
+        :type overflow: str
         """
+        self._check_max_queue(max_queue)
         self._size = size
         # List of ThreadPoolMember objects for this thread pool.
         self._members = []
@@ -527,6 +689,17 @@ class ThreadPool(object):
         self._name = None
         # Number of pool members that are busy.
         self._busy = 0
+        # ThreadPoolMetrics object if metrics are enabled.
+        self._metrics = None
+        # Queue limit and what to do when it's reached.
+        self._max_queue = max_queue
+        self.overflow = overflow
+        # Jobs waiting for space in the queue, as 2-tuples (job, InProgress),
+        # where InProgress is None for jobs from enqueue() and otherwise the
+        # InProgress returned by submit().
+        self._backlog = []
+        if metrics:
+            self.metrics = True
 
 
     def __repr__(self):
@@ -553,6 +726,50 @@ class ThreadPool(object):
             self._members.pop().stop()
 
 
+    def _is_full(self):
+        return self._max_queue is not None and len(self._queue) >= self._max_queue
+
+
+    def _add_job(self, job):
+        # Must be called with the condition held.
+        self._queue.append(job)
+        self._queue.sort(key=lambda job: job.priority, reverse=True)
+        if self._metrics:
+            self._metrics._job_enqueued(job)
+
+
+    def _admit(self):
+        """
+        Moves jobs from the backlog into the queue while there is space.  Must
+        be called with the condition held.
+
+        Returns a list of (job, InProgress) for the jobs admitted via submit(),
+        which must be passed to _notify_admitted() once the condition is
+        released.
+        """
+        admitted = []
+        while self._backlog and not self._is_full():
+            job, inprogress = self._backlog.pop(0)
+            if job.finished:
+                # Aborted while waiting in the backlog.
+                continue
+            self._add_job(job)
+            if inprogress:
+                admitted.append((job, inprogress))
+        if admitted or not self._backlog:
+            self._resize()
+            self._condition.notify()
+        return admitted
+
+
+    def _notify_admitted(self, admitted):
+        for job, inprogress in admitted:
+            if CoreThreading.is_mainthread():
+                inprogress.finish(None)
+            else:
+                MainThreadCallable(inprogress.finish)(None)
+
+
     def enqueue(self, callback, priority=0):
         """
         Creates a job from the given callback and adds it to the thread pool
@@ -566,6 +783,9 @@ class ThreadPool(object):
         :type priority: int
         :returns: a :class:`~kaa.ThreadInProgress` object for this job.
 
+        If the queue is full (see :attr:`max_queue`), the job is handled
+        according to the :attr:`overflow` policy.
+
         It should generally not be necessary to call this method directly.
         It is called implicitly when using the :func:`@kaa.threaded() <kaa.threaded>`
         decorator, or :class:`~kaa.ThreadPoolCallable` objects.
@@ -576,14 +796,79 @@ class ThreadPool(object):
         callback.priority = priority
 
         self._condition.acquire()
-        self._queue.append(callback)
-        self._queue.sort(key=lambda job: job.priority, reverse=True)
-        self._resize()
-        self._condition.notify()
+        if not self._is_full() and not self._backlog:
+            self._add_job(callback)
+            self._resize()
+            self._condition.notify()
+        elif self._overflow == 'wait':
+            self._backlog.append((callback, None))
+            self._backlog.sort(key=lambda item: item[0].priority, reverse=True)
+        else:
+            if self._metrics:
+                self._metrics.rejected += 1
+            self._condition.release()
+            exc = QueueFullError('Thread pool queue is full (%d jobs)' % self._max_queue)
+            if self._overflow == 'raise':
+                raise exc
+            callback.throw(QueueFullError, exc, None)
+            return callback
         self._condition.release()
         return callback
 
 
+    def submit(self, callback, priority=0):
+        """
+        Adds a job to the thread pool work queue once there is space for it.
+
+        :param callback: a callable which will be invoked inside one of the
+                         pool threads.
+        :type callback: callable
+        :param priority: determines the relative priority of the job; higher
+                         values are higher priority.
+        :type priority: int
+        :returns: an :class:`~kaa.InProgress` object which is finished once
+                  the job has been accepted into the queue.  Its ``job``
+                  attribute is the :class:`~kaa.ThreadInProgress` for the job.
+
+        Unlike :meth:`enqueue`, this method ignores the :attr:`overflow`
+        policy and always waits for the queue to have space.  Coroutines can
+        yield the returned InProgress to get flow control, so that producers
+        generating many jobs do not outpace the pool::
+
+            @kaa.coroutine()
+            def crawl(pool, paths):
+                jobs = []
+                for path in paths:
+                    submitted = pool.submit(kaa.Callable(os.stat, path))
+                    yield submitted
+                    jobs.append(submitted.job)
+                yield kaa.InProgressAll(*jobs)
+
+        Aborting the returned InProgress before the job was accepted removes
+        the job from the backlog.
+        """
+        if not isinstance(callback, ThreadInProgress):
+            callback = ThreadInProgress(callback)
+
+        callback.priority = priority
+        inprogress = InProgress()
+        inprogress.job = callback
+
+        self._condition.acquire()
+        if not self._is_full() and not self._backlog:
+            self._add_job(callback)
+            self._resize()
+            self._condition.notify()
+            self._condition.release()
+            return inprogress.finish(None)
+
+        self._backlog.append((callback, inprogress))
+        self._backlog.sort(key=lambda item: item[0].priority, reverse=True)
+        self._condition.release()
+        inprogress.signals['abort'].connect(lambda exc: self.dequeue(callback))
+        return inprogress
+
+
     def dequeue(self, job):
         """
         Removes the given job from the thread queue.
@@ -597,10 +882,16 @@ class ThreadPool(object):
         try:
             self._queue.remove(job)
         except ValueError:
-            found = False
+            backlog = [item for item in self._backlog if item[0] is not job]
+            found = len(backlog) != len(self._backlog)
+            self._backlog = backlog
         else:
             found = True
+        if found and self._metrics:
+            self._metrics.dequeued += 1
+        admitted = self._admit()
         self._condition.release()
+        self._notify_admitted(admitted)
         return found
 
 
@@ -625,6 +916,75 @@ class ThreadPool(object):
         self._resize()
 
 
+    @property
+    def max_queue(self):
+        """
+        Maximum number of jobs waiting in the queue, at least 1, or None
+        (default) for no limit.
+
+        Jobs currently being executed by pool members do not count toward the
+        limit.  Enqueuing jobs beyond the limit is handled according to the
+        :attr:`overflow` policy, while :meth:`submit` waits until there is
+        space.
+        """
+        return self._max_queue
+
+    @max_queue.setter
+    def max_queue(self, value):
+        self._check_max_queue(value)
+        self._condition.acquire()
+        self._max_queue = value
+        admitted = self._admit()
+        self._condition.release()
+        self._notify_admitted(admitted)
+
+
+    @staticmethod
+    def _check_max_queue(value):
+        # With a limit of 0 the queue would always be full, and jobs would
+        # wait in the backlog forever.
+        if value is not None and value < 1:
+            raise ValueError('max_queue must be None or at least 1')
+
+
+    @property
+    def overflow(self):
+        """
+        Determines what :meth:`enqueue` does with jobs when the queue is full.
+
+        ``'wait'`` (default) holds the job until the queue has space; the
+        ``'raise'`` policy raises :class:`~kaa.QueueFullError`, and ``'drop'``
+        immediately throws :class:`~kaa.QueueFullError` into the returned
+        :class:`~kaa.ThreadInProgress`.
+        """
+        return self._overflow
+
+    @overflow.setter
+    def overflow(self, value):
+        if value not in ('wait', 'raise', 'drop'):
+            raise ValueError("overflow must be one of 'wait', 'raise' or 'drop'")
+        self._overflow = value
+
+
+    @property
+    def metrics(self):
+        """
+        :class:`~kaa.ThreadPoolMetrics` object holding statistics about the
+        jobs processed by this pool, or None if metrics are disabled (default).
+
+        Assigning True enables metrics collection, and False disables it.
+        Collecting metrics adds a small amount of overhead for each job.
+        """
+        return self._metrics
+
+    @metrics.setter
+    def metrics(self, enabled):
+        if enabled and not self._metrics:
+            self._metrics = ThreadPoolMetrics(self)
+        elif not enabled:
+            self._metrics = None
+
+
     @property
     def timeout(self):
         """
@@ -26,7 +26,7 @@ from __future__ import absolute_import
 __all__ = [
     'tempfile', 'which', 'Lock', 'daemonize', 'is_running', 'set_running',
     'set_process_name', 'get_num_cpus', 'get_machine_uuid', 'get_plugins',
-    'Singleton', 'property', 'wraps', 'DecoratorDataStore', ]
+    'Singleton', 'property', 'wraps', 'DecoratorDataStore', 'Histogram' ]
 
 import sys
 import os
@@ -37,6 +37,7 @@ import zipimport
 import logging
 import inspect
 import re
+import bisect
 import functools
 import ctypes, ctypes.util
 import socket
@@ -724,3 +725,96 @@ class DecoratorDataStore(object):
 
     def __delattr__(self, key):
         return delattr(self.__target, self.__hash(key))
+
+
+
+class Histogram(object):
+    """
+    Accumulates samples (e.g. latencies in seconds) into buckets with
+    exponentially growing upper bounds.
+
+    Only the bucket counts and a few aggregates are stored, so adding samples
+    is cheap and memory use is constant no matter how many samples are added.
+    Percentiles are therefore approximate: they are reported as the upper
+    bound of the bucket the percentile falls into.
+    """
+    def __init__(self, base=0.000001, factor=2, nbuckets=32):
+        """
+        :param base: upper bound of the first bucket
+        :type base: float
+        :param factor: each bucket's upper bound is this many times the
+                       previous one
+        :type factor: float
+        :param nbuckets: number of buckets; values above the last bound are
+                         counted in an additional overflow bucket.
+        :type nbuckets: int
+
+        With the defaults, buckets range from 1us to about 36 minutes.
+        """
+        self._bounds = [base * factor ** n for n in range(nbuckets)]
+        self.reset()
+
+
+    def __repr__(self):
+        return '<Histogram count=%d mean=%s max=%s>' % (self.count, self.mean, self.max)
+
+
+    def reset(self):
+        """
+        Discards all samples.
+        """
+        self._counts = [0] * (len(self._bounds) + 1)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+
+    def add(self, value):
+        """
+        Adds a sample to the histogram.
+        """
+        self._counts[bisect.bisect_left(self._bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+
+    @property
+    def mean(self):
+        """
+        The mean of all samples, or None if there are no samples.
+        """
+        return self.total / float(self.count) if self.count else None
+
+
+    def percentile(self, pct):
+        """
+        Returns the approximate value below which the given percentage of
+        samples fall, or None if there are no samples.
+
+        :param pct: percentage between 0 and 100
+        :type pct: float
+        """
+        if not self.count:
+            return None
+        needed = self.count * pct / 100.0
+        seen = 0
+        for bound, count in zip(self._bounds, self._counts):
+            seen += count
+            if seen >= needed:
+                # Don't report more than the actual maximum.
+                return min(bound, self.max)
+        return self.max
+
+
+    @property
+    def buckets(self):
+        """
+        List of (upper bound, count) tuples for all non-empty buckets.  The
+        upper bound of the overflow bucket is None.
+        """
+        return [(bound, count) for bound, count in zip(self._bounds + [None], self._counts) if count]
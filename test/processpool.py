@@ -0,0 +1,26 @@
+import os
+import kaa
+
+@kaa.processed()
+def fib(n):
+    if n < 2:
+        return n
+    return fib.origfunc(n - 1) + fib.origfunc(n - 2)
+
+@kaa.processed()
+def fail():
+    raise ValueError('raised in pid %d' % os.getpid())
+
+@kaa.coroutine()
+def main():
+    results = yield kaa.InProgressAll(*[fib(n) for n in range(20, 26)])
+    print 'fib:', [ip.result for ip in results]
+    try:
+        yield fail()
+    except ValueError, e:
+        print 'caught remote exception:'
+        print e
+    kaa.main.stop()
+
+main()
+kaa.main.run()
@@ -0,0 +1,206 @@
+# Exercises kaa.rpc against servers in child processes, listening on unix
+# sockets.  One server is configured with shared memory and compression, the
+# other behaves like a peer from before serializer negotiation.  Each check
+# prints its name and whether it passed.
+import os
+import sys
+import time
+import logging
+import kaa
+import kaa.rpc
+
+logging.basicConfig()
+
+SECRET = 'test'
+NEW = '/tmp/kaa-rpc-test-new-%d.sock' % os.getpid()
+OLD = '/tmp/kaa-rpc-test-old-%d.sock' % os.getpid()
+# Shared memory ring too small for several large payloads at once.
+SHM_SIZE = 2 * 1024 * 1024
+COMPRESS_THRESHOLD = 1024
+
+class Service(object):
+    sleeping = 0
+    stored = 0
+
+    @kaa.rpc.expose()
+    def echo(self, data):
+        return data
+
+    @kaa.rpc.expose()
+    def count(self, n):
+        for i in range(n):
+            yield i
+
+    @kaa.rpc.expose()
+    def items(self, sizes):
+        for i, size in enumerate(sizes):
+            yield str(i) * size
+
+    @kaa.rpc.expose()
+    @kaa.coroutine()
+    def sleep(self, seconds):
+        Service.sleeping += 1
+        try:
+            yield kaa.delay(seconds)
+        finally:
+            Service.sleeping -= 1
+
+    @kaa.rpc.expose()
+    def get_sleeping(self):
+        return Service.sleeping
+
+    @kaa.rpc.expose()
+    def store(self, data):
+        Service.stored += 1
+
+    @kaa.rpc.expose()
+    def get_stored(self):
+        return Service.stored
+
+
+def serve(address, old=False):
+    """
+    Runs a server in a child process and returns its pid.
+    """
+    pid = os.fork()
+    if pid:
+        return pid
+    if old:
+        # Never announce serializers, and ignore the peer's announcement.
+        kaa.rpc.Channel._send_serializers = lambda self: None
+        kaa.rpc.Channel._handle_serializers = lambda self, payload: None
+        server = kaa.rpc.Server(address, SECRET)
+    else:
+        server = kaa.rpc.Server(address, SECRET, shm_size=SHM_SIZE, compress_threshold=COMPRESS_THRESHOLD)
+    server.register(Service())
+    kaa.main.run()
+    os._exit(0)
+
+
+def check(name, ok):
+    print '%-40s %s' % (name, ok)
+
+
+@kaa.coroutine()
+def connect(address):
+    client = kaa.rpc.Client(address, SECRET, shm_size=SHM_SIZE, compress_threshold=COMPRESS_THRESHOLD)
+    yield kaa.inprogress(client)
+    yield client
+
+
+@kaa.coroutine()
+def test_old_peer():
+    client = yield connect(OLD)
+    data = os.urandom(512 * 1024)
+    result = yield client.rpc('echo', data)
+    check('old peer: serializer', client.serializer == 'pickle2')
+    check('old peer: large payload', result == data)
+    stream = yield client.rpc('count', 3)
+    check('old peer: generator result', stream == [0, 1, 2])
+    client.close()
+
+
+@kaa.coroutine()
+def test_priority_at_connect():
+    # The serializer is switched as the channel opens.  Calls of any
+    # priority made right away must be sent after the switch is announced.
+    client = yield connect(NEW)
+    ips = [client.rpc('echo', 'low', _priority=-1), client.rpc('echo', 'high', _priority=1),
+           client.rpc('echo', 'normal')]
+    yield kaa.delay(1)
+    check('priority at connect', [ip.result if ip.finished else None for ip in ips] == ['low', 'high', 'normal'])
+    client.close()
+
+
+@kaa.coroutine()
+def test_fragments(client):
+    big = os.urandom(3 * 1024 * 1024 + 1)
+    ip = client.rpc('echo', big)
+    # The small call is sent between the fragments of the big one.
+    small = yield client.rpc('echo', 'small', _priority=1)
+    check('fragments: small call overtakes', not ip.finished and small == 'small')
+    check('fragments: reassembled', (yield ip) == big)
+
+
+@kaa.coroutine()
+def test_stream_cancel(client):
+    stream = yield client.rpc('count', 1000)
+    items = iter(stream)
+    for i in range(5):
+        yield items.next()
+    items.close()
+    yield kaa.delay(0.2)
+    check('stream cancel: no streams left', not client._streams_in)
+    check('stream cancel: channel usable', (yield client.rpc('echo', 1)) == 1)
+
+
+@kaa.coroutine()
+def test_timeout(client):
+    t0 = time.time()
+    try:
+        yield client.rpc('sleep', 10, _timeout=0.5)
+    except kaa.TimeoutException:
+        check('timeout: call aborted', time.time() - t0 < 2)
+    else:
+        check('timeout: call aborted', False)
+    yield kaa.delay(0.2)
+    check('timeout: remote side stopped', (yield client.rpc('get_sleeping')) == 0)
+
+
+@kaa.coroutine()
+def test_abort_queued(client):
+    # Calls aborted before they are sent are never sent, whether they are
+    # being compressed in a thread, are queued in fragments or are small.
+    with client.batch():
+        for size in (3 * 1024 * 1024, 200 * 1024, 1):
+            client.rpc('store', os.urandom(size)).abort()
+    check('abort queued: send queues empty', not client._send_queues)
+    yield kaa.delay(0.2)
+    check('abort queued: call not made', (yield client.rpc('get_stored')) == 0)
+
+
+@kaa.coroutine()
+def test_shm_ring_full(client):
+    check('shm: ring set up', bool(client._shm_out and client._shm_in))
+    payloads = [os.urandom(1024 * 1024 + i) for i in range(8)]
+    results = yield kaa.InProgressAll(*[client.rpc('echo', data) for data in payloads])
+    check('shm: fallback when ring is full', [ip.result for ip in results] == payloads)
+
+
+@kaa.coroutine()
+def test_compressed_stream(client):
+    check('compression: negotiated', client._peer_decompresses)
+    # Items of 2MB are compressed in a thread, the small ones in the main
+    # loop; they must still arrive in order.
+    sizes = [2 * 1024 * 1024, 10, 4096, 2 * 1024 * 1024, 10]
+    items = []
+    for ip in (yield client.rpc('items', sizes)):
+        items.append((yield ip))
+    check('compression: stream items', items == [str(i) * size for i, size in enumerate(sizes)])
+
+
+@kaa.coroutine()
+def main():
+    pids = [serve(NEW), serve(OLD, old=True)]
+    try:
+        while not (os.path.exists(NEW) and os.path.exists(OLD)):
+            yield kaa.delay(0.05)
+        yield test_old_peer()
+        yield test_priority_at_connect()
+        client = yield connect(NEW)
+        yield kaa.delay(0.2)
+        for test in (test_fragments, test_stream_cancel, test_timeout, test_abort_queued, test_shm_ring_full,
+                     test_compressed_stream):
+            yield test(client)
+        client.close()
+    finally:
+        for pid in pids:
+            os.kill(pid, 15)
+            os.waitpid(pid, 0)
+        for path in (NEW, OLD):
+            if os.path.exists(path):
+                os.unlink(path)
+        kaa.main.stop()
+
+main()
+kaa.main.run()
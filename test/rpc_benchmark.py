@@ -0,0 +1,166 @@
+# Benchmarks for kaa.rpc.
+#
+# The first part measures how many packets per second the receive path
+# decodes and dispatches, for small and large payloads.  The packets are RPC
+# results (RETN), fed to the channel in chunks of 1MB as they would be read
+# from the socket.
+#
+# The second part starts a kaa.rpc.Server in a child process, listening on a
+# unix socket and on TCP loopback, and measures the cost of connecting and
+# authenticating, and calls/sec and latency for tiny, 64KB and 10MB payloads
+# with 1, 10 and 100 concurrent clients.  Each client makes one call at a
+# time, sending the payload and receiving its length.
+#
+# Usage: rpc_benchmark.py [seconds per case]
+import os
+import sys
+import socket
+import struct
+import time
+import kaa
+import kaa.rpc
+
+SECRET = 'benchmark'
+# Cases sending more than this many bytes at once are skipped.
+MAX_IN_FLIGHT = 256 * 1024 * 1024
+
+class Result(object):
+    # Stands in for the InProgress of a pending call.
+    def finish(self, result):
+        pass
+
+def bench_decode(npackets, size, chunk_size=1024 * 1024):
+    channel = kaa.rpc.Channel(kaa.Socket(), '')
+    channel._authenticated = True
+    payload = channel._serializer_out[1]('x' * size)
+    data = ''.join(struct.pack('I4sI', seq, 'RETN', len(payload)) + payload for seq in xrange(npackets))
+    chunks = [data[pos:pos + chunk_size] for pos in xrange(0, len(data), chunk_size)]
+    for seq in xrange(npackets):
+        channel._rpc_in_progress[seq] = (Result(), 'bench')
+
+    t0 = time.time()
+    for chunk in chunks:
+        channel._handle_read(chunk)
+    return npackets / (time.time() - t0)
+
+
+class Service(object):
+    @kaa.rpc.expose()
+    def size(self, data):
+        return len(data)
+
+
+def serve(addresses):
+    """
+    Runs the server in a child process and returns its pid.
+    """
+    pid = os.fork()
+    if pid:
+        return pid
+    servers = []
+    for address in addresses:
+        server = kaa.rpc.Server(address, SECRET, backlog=512)
+        server.register(Service())
+        servers.append(server)
+    kaa.main.run()
+    os._exit(0)
+
+
+def percentile(values, pct):
+    return values[min(len(values) - 1, int(len(values) * pct / 100.0))]
+
+
+@kaa.coroutine()
+def connect(address, nclients):
+    clients = [kaa.rpc.Client(address, SECRET) for i in range(nclients)]
+    yield kaa.InProgressAll(*[kaa.inprogress(client) for client in clients])
+    yield clients
+
+
+@kaa.coroutine()
+def bench_connect(address, count):
+    """
+    Returns the latencies of connecting and authenticating clients one
+    after another.
+    """
+    latencies = []
+    for i in range(count):
+        t0 = time.time()
+        client = kaa.rpc.Client(address, SECRET)
+        yield kaa.inprogress(client)
+        latencies.append(time.time() - t0)
+        client.close()
+    yield sorted(latencies)
+
+
+@kaa.coroutine()
+def run_client(client, data, until, latencies):
+    while time.time() < until:
+        t0 = time.time()
+        yield client.rpc('size', data)
+        latencies.append(time.time() - t0)
+
+
+@kaa.coroutine()
+def bench_calls(address, size, nclients, duration):
+    """
+    Returns calls/sec and sorted latencies for nclients making calls with
+    the given payload size.
+    """
+    clients = yield connect(address, nclients)
+    data = 'x' * size
+    latencies = []
+    t0 = time.time()
+    yield kaa.InProgressAll(*[run_client(client, data, t0 + duration, latencies) for client in clients])
+    elapsed = time.time() - t0
+    for client in clients:
+        client.close()
+    yield len(latencies) / elapsed, sorted(latencies)
+
+
+@kaa.coroutine()
+def main(duration):
+    path = '/tmp/kaa-rpc-benchmark-%d.sock' % os.getpid()
+    # Find a free port for the TCP server.
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    transports = (('unix', path), ('tcp', ('127.0.0.1', port)))
+    pid = serve([address for name, address in transports])
+    try:
+        # Wait for the server to listen.
+        while not os.path.exists(path):
+            yield kaa.delay(0.05)
+        yield kaa.delay(0.2)
+
+        for name, address in transports:
+            latencies = yield bench_connect(address, 200)
+            print '%-4s connect+auth: mean %6.2fms p50 %6.2fms p99 %6.2fms' % \
+                  (name, sum(latencies) / len(latencies) * 1000, percentile(latencies, 50) * 1000,
+                   percentile(latencies, 99) * 1000)
+
+        for name, address in transports:
+            for size, label in ((10, 'tiny'), (64 * 1024, '64KB'), (10 * 1024 * 1024, '10MB')):
+                for nclients in (1, 10, 100):
+                    if size * nclients > MAX_IN_FLIGHT:
+                        print '%-4s %4s %3d clients: skipped' % (name, label, nclients)
+                        continue
+                    rate, latencies = yield bench_calls(address, size, nclients, duration)
+                    print '%-4s %4s %3d clients: %8d calls/sec %8.1f MB/sec  p50 %8.2fms p99 %8.2fms' % \
+                          (name, label, nclients, rate, rate * size / 1024.0 / 1024,
+                           percentile(latencies, 50) * 1000, percentile(latencies, 99) * 1000)
+    finally:
+        os.kill(pid, 15)
+        os.waitpid(pid, 0)
+        if os.path.exists(path):
+            os.unlink(path)
+        kaa.main.stop()
+
+
+for npackets, size in ((100000, 10), (20000, 1024), (1000, 64 * 1024), (50, 1024 * 1024)):
+    rate = bench_decode(npackets, size)
+    print 'decode %8d byte payloads: %10d packets/sec %10.1f MB/sec' % (size, rate, rate * size / 1024.0 / 1024)
+
+main(float(sys.argv[1]) if len(sys.argv) > 1 else 2.0)
+kaa.main.run()
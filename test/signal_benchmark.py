@@ -0,0 +1,28 @@
+# Measures Signal.emit() throughput with 0, 1 and 10 connected callbacks,
+# both for plain callbacks and for callbacks with bound arguments.
+import time
+import kaa
+
+def cb(*args):
+    pass
+
+def bench(ncallbacks, bound=False, duration=1.0):
+    signal = kaa.Signal()
+    for i in range(ncallbacks):
+        if bound:
+            signal.connect(cb, i)
+        else:
+            signal.connect(cb)
+
+    emit = signal.emit
+    count = 0
+    t0 = time.time()
+    while time.time() - t0 < duration:
+        for i in xrange(1000):
+            emit('data')
+        count += 1000
+    return count / (time.time() - t0)
+
+for bound in (False, True):
+    for n in (0, 1, 10):
+        print '%2d callbacks%s: %10d emits/sec' % (n, ' (bound args)' if bound else '', bench(n, bound))
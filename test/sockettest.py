@@ -21,8 +21,24 @@ def new_client(client):
     client.write('\n\nBye!\n')
     client.close()
 
+@kaa.coroutine()
+def reconnect():
+    # Closing a socket and connecting again may reuse the same fd for the
+    # second connection attempt, which must still complete.
+    listener = kaa.Socket()
+    listener.listen(8081)
+    sock = kaa.Socket()
+    yield sock.connect('localhost:8081')
+    sock.close()
+    sock = kaa.Socket()
+    yield kaa.inprogress(sock.connect('127.0.0.1:8081')).timeout(5)
+    print 'Reconnected to 127.0.0.1:8081'
+    sock.close()
+    listener.close()
+
 server = kaa.Socket()
 server.signals['new-client'].connect(new_client)
 server.listen(8080)
+reconnect()
 print "Connect to localhost:8080"
 kaa.main.run()